@@ -29,6 +29,13 @@ def create_app(config_name=None):
     def setup_tenant_context():
         set_tenant_context()
     
+    # Per-worker listener for corpus changes made by other workers
+    from app.rag.generations import start_listener
+    
+    @app.before_request
+    def start_generation_listener():
+        start_listener(app)
+    
     # Register blueprints
     from app.routes.health import bp as health_bp
     from app.routes.auth import bp as auth_bp
@@ -54,4 +61,9 @@ def create_app(config_name=None):
     app.register_blueprint(activation_bp)
     app.register_blueprint(images_bp)
     
+    # Under gunicorn --preload this runs once in the master, before workers fork
+    if app.config.get('INDEX_PRELOAD_ENABLED'):
+        from app.rag.preload import preload_hot_tenants
+        preload_hot_tenants(app)
+    
     return app
\ No newline at end of file
@@ -1,6 +1,7 @@
 """Application Configuration"""
 import os
 from datetime import timedelta
+from app.rag.quantization import parse_tenant_modes
 
 class Config:
     # Flask
@@ -30,5 +31,92 @@ class Config:
     PINECONE_INDEX_NAME = os.environ.get('PINECONE_INDEX_NAME', 'machinegpt')
     PINECONE_ENVIRONMENT = os.environ.get('PINECONE_ENVIRONMENT', 'us-east-1')
     
+    # Vector search backend: postgres | pgvector | pinecone | local
+    VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'postgres')
+    # pgvector backend: HNSW candidates per query (hnsw.ef_search)
+    PGVECTOR_EF_SEARCH = int(os.environ.get('PGVECTOR_EF_SEARCH', 100))
+    
+    # Vector search
+    VECTOR_CACHE_ENABLED = os.environ.get('VECTOR_CACHE_ENABLED', 'true').lower() == 'true'
+    VECTOR_INDEX_DIR = os.environ.get('VECTOR_INDEX_DIR', 'data/processed/indexes')
+    # Cached indexes are re-checked against the DB when a corpus change is seen, else at most this often
+    VECTOR_CACHE_REVALIDATE_SECONDS = float(os.environ.get('VECTOR_CACHE_REVALIDATE_SECONDS', 60))
+    
+    # HNSW approximate search (tenants below HNSW_MIN_VECTORS use exact search).
+    # Off by default: graphs are built by a pure Python builder in a separate
+    # process (or offline with scripts/build_hnsw_index.py), which takes minutes
+    # per large tenant, and exact NumPy search is competitive at tens of thousands of rows
+    HNSW_ENABLED = os.environ.get('HNSW_ENABLED', 'false').lower() == 'true'
+    HNSW_MIN_VECTORS = int(os.environ.get('HNSW_MIN_VECTORS', 20000))
+    HNSW_M = int(os.environ.get('HNSW_M', 16))
+    HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION', 100))
+    HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', 64))
+    
+    # Quantized in-memory codes: float32 | float16 | int8 | binary
+    # Per-tenant overrides as 'producer_id:mode,...', e.g. '12:int8,15:binary'
+    VECTOR_QUANTIZATION = os.environ.get('VECTOR_QUANTIZATION', 'float32')
+    VECTOR_QUANTIZATION_TENANTS = parse_tenant_modes(os.environ.get('VECTOR_QUANTIZATION_TENANTS'))
+    QUANTIZATION_RESCORE_FACTOR = int(os.environ.get('QUANTIZATION_RESCORE_FACTOR', 10))
+    
+    # Memory-mapped embedding segments (shared through the OS page cache)
+    SEGMENT_STORE_ENABLED = os.environ.get('SEGMENT_STORE_ENABLED', 'false').lower() == 'true'
+    SEGMENT_STORE_DIR = os.environ.get('SEGMENT_STORE_DIR', 'data/processed/segments')
+    SEGMENT_STORE_MAX_SEGMENTS = int(os.environ.get('SEGMENT_STORE_MAX_SEGMENTS', 8))
+    SEGMENT_STORE_MAX_TOMBSTONE_RATIO = float(os.environ.get('SEGMENT_STORE_MAX_TOMBSTONE_RATIO', 0.2))
+    
+    # Exact scoring split across worker processes for very large tenants (0 workers = CPU count)
+    SHARDED_SEARCH_ENABLED = os.environ.get('SHARDED_SEARCH_ENABLED', 'false').lower() == 'true'
+    SHARDED_SEARCH_MIN_VECTORS = int(os.environ.get('SHARDED_SEARCH_MIN_VECTORS', 200000))
+    SHARDED_SEARCH_WORKERS = int(os.environ.get('SHARDED_SEARCH_WORKERS', 0))
+    
+    # Per-worker ceiling for tenant index memory, LRU tenants are evicted above it (0 = no limit)
+    INDEX_MEMORY_BUDGET_MB = float(os.environ.get('INDEX_MEMORY_BUDGET_MB', 0))
+    
+    # Bounded-memory DB scan when the index cache is disabled (or cold, if enabled)
+    STREAMING_SCAN_BLOCK = int(os.environ.get('STREAMING_SCAN_BLOCK', 2000))
+    STREAMING_SCAN_WHEN_COLD = os.environ.get('STREAMING_SCAN_WHEN_COLD', 'false').lower() == 'true'
+    
+    # Preload the hottest tenants into fork-shared memory (requires gunicorn --preload)
+    INDEX_PRELOAD_ENABLED = os.environ.get('INDEX_PRELOAD_ENABLED', 'false').lower() == 'true'
+    INDEX_PRELOAD_TENANTS = int(os.environ.get('INDEX_PRELOAD_TENANTS', 10))
+    INDEX_PRELOAD_DAYS = int(os.environ.get('INDEX_PRELOAD_DAYS', 7))
+    INDEX_PRELOAD_DIR = os.environ.get('INDEX_PRELOAD_DIR', '/dev/shm')
+    
+    # Cross-worker cache invalidation (LISTEN/NOTIFY on PostgreSQL, polling otherwise)
+    GENERATION_LISTENER_ENABLED = os.environ.get('GENERATION_LISTENER_ENABLED', 'true').lower() == 'true'
+    GENERATION_POLL_INTERVAL = float(os.environ.get('GENERATION_POLL_INTERVAL', 2.0))
+    
+    # Retrieval result cache (top-k ids/scores per query vector and index generation)
+    RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 1024))
+    RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 300))
+    
+    # Coarse-to-fine search: best documents -> best sections -> their chunks
+    HIERARCHICAL_SEARCH_ENABLED = os.environ.get('HIERARCHICAL_SEARCH_ENABLED', 'false').lower() == 'true'
+    HIERARCHICAL_MIN_DOCUMENTS = int(os.environ.get('HIERARCHICAL_MIN_DOCUMENTS', 100))
+    HIERARCHICAL_DOC_FANOUT = int(os.environ.get('HIERARCHICAL_DOC_FANOUT', 20))
+    HIERARCHICAL_SECTION_FANOUT = int(os.environ.get('HIERARCHICAL_SECTION_FANOUT', 40))
+    HIERARCHICAL_SECTION_CHUNKS = int(os.environ.get('HIERARCHICAL_SECTION_CHUNKS', 16))
+    
+    # Hybrid retrieval: BM25 over chunk text fused with vector results (reciprocal rank fusion)
+    HYBRID_SEARCH_ENABLED = os.environ.get('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
+    # Candidate pool for fusion and MMR, before cutting to the top 5
+    HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', 20))
+    RRF_K = int(os.environ.get('RRF_K', 60))
+    BM25_K1 = float(os.environ.get('BM25_K1', 1.2))
+    BM25_B = float(os.environ.get('BM25_B', 0.75))
+    # Questions made only of codes/part numbers ("E42?") are answered from BM25 alone
+    LEXICAL_SHORTCUT_ENABLED = os.environ.get('LEXICAL_SHORTCUT_ENABLED', 'true').lower() == 'true'
+    
+    # Near-duplicate chunks at ingest: SimHash bits two chunks may differ in
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'true').lower() == 'true'
+    DEDUP_MAX_DISTANCE = int(os.environ.get('DEDUP_MAX_DISTANCE', 4))
+    
+    # Exact error code / part number answers without embedding or LLM calls
+    CODE_LOOKUP_ENABLED = os.environ.get('CODE_LOOKUP_ENABLED', 'true').lower() == 'true'
+    
+    # MMR diversification of the final chunks: 1.0 = pure relevance, lower = more diverse
+    MMR_LAMBDA = float(os.environ.get('MMR_LAMBDA', 0.5))
+    
     # Server
     PORT = int(os.environ.get('PORT', 5001))
@@ -4,11 +4,14 @@ from app.models.customer import EndCustomer, User, UserMachineAccess
 from app.models.machine import MachineModel, MachineInstance
 from app.models.document import Document, DocumentChunk, DocumentVersion
 from app.models.query import Query, RefreshToken, Invitation, AuditLog
+from app.models.code import CodeReference
+from app.models.generation import IndexGeneration
 
 __all__ = [
     'Producer', 'ProducerAdmin',
     'EndCustomer', 'User', 'UserMachineAccess',
     'MachineModel', 'MachineInstance',
     'Document', 'DocumentChunk', 'DocumentVersion',
-    'Query', 'RefreshToken', 'Invitation', 'AuditLog'
+    'Query', 'RefreshToken', 'Invitation', 'AuditLog',
+    'CodeReference', 'IndexGeneration'
 ]
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Code Reference Model - exact error code / part number lookup"""
+from datetime import datetime
+from app import db
+
+
+class CodeReference(db.Model):
+    """Code Reference = one error code, alarm or part number found in a chunk"""
+    __tablename__ = 'code_references'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # References
+    producer_id = db.Column(db.Integer, db.ForeignKey('producers.id'), nullable=False)
+    model_id = db.Column(db.Integer, db.ForeignKey('machine_models.id'))
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    chunk_id = db.Column(db.Integer, db.ForeignKey('document_chunks.id'), nullable=False)
+    
+    # Code: normalized for lookup ('E1'), as printed for answers ('E-1')
+    code = db.Column(db.String(100), nullable=False)
+    display_code = db.Column(db.String(100), nullable=False)
+    code_type = db.Column(db.String(20), nullable=False)
+    
+    # The documentation line that defines the code
+    description = db.Column(db.Text)
+    page = db.Column(db.Integer)
+    source_reference = db.Column(db.String(255))
+    
+    # Timestamp
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    document = db.relationship('Document', backref=db.backref(
+        'code_references', lazy='dynamic', cascade='all, delete-orphan'))
+    chunk = db.relationship('DocumentChunk', backref=db.backref(
+        'code_references', lazy='dynamic', cascade='all, delete-orphan'))
+    
+    __table_args__ = (
+        db.Index('idx_code_lookup', 'producer_id', 'model_id', 'code'),
+    )
+    
+    def __repr__(self):
+        return f'<CodeReference {self.display_code}>'
@@ -1,6 +1,11 @@
 """Document Models - Multi-format support"""
 from datetime import datetime
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
 from app import db
+from app.models.code import CodeReference
+from app.rag.codec import encode_embedding, decode_embedding, parse_json_embedding
+import numpy as np
 import hashlib
 
 
@@ -74,34 +79,95 @@ class Document(db.Model):
 
 
 class DocumentChunk(db.Model):
-    """Document Chunk = Text segment for RAG"""
+    """Document Chunk = Text segment for RAG
+
+    Loading a chunk reads only the small columns. The 'text' group (text,
+    source reference, metadata) and the 'vectors' group (embeddings) load on
+    first access, or up front with db.undefer_group(...).
+    """
     __tablename__ = 'document_chunks'
     
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
     
+    # Tenant, copied from the document at ingest: search and RLS filter chunks
+    # without joining documents
+    producer_id = db.Column(db.Integer, db.ForeignKey('producers.id'), nullable=False)
+    model_id = db.Column(db.Integer, db.ForeignKey('machine_models.id'))
+    
     # Content
     chunk_index = db.Column(db.Integer, nullable=False)
-    chunk_text = db.Column(db.Text, nullable=False)
+    chunk_text = db.deferred(db.Column(db.Text, nullable=False), group='text')
     
     # Source reference
-    source_reference = db.Column(db.String(255))
+    source_reference = db.deferred(db.Column(db.String(255)), group='text')
     
     # Metadata
-    chunk_metadata = db.Column(db.JSON)
+    chunk_metadata = db.deferred(db.Column(db.JSON), group='text')
     
     # Vector DB
     vector_id = db.Column(db.String(255), nullable=False)
     
     # ✅ FIX: Add embedding column (exists in DB, was missing from model)
-    embedding = db.Column(db.JSON)
+    embedding = db.deferred(db.Column(db.JSON), group='vectors')
+    
+    # Compact embedding: raw little-endian float32 (4 bytes/dim instead of ~20 chars)
+    embedding_vec = db.deferred(db.Column(db.LargeBinary), group='vectors')
+    embedding_dim = db.Column(db.Integer)
+    embedding_model = db.Column(db.String(50))
+    # PostgreSQL deployments on the pgvector backend also have embedding_pgv vector(1024);
+    # it is written and queried with SQL only (app.rag.vector_store.PgVectorStore)
+    
+    # SimHash of chunk_text (app.rag.dedup), for near-duplicate detection at ingest
+    simhash = db.Column(db.BigInteger)
     
     # Timestamp
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (
         db.UniqueConstraint('document_id', 'chunk_index', name='_doc_chunk_uc'),
+        db.Index('idx_chunks_tenant', 'producer_id', 'model_id'),
+        # Pinecone results are hydrated by vector id
+        db.Index('idx_chunks_vector', 'producer_id', 'vector_id'),
     )
+    
+    def set_embedding(self, vector, model='voyage-2'):
+        """Store embedding in binary form"""
+        self.embedding_vec = encode_embedding(vector)
+        self.embedding_dim = len(vector)
+        self.embedding_model = model
+    
+    def get_embedding(self):
+        """Embedding as float32 array (binary column, legacy JSON fallback)"""
+        if self.embedding_vec is not None:
+            return decode_embedding(self.embedding_vec)
+        if self.embedding:
+            return np.asarray(parse_json_embedding(self.embedding), dtype=np.float32)
+        return None
+
+
+@event.listens_for(Session, 'before_flush')
+def _sync_chunk_tenant(session, flush_context, instances):
+    """Keep each chunk's (and code reference's) producer_id / model_id equal to its document's"""
+    for obj in session.new:
+        if isinstance(obj, DocumentChunk) and obj.producer_id is None:
+            document = obj.document or (session.get(Document, obj.document_id) if obj.document_id else None)
+            if document is not None:
+                obj.producer_id, obj.model_id = document.producer_id, document.model_id
+    for obj in session.dirty:
+        if not isinstance(obj, Document) or obj.id is None:
+            continue
+        attrs = inspect(obj).attrs
+        if attrs.producer_id.history.has_changes() or attrs.model_id.history.has_changes():
+            session.execute(
+                update(DocumentChunk).where(DocumentChunk.document_id == obj.id)
+                .values(producer_id=obj.producer_id, model_id=obj.model_id)
+            )
+            # Code lookups filter on the same tenant columns (app.rag.codes)
+            session.execute(
+                update(CodeReference).where(CodeReference.document_id == obj.id)
+                .values(producer_id=obj.producer_id, model_id=obj.model_id)
+            )
 
 
 class DocumentVersion(db.Model):
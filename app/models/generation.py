@@ -0,0 +1,21 @@
+"""Index Generation Model - cross-worker cache invalidation"""
+from datetime import datetime
+from app import db
+
+
+class IndexGeneration(db.Model):
+    """Index Generation = change counter of one (producer, machine model) corpus
+
+    Bumped after every commit that writes documents or chunks of the tenant;
+    workers compare it with the generation they last saw to drop stale caches.
+    model_id 0 stands for documents without a machine model.
+    """
+    __tablename__ = 'index_generations'
+    
+    producer_id = db.Column(db.Integer, db.ForeignKey('producers.id'), primary_key=True)
+    model_id = db.Column(db.Integer, primary_key=True, default=0, autoincrement=False)
+    generation = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<IndexGeneration {self.producer_id}/{self.model_id}: {self.generation}>'
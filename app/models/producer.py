@@ -30,6 +30,10 @@ class Producer(db.Model):
     custom_domain = db.Column(db.String(255))
     admin_domain = db.Column(db.String(255))
     
+    # Error code / part number regexes: [{"type": "error", "pattern": "..."}]
+    # (None = app.rag.codes.DEFAULT_CODE_PATTERNS)
+    code_patterns = db.Column(db.JSON)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,29 @@
+"""Binary embedding encoding (raw little-endian float32)"""
+import json
+import numpy as np
+
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def encode_embedding(vector):
+    """Serialize a vector to raw little-endian float32 bytes"""
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(blob):
+    """Zero-copy view of a stored embedding as a float32 vector"""
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+
+
+def decode_embeddings(blobs, dim):
+    """Decode many same-dimension blobs into one (n, dim) matrix with a single copy"""
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.frombuffer(b''.join(blobs), dtype=EMBEDDING_DTYPE).reshape(len(blobs), dim)
+
+
+def parse_json_embedding(value):
+    """Legacy JSON column values may be (double-encoded) JSON text or an already decoded list"""
+    while isinstance(value, str):
+        value = json.loads(value)
+    return value
@@ -0,0 +1,159 @@
+"""Exact error code / part number lookup
+
+Most floor questions are "what does E-1 mean". At ingest, codes matched by
+the producer's regexes (Producer.code_patterns, else DEFAULT_CODE_PATTERNS)
+are stored in code_references with the line that defines them. At query
+time, a short question naming one code that has a single authoritative
+definition - a line that starts with the code - is answered from that row:
+no embedding, no vector search, no LLM call. Anything else (passing
+mentions, index lines, conflicting definitions) goes through normal
+retrieval.
+"""
+import re
+from app import db
+from app.models.code import CodeReference
+from app.models.document import Document
+from app.models.producer import Producer
+from app.rag.index_cache import FILTER_FIELDS, resolve_filters, filter_documents
+
+# Search filters on code_references: the chunk-level fields map to its own columns
+CODE_FILTER_COLUMNS = {
+    **FILTER_FIELDS,
+    'model_id': CodeReference.model_id,
+    'document_id': CodeReference.document_id,
+}
+
+DEFAULT_CODE_PATTERNS = [
+    {'type': 'error', 'pattern': r'\b(?:ERR|ALM|AL|E|F)-?\d{1,4}\b'},
+    {'type': 'part', 'pattern': r'\b[A-Z]{2,4}-\d{3,6}(?:-\d{1,4})?\b'},
+    {'type': 'part', 'pattern': r'\b\d{2,3}\.\d{3}\.\d{2,4}\b'},
+]
+
+# Questions longer than the code plus this many other words go through RAG
+MAX_EXTRA_WORDS = 3
+MAX_DESCRIPTION_CHARS = 500
+
+_WORD_RE = re.compile(r"[\w.-]+")
+# Dotted leaders ending in a page number: 'Contents ..... E-7 ..... 12'
+_TOC_RE = re.compile(r'(?:\.\s*){3,}\d+\s*$|…\s*\d+\s*$')
+_QUESTION_WORDS = {
+    'what', 'does', 'do', 'is', 'the', 'a', 'an', 'mean', 'means', 'meaning', 'of', 'code',
+    'error', 'alarm', 'fault', 'part', 'number', 'on', 'my', 'display', 'show', 'shows',
+    'showing', 'for', 'about', 'tell', 'me',
+}
+
+_compiled = {}
+
+
+def normalize_code(code):
+    return re.sub(r'[^A-Z0-9]', '', code.upper())
+
+
+def code_patterns(producer_id):
+    """Compiled (type, regex) pairs for a producer, cached per pattern set"""
+    producer = db.session.get(Producer, producer_id)
+    patterns = (producer.code_patterns if producer is not None else None) or DEFAULT_CODE_PATTERNS
+    key = tuple((p['type'], p['pattern']) for p in patterns)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = [(t, re.compile(p, re.IGNORECASE)) for t, p in key]
+    return compiled
+
+
+def extract_codes(text, patterns):
+    """[(code_type, display_code, description)] for every distinct code in a chunk"""
+    lines = text.splitlines()
+    found = {}
+    for line_no, line in enumerate(lines):
+        for code_type, regex in patterns:
+            for match in regex.finditer(line):
+                code = normalize_code(match.group(0))
+                if code in found:
+                    continue
+                description = line.strip()
+                # A code alone on its line is usually followed by its meaning
+                if description.upper() == match.group(0).upper() and line_no + 1 < len(lines):
+                    description = f"{description} {lines[line_no + 1].strip()}"
+                # Table-of-contents / index lines ('E-1 ..... 12') define nothing
+                if not _has_words(description.replace(match.group(0), '')) or _is_toc(description):
+                    continue
+                found[code] = (code_type, match.group(0), description[:MAX_DESCRIPTION_CHARS])
+    return [(code_type, display, description) for code_type, display, description in found.values()]
+
+
+def _has_words(text):
+    return len(re.findall(r'[^\W\d_]{2,}', text)) > 0
+
+
+def _is_toc(text):
+    return _TOC_RE.search(text) is not None
+
+
+def _is_definition(row):
+    """Table-style rows start with the code ('E-1  Water tank empty'), index lines do not count"""
+    description = row.description or ''
+    return (normalize_code(description[:len(row.display_code) + 2]).startswith(row.code)
+            and not _is_toc(description))
+
+
+def index_chunk_codes(doc, chunks):
+    """Add code_references rows for the (flushed) chunks of a document"""
+    patterns = code_patterns(doc.producer_id)
+    count = 0
+    for chunk in chunks:
+        for code_type, display, description in extract_codes(chunk.chunk_text, patterns):
+            db.session.add(CodeReference(
+                producer_id=doc.producer_id,
+                model_id=doc.model_id,
+                document_id=doc.id,
+                chunk_id=chunk.id,
+                code=normalize_code(display),
+                display_code=display,
+                code_type=code_type,
+                description=description,
+                page=(chunk.chunk_metadata or {}).get('page'),
+                source_reference=chunk.source_reference,
+            ))
+            count += 1
+    if count:
+        print(f"🔢 Indexed {count} error codes / part numbers")
+    return count
+
+
+def question_code(question, producer_id):
+    """The single code a short lookup question asks about, else None"""
+    patterns = code_patterns(producer_id)
+    codes = set()
+    for _, regex in patterns:
+        codes.update(normalize_code(m.group(0)) for m in regex.finditer(question))
+    if len(codes) != 1:
+        return None
+    code = codes.pop()
+    words = [w.strip('.-').lower() for w in _WORD_RE.findall(question)]
+    extra = [w for w in words if w and normalize_code(w) != code and w not in _QUESTION_WORDS]
+    return code if len(extra) <= MAX_EXTRA_WORDS else None
+
+
+def lookup_code(code, producer_id, model_id=None, filters=None):
+    """The authoritative definition of a code, or None when there is none or several
+
+    Search filters apply as in retrieval (superseded document versions are
+    ignored unless is_latest is given), only lines that start with the code
+    count as definitions (a single 'see E-1 on page 3' mention is not an
+    answer) and the same definition repeated across chunks counts once.
+    """
+    query = CodeReference.query.join(Document, CodeReference.document_id == Document.id).filter(
+        CodeReference.producer_id == producer_id,
+        CodeReference.code == code
+    )
+    query = filter_documents(query, resolve_filters(filters), columns=CODE_FILTER_COLUMNS)
+    if model_id:
+        query = query.filter(db.or_(CodeReference.model_id == model_id, CodeReference.model_id.is_(None)))
+    rows = query.order_by(CodeReference.id).limit(20).all()
+    definitions = {}
+    for row in rows:
+        if _is_definition(row):
+            definitions.setdefault(' '.join((row.description or '').lower().split()), row)
+    if len(definitions) != 1:
+        return None
+    return next(iter(definitions.values()))
@@ -0,0 +1,74 @@
+"""Near-duplicate chunk detection with 64-bit SimHash
+
+Manuals repeat themselves: safety warnings on every page, the same parts
+table per language, boilerplate shared across machine models. Each chunk
+gets a SimHash fingerprint over word 3-shingles; two chunks are near
+duplicates when their fingerprints differ in at most DEDUP_MAX_DISTANCE bits.
+
+Lookup is LSH banding: the 64 bits are split into (max_distance + 1) bands,
+so by pigeonhole any pair within the distance shares at least one band
+exactly and only those bucket mates are compared.
+"""
+import re
+import hashlib
+import numpy as np
+
+SHINGLE = 3
+_BITS = np.arange(64, dtype=np.uint64)
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingle_hashes(text):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)]
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'little') for s in shingles],
+        dtype=np.uint64
+    )
+
+
+def simhash(text):
+    """Signed 64-bit SimHash (fits a BIGINT column)"""
+    hashes = _shingle_hashes(text)
+    bits = ((hashes[:, None] >> _BITS) & np.uint64(1)).astype(np.int32)
+    votes = (2 * bits - 1).sum(axis=0)
+    fingerprint = np.uint64(0)
+    for bit in np.flatnonzero(votes > 0):
+        fingerprint |= np.uint64(1) << np.uint64(bit)
+    return int(np.array(fingerprint, dtype=np.uint64).view(np.int64))
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+class SimHashIndex:
+    """Banded LSH table of fingerprints -> keys"""
+
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        edges = np.linspace(0, 64, n_bands + 1).astype(int)
+        self.bands = [(int(lo), (1 << int(hi - lo)) - 1) for lo, hi in zip(edges[:-1], edges[1:])]
+        self.tables = [{} for _ in self.bands]
+
+    def _keys(self, fingerprint):
+        unsigned = fingerprint & 0xFFFFFFFFFFFFFFFF
+        return [(unsigned >> shift) & mask for shift, mask in self.bands]
+
+    def add(self, fingerprint, key):
+        for table, band in zip(self.tables, self._keys(fingerprint)):
+            table.setdefault(band, []).append((fingerprint, key))
+
+    def find(self, fingerprint):
+        """Key of the closest stored fingerprint within max_distance, else None"""
+        best, best_distance = None, self.max_distance + 1
+        for table, band in zip(self.tables, self._keys(fingerprint)):
+            for other, key in table.get(band, ()):
+                distance = hamming(fingerprint, other)
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        return best
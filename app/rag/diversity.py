@@ -0,0 +1,51 @@
+"""Maximal marginal relevance (MMR) over retrieved candidates
+
+Chunks overlap by 150 characters, so the best few hits are often near-copies
+of one paragraph. MMR picks each next chunk by
+
+    lambda * sim(query, chunk) - (1 - lambda) * max sim(chunk, already picked)
+
+using one candidate x candidate similarity matrix; the selection loop runs k
+times over vectors, never over candidate pairs. The relevance term defaults
+to cosine similarity with the query; callers with a better ranking (hybrid
+RRF scores) pass it in, scaled to [0, 1], and cosine is then only used for
+the redundancy penalty.
+"""
+import numpy as np
+
+
+def mmr_select(query_vector, vectors, k, lambda_=0.7, relevance=None):
+    """Positions of k diverse, relevant rows of a normalized candidate matrix, in pick order"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if relevance is None:
+        relevance = vectors @ np.asarray(query_vector, dtype=np.float32)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if lambda_ >= 1.0:
+        return np.argsort(-relevance, kind='stable')[:k]
+
+    similarity = vectors @ vectors.T
+    picked = np.zeros(len(vectors), dtype=bool)
+    # Highest similarity to any picked chunk (0 before the first pick)
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    order = []
+    for _ in range(k):
+        mmr = lambda_ * relevance - (1 - lambda_) * redundancy
+        mmr[picked] = -np.inf
+        best = int(np.argmax(mmr))
+        order.append(best)
+        picked[best] = True
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return np.array(order, dtype=np.int64)
+
+
+def scale_scores(scores):
+    """Min-max scale fused scores to [0, 1], comparable with cosine redundancy"""
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    if spread <= 0:
+        return np.ones(len(scores), dtype=np.float32)
+    return (scores - scores.min()) / spread
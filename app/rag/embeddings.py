@@ -35,4 +35,21 @@ def generate_query_embedding(text):
         return result.embeddings[0]
     except Exception as e:
         print(f"Query embedding error: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def generate_query_embeddings(texts):
+    """Generate query embeddings for several questions in one call"""
+    try:
+        import voyageai
+        client = voyageai.Client(api_key=current_app.config['VOYAGE_API_KEY'])
+        
+        result = client.embed(
+            texts=texts,
+            model="voyage-2",
+            input_type="query"
+        )
+        
+        return result.embeddings
+    except Exception as e:
+        print(f"Query embedding error: {e}")
+        return None
@@ -1,37 +1,289 @@
 """RAG Engine"""
 import time
 import os
-from app.rag.embeddings import generate_query_embedding
-from app.rag.vector_db import search_similar
+from flask import current_app
+from app.rag.embeddings import generate_query_embedding, generate_query_embeddings
+import numpy as np
+from app.rag.vector_db import hydrate_chunks, chunk_vectors
+from app.rag.vector_store import get_vector_store
+from app.rag.index_cache import resolve_filters, normalize_query
+from app.rag.diversity import mmr_select, scale_scores
+from app.rag.codes import question_code, lookup_code, normalize_code
+from app.rag.lexical import lexical_cache, reciprocal_rank_fusion, code_terms, tokenize
+from app import db
 from app.models.machine import MachineInstance
 
+TOP_K = 5
+
 class RAGEngine:
     
-    def query(self, question, producer_id, machine_id=None):
-        """Execute RAG query"""
+    def query(self, question, producer_id, machine_id=None, filters=None, mmr_lambda=None, machine_ids=None):
+        """Execute RAG query
+        
+        filters: Document attributes (doc_type, language, is_latest, document_id);
+        only the latest document versions are searched unless is_latest is given.
+        mmr_lambda: relevance/diversity trade-off of the final chunks, 1.0 disables
+        diversification (default MMR_LAMBDA).
+        machine_ids: fan-out mode (without machine_id): search all these machines
+        at once, one search per distinct machine model; chunks and sources are
+        tagged with the machines they apply to.
+        """
         start_time = time.time()
         
-        # Get model_id from machine
-        model_id = None
-        if machine_id:
-            machine = MachineInstance.query.get(machine_id)
-            if machine:
-                model_id = machine.model_id
+        # Get model_id(s) from the machine(s)
+        if machine_id or not machine_ids:
+            machines_by_model = {self._model_id_for(machine_id): [machine_id] if machine_id else []}
+        else:
+            machines_by_model = self._models_for(machine_ids, producer_id)
+        model_ids = list(machines_by_model)
+        
+        if len(model_ids) == 1:
+            print(f"🚀 RAG Query: question='{question}', producer={producer_id}, machine={machine_id}, model={model_ids[0]}")
+        else:
+            print(f"🚀 RAG Fan-out: question='{question}', producer={producer_id}, machines={machine_ids}, models={model_ids}")
+        if not model_ids:
+            return self._answer(question, [], start_time, 0)
         
-        print(f"🚀 RAG Query: question='{question}', producer={producer_id}, machine={machine_id}, model={model_id}")
+        mmr_lambda = current_app.config.get('MMR_LAMBDA', 0.5) if mmr_lambda is None else mmr_lambda
+        answer, lexical_chunks = self._without_embedding(question, producer_id, model_ids, machines_by_model,
+                                                         filters, mmr_lambda, start_time)
+        if answer is not None:
+            return answer
         
-        # 1. Generate query embedding
+        # 2. Generate query embedding (once, whatever the number of models)
         query_embedding = generate_query_embedding(question)
         if not query_embedding:
             return {'error': 'Failed to generate embedding'}
         
+        # 3. Search each model once
+        store = get_vector_store()
+        print(f"🎯 Querying {store.name} vector store: producer={producer_id}, models={model_ids}")
+        per_model = store.query_models(query_embedding, producer_id, model_ids,
+                                       top_k=self._candidates(mmr_lambda), filters=filters)
+        chunks = self._rank(query_embedding, per_model, lexical_chunks, producer_id, machines_by_model, mmr_lambda)
+        
+        retrieval_time = int((time.time() - start_time) * 1000)
+        
+        return self._answer(question, chunks, start_time, retrieval_time)
+    
+    def query_many(self, questions, producer_id, machine_id=None, filters=None, mmr_lambda=None):
+        """Execute several RAG queries with one embedding call and one batched search (VECTOR_BACKEND)
+        
+        Each question goes through the same pipeline as query(); only the
+        questions left after the code-table and exact-token fast paths are
+        embedded and searched, together.
+        """
+        start_time = time.time()
+        model_id = self._model_id_for(machine_id)
+        machines_by_model = {model_id: [machine_id] if machine_id else []}
+        
+        print(f"🚀 RAG Batch: {len(questions)} questions, producer={producer_id}, machine={machine_id}, model={model_id}")
+        
+        # 1. Fast paths, per question
+        mmr_lambda = current_app.config.get('MMR_LAMBDA', 0.5) if mmr_lambda is None else mmr_lambda
+        results = [None] * len(questions)
+        lexical = {}
+        for i, question in enumerate(questions):
+            results[i], lexical[i] = self._without_embedding(question, producer_id, [model_id], machines_by_model,
+                                                             filters, mmr_lambda, time.time())
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
+        # 2. Embed the remaining questions in a single Voyage call
+        query_embeddings = generate_query_embeddings([questions[i] for i in pending])
+        if not query_embeddings:
+            for i in pending:
+                results[i] = {'error': 'Failed to generate embedding'}
+            return results
+        
+        # 3. Score them in one pass over the tenant index (per query on other backends)
+        store = get_vector_store()
+        all_chunks = store.query_batch(query_embeddings, producer_id, model_id=model_id,
+                                       top_k=self._candidates(mmr_lambda), filters=filters)
+        ranked = [self._rank(query_embedding, {model_id: chunks}, lexical[i], producer_id, machines_by_model, mmr_lambda)
+                  for i, query_embedding, chunks in zip(pending, query_embeddings, all_chunks)]
         retrieval_time = int((time.time() - start_time) * 1000)
         
-        # 2. Search with model_id filter
-        print(f"🎯 About to call search_similar: producer={producer_id}, model={model_id}")
-        chunks = search_similar(query_embedding, producer_id, model_id=model_id)
-        print(f"📦 Got {len(chunks)} chunks back from search_similar")
+        # 4. Answers are generated per question; each reports the shared retrieval time
+        for i, chunks in zip(pending, ranked):
+            result = self._answer(questions[i], chunks, time.time(), retrieval_time)
+            result['response_time_ms'] += retrieval_time
+            results[i] = result
+        return results
+    
+    def _candidates(self, mmr_lambda):
+        """Vector hits to fetch per model: a pool for fusion/MMR, else just top_k"""
+        config = current_app.config
+        if config.get('HYBRID_SEARCH_ENABLED', True) or mmr_lambda < 1.0:
+            return config.get('HYBRID_CANDIDATES', 20)
+        return TOP_K
+    
+    def _without_embedding(self, question, producer_id, model_ids, machines_by_model, filters, mmr_lambda, start_time):
+        """Steps before vector search: code-table answer, lexical hits, exact-token shortcut
+        
+        Returns (answer, lexical_chunks); answer is None when the question
+        still needs vector search.
+        """
+        config = current_app.config
+        
+        # 0. Error code / part number lookups are answered from the code table
+        if config.get('CODE_LOOKUP_ENABLED', True):
+            answers = [self._code_answer(question, producer_id, model_id, start_time, filters)
+                       for model_id in model_ids]
+            answers = [answer for answer in answers if answer is not None]
+            # Models may define the same code differently: only an unambiguous answer
+            if answers and len({answer['answer'] for answer in answers}) == 1:
+                return answers[0], []
         
+        if not config.get('HYBRID_SEARCH_ENABLED', True):
+            return None, []
+        
+        # 1. Lexical lookup (exact codes and part numbers)
+        lexical_chunks = []
+        for model_id in model_ids:
+            lexical_chunks.extend(self._tag(
+                self._lexical_search(question, producer_id, model_id, filters), model_id, machines_by_model))
+        lexical_chunks.sort(key=lambda chunk: chunk['score'], reverse=True)
+        exact_chunks = self._exact_token_hits(question, lexical_chunks)
+        if exact_chunks and config.get('LEXICAL_SHORTCUT_ENABLED', True):
+            # Hits for one code are often overlapping chunks of one paragraph
+            if mmr_lambda < 1.0:
+                exact_chunks = self._diversify(None, exact_chunks, producer_id, TOP_K, mmr_lambda,
+                                               relevance_key='score')
+            retrieval_time = int((time.time() - start_time) * 1000)
+            print(f"⚡ Exact-token question, answering from lexical index ({retrieval_time}ms)")
+            return self._answer(question, exact_chunks[:TOP_K], start_time, retrieval_time), lexical_chunks
+        return None, lexical_chunks
+    
+    def _rank(self, query_embedding, per_model, lexical_chunks, producer_id, machines_by_model, mmr_lambda):
+        """Final chunks from per-model vector hits: merge, fuse with lexical hits, diversify"""
+        config = current_app.config
+        chunks = []
+        for model_id, results in per_model.items():
+            chunks.extend(self._tag(results, model_id, machines_by_model))
+        chunks.sort(key=lambda chunk: chunk['score'], reverse=True)
+        print(f"📦 Got {len(chunks)} chunks back from the vector store")
+        
+        # 4. Fuse vector and lexical rankings
+        if config.get('HYBRID_SEARCH_ENABLED', True):
+            for chunk in chunks:
+                chunk['chunk_id'] = int(chunk['chunk_id'])
+            chunks = reciprocal_rank_fusion([chunks, lexical_chunks], k=config.get('RRF_K', 60))
+        
+        # 5. Diversify: overlapping chunks are often near-copies of each other
+        if mmr_lambda < 1.0:
+            chunks = self._diversify(query_embedding, chunks, producer_id, TOP_K, mmr_lambda)
+        return chunks[:TOP_K]
+    
+    def _model_id_for(self, machine_id):
+        """Resolve the machine model a machine instance belongs to"""
+        if machine_id:
+            machine = MachineInstance.query.get(machine_id)
+            if machine:
+                return machine.model_id
+        return None
+    
+    def _models_for(self, machine_ids, producer_id):
+        """{model_id: [machine ids]} for the producer's machines among machine_ids, one query"""
+        rows = db.session.query(MachineInstance.id, MachineInstance.model_id).filter(
+            MachineInstance.id.in_([int(machine_id) for machine_id in machine_ids]),
+            MachineInstance.producer_id == producer_id
+        ).order_by(MachineInstance.id).all()
+        machines_by_model = {}
+        for machine_id, model_id in rows:
+            machines_by_model.setdefault(model_id, []).append(machine_id)
+        return machines_by_model
+    
+    def _tag(self, chunks, model_id, machines_by_model):
+        """Mark chunks with the machines (of the searched model) they apply to"""
+        for chunk in chunks:
+            chunk['machine_ids'] = machines_by_model[model_id]
+        return chunks
+    
+    def _code_answer(self, question, producer_id, model_id, start_time, filters=None):
+        """Templated answer with citation for a single authoritative code match, else None"""
+        code = question_code(question, producer_id)
+        if code is None:
+            return None
+        row = lookup_code(code, producer_id, model_id, filters=filters)
+        if row is None:
+            return None
+        
+        definition = row.description or row.display_code
+        if not normalize_code(definition).startswith(row.code):
+            definition = f"{row.display_code}: {definition}"
+        answer = f"{definition}\n\nSource: {row.document.title}, {row.source_reference or f'Page {row.page}'}"
+        
+        total_time = int((time.time() - start_time) * 1000)
+        print(f"⚡ Code lookup: {row.display_code} ({row.code_type}), answered in {total_time}ms")
+        return {
+            'answer': answer,
+            'sources': [{
+                'doc_id': row.document_id,
+                'page': row.page,
+                'source_reference': row.source_reference,
+                'similarity_score': 1.0
+            }],
+            'response_time_ms': total_time,
+            'retrieval_time_ms': total_time,
+            'generation_time_ms': 0,
+            'tokens_input': 0,
+            'tokens_output': 0,
+            'fast_path': 'code_lookup'
+        }
+    
+    def _lexical_search(self, question, producer_id, model_id, filters=None):
+        """BM25 candidates, scores scaled so the best hit is 1.0"""
+        config = current_app.config
+        index = lexical_cache.get(producer_id, model_id,
+                                  k1=config.get('BM25_K1', 1.2), b=config.get('BM25_B', 0.75))
+        # Filter before the cut, so selective filters still leave candidates
+        resolved = resolve_filters(filters)
+        chunk_ids, scores = index.search(question, top_k=config.get('HYBRID_CANDIDATES', 20),
+                                         mask=index.filter_mask(resolved))
+        if not len(chunk_ids):
+            return []
+        print(f"🔤 Lexical hits: {len(chunk_ids)} (best BM25 {scores[0]:.2f})")
+        return hydrate_chunks(chunk_ids, (scores / scores[0]).tolist(), filters=resolved)
+    
+    def _exact_token_hits(self, question, lexical_chunks):
+        """For short code lookups ('What does E42 mean?'), the lexical hits containing every code"""
+        words, codes = code_terms(question)
+        if not codes or len(words) > len(codes) + 2:
+            return []
+        return [
+            chunk for chunk in lexical_chunks
+            if all(code in set(tokenize(chunk['text'])) for code in codes)
+        ]
+    
+    def _diversify(self, query_embedding, chunks, producer_id, top_k, mmr_lambda, relevance_key=None):
+        """Reorder candidates by maximal marginal relevance, keeping top_k
+
+        Relevance is the chunks' relevance_key score when given (BM25 for the
+        exact-token shortcut, which has no query embedding), the fused RRF
+        score when the candidates come from hybrid retrieval, cosine
+        similarity to the query otherwise.
+        """
+        if len(chunks) <= top_k:
+            return chunks
+        vectors = chunk_vectors(producer_id, [chunk['chunk_id'] for chunk in chunks])
+        candidates = [chunk for chunk in chunks if int(chunk['chunk_id']) in vectors]
+        if len(candidates) <= top_k:
+            return chunks[:top_k]
+        matrix = np.stack([vectors[int(chunk['chunk_id'])] for chunk in candidates])
+        # Hybrid results are ranked by RRF: keep that order as the relevance term
+        if relevance_key is None and all('rrf_score' in chunk for chunk in candidates):
+            relevance_key = 'rrf_score'
+        relevance = None
+        if relevance_key is not None:
+            relevance = scale_scores([chunk[relevance_key] for chunk in candidates])
+        query_vector = normalize_query(query_embedding) if query_embedding is not None else None
+        order = mmr_select(query_vector, matrix, top_k, mmr_lambda, relevance=relevance)
+        return [candidates[i] for i in order]
+    
+    def _answer(self, question, chunks, start_time, retrieval_time):
+        """Generate the answer payload for retrieved chunks"""
         if not chunks:
             return {
                 'answer': "I don't have information about that in the documentation.",
@@ -94,10 +346,13 @@ class RAGEngine:
         """Format sources"""
         sources = []
         for chunk in chunks[:3]:
-            sources.append({
+            source = {
                 'doc_id': chunk.get('doc_id'),
                 'page': chunk.get('page'),
                 'source_reference': chunk.get('source_reference'),
                 'similarity_score': round(chunk.get('score', 0), 2)
-            })
+            }
+            if chunk.get('machine_ids'):
+                source['machine_ids'] = chunk['machine_ids']
+            sources.append(source)
         return sources
@@ -0,0 +1,224 @@
+"""Per-tenant index generations and cross-worker cache invalidation
+
+Every commit that writes a Document or DocumentChunk bumps the tenant's row
+in index_generations (on its own connection, right after the commit). On
+PostgreSQL the bump also sends NOTIFY index_generations '<producer>:<model>:<n>';
+a listener thread in each worker receives it and runs the registered
+invalidation callbacks within milliseconds. Under SQLite (tests, local runs)
+the thread polls the table every GENERATION_POLL_INTERVAL seconds instead.
+"""
+import os
+import select
+import threading
+from datetime import datetime
+from sqlalchemy import event, select as sql_select, update, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db
+from app.models.document import Document, DocumentChunk
+from app.models.generation import IndexGeneration
+
+CHANNEL = 'index_generations'
+
+_seen = {}
+_changes = {}
+_callbacks = []
+_lock = threading.Lock()
+
+
+def on_change(callback):
+    """Register callback(producer_id, model_id) run when a tenant's corpus changes"""
+    _callbacks.append(callback)
+    return callback
+
+
+def generation(producer_id):
+    """Number of corpus changes this worker has observed for a producer"""
+    return _changes.get(producer_id, 0)
+
+
+def listening():
+    """True while this process's listener thread delivers other workers' changes"""
+    return _listener is not None and _listener_pid == os.getpid() and _listener.is_alive()
+
+
+def _apply(producer_id, model_id, value=None, baseline=False):
+    """Record a (possibly already seen) generation and run callbacks if it is new
+
+    With baseline, the value is only remembered: it predates this worker's caches.
+    """
+    with _lock:
+        key = (producer_id, model_id)
+        if value is not None:
+            if _seen.get(key, 0) >= value:
+                return False
+            _seen[key] = value
+        if baseline:
+            return False
+        _changes[producer_id] = _changes.get(producer_id, 0) + 1
+    for callback in _callbacks:
+        try:
+            callback(producer_id, model_id or None)
+        except Exception as e:
+            print(f"Cache invalidation error: {e}")
+    return True
+
+
+# ----------------------------------------------------------------------------
+# Bumping
+# ----------------------------------------------------------------------------
+
+def _tenant_of(session, obj):
+    if isinstance(obj, DocumentChunk) and obj.producer_id is not None:
+        return obj.producer_id, obj.model_id or 0
+    document = obj if isinstance(obj, Document) else obj.document
+    if document is None and obj.document_id is not None:
+        document = session.get(Document, obj.document_id)
+    if document is None or document.producer_id is None:
+        return None
+    return document.producer_id, document.model_id or 0
+
+
+def _increment(conn, producer_id, model_id):
+    table = IndexGeneration.__table__
+    where = (table.c.producer_id == producer_id) & (table.c.model_id == model_id)
+    bumped = conn.execute(
+        update(table).where(where)
+        .values(generation=table.c.generation + 1, updated_at=datetime.utcnow())
+        .returning(table.c.generation)
+    ).scalar()
+    if bumped is not None:
+        return bumped
+    try:
+        with conn.begin_nested():
+            conn.execute(table.insert().values(
+                producer_id=producer_id, model_id=model_id, generation=1, updated_at=datetime.utcnow()
+            ))
+        return 1
+    except IntegrityError:
+        # Another worker created the row first
+        return _increment(conn, producer_id, model_id)
+
+
+def bump_generations(tenants):
+    """Increment and broadcast the generation of each (producer_id, model_id)"""
+    bumped = []
+    try:
+        with db.engine.begin() as conn:
+            for producer_id, model_id in sorted(tenants):
+                value = _increment(conn, producer_id, model_id)
+                bumped.append((producer_id, model_id, value))
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                 {'channel': CHANNEL, 'payload': f"{producer_id}:{model_id}:{value}"})
+    except Exception as e:
+        print(f"Index generation bump error: {e}")
+        bumped = [(producer_id, model_id, None) for producer_id, model_id in tenants]
+    # This worker does not wait for its own notification
+    for producer_id, model_id, value in bumped:
+        _apply(producer_id, model_id, value)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_writes(session, flush_context, instances):
+    tenants = session.info.setdefault('generation_tenants', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Document, DocumentChunk)):
+            tenant = _tenant_of(session, obj)
+            if tenant is not None:
+                tenants.add(tenant)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_written(session):
+    tenants = session.info.pop('generation_tenants', None)
+    if tenants:
+        bump_generations(tenants)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_writes(session):
+    session.info.pop('generation_tenants', None)
+
+
+# ----------------------------------------------------------------------------
+# Listening
+# ----------------------------------------------------------------------------
+
+def poll_generations(engine, baseline=False):
+    """Apply every generation newer than the last one seen; returns how many changed"""
+    table = IndexGeneration.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(sql_select(table.c.producer_id, table.c.model_id, table.c.generation)).all()
+    return sum(_apply(producer_id, model_id, value, baseline) for producer_id, model_id, value in rows)
+
+
+class GenerationListener(threading.Thread):
+    """Daemon thread applying generation changes made by other workers"""
+
+    def __init__(self, engine, poll_interval=2.0):
+        super().__init__(name='index-generation-listener', daemon=True)
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        print(f"📡 Generation listener started ({self.engine.dialect.name}, pid {os.getpid()})")
+        while not self._stopping.is_set():
+            try:
+                if self.engine.dialect.name == 'postgresql':
+                    self._listen()
+                else:
+                    poll_generations(self.engine)
+                    self._stopping.wait(self.poll_interval)
+            except Exception as e:
+                print(f"Generation listener error: {e}")
+                self._stopping.wait(max(self.poll_interval, 1.0))
+
+    def _listen(self):
+        conn = self.engine.raw_connection()
+        # A LISTENing autocommit connection must not go back to the pool
+        conn.detach()
+        try:
+            raw = conn.driver_connection
+            raw.autocommit = True
+            raw.cursor().execute(f"LISTEN {CHANNEL}")
+            # Catch up on anything committed while not listening
+            poll_generations(self.engine)
+            while not self._stopping.is_set():
+                if select.select([raw], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notify = raw.notifies.pop(0)
+                    producer_id, model_id, value = (int(part) for part in notify.payload.split(':'))
+                    _apply(producer_id, model_id, value)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+_listener = None
+_listener_pid = None
+
+
+def start_listener(app):
+    """Start this process's listener once (after any fork, so each worker gets one)"""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid() or not app.config.get('GENERATION_LISTENER_ENABLED', True):
+        return _listener
+    with _lock:
+        if _listener_pid == os.getpid():
+            return _listener
+        _listener_pid = os.getpid()
+    with app.app_context():
+        try:
+            # Generations committed before this worker started are not changes
+            poll_generations(db.engine, baseline=True)
+        except Exception as e:
+            print(f"Generation listener baseline error: {e}")
+        _listener = GenerationListener(db.engine, app.config.get('GENERATION_POLL_INTERVAL', 2.0))
+    _listener.start()
+    return _listener
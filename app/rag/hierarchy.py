@@ -0,0 +1,96 @@
+"""Coarse-to-fine (document -> section -> chunk) retrieval
+
+For tenants with hundreds of documents most chunks are irrelevant to a
+query. Each document and each section (a run of SECTION_CHUNKS consecutive
+chunks of one document) gets a centroid: the normalized mean of its chunk
+vectors. A query scores the document centroids, keeps the best
+doc_fanout documents, scores their section centroids, keeps the best
+section_fanout sections, and only then scores the chunks inside them.
+
+Centroids are derived from the tenant matrix when the hierarchy is first
+used, so they always match the vectors being searched.
+"""
+import numpy as np
+
+SECTION_CHUNKS = 16
+
+
+def _centroids(matrix, labels, n_groups):
+    """Normalized mean row per label, accumulated in row blocks"""
+    sums = np.zeros((n_groups, matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32)
+    for start in range(0, len(labels), 4096):
+        block_labels = labels[start:start + 4096]
+        order = np.argsort(block_labels, kind='stable')
+        sorted_labels = block_labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        block = np.asarray(matrix[start:start + 4096], dtype=np.float32)[order]
+        sums[sorted_labels[starts]] += np.add.reduceat(block, starts, axis=0)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return sums / norms
+
+
+class Hierarchy:
+    """Document and section centroids over the rows of a tenant matrix"""
+
+    def __init__(self, matrix, doc_labels, section_chunks=SECTION_CHUNKS):
+        doc_labels = np.asarray(doc_labels, dtype=np.int64)
+        n = len(doc_labels)
+        # Rows grouped by document, in index (chunk id) order within each document
+        order = np.argsort(doc_labels, kind='stable')
+        sorted_docs = doc_labels[order]
+        new_doc = np.r_[True, sorted_docs[1:] != sorted_docs[:-1]][:n]
+        doc_starts = np.flatnonzero(new_doc)
+        rank_in_doc = np.arange(n) - np.repeat(doc_starts, np.diff(np.r_[doc_starts, n]))
+
+        # Section boundaries: new document or every section_chunks rows
+        new_section = new_doc | (rank_in_doc % section_chunks == 0)
+        section_sorted = np.cumsum(new_section) - 1
+        n_sections = int(section_sorted[-1]) + 1 if n else 0
+
+        self.section_of_row = np.empty(n, dtype=np.int64)
+        self.section_of_row[order] = section_sorted
+        self.section_offsets = np.r_[np.flatnonzero(new_section), n].astype(np.int64)
+        self.section_rows = order
+        self.section_doc = sorted_docs[self.section_offsets[:-1]]
+
+        self.doc_labels = doc_labels
+        self.n_docs = int(doc_labels.max()) + 1 if n else 0
+        self.doc_centroids = _centroids(matrix, doc_labels, self.n_docs)
+        self.section_centroids = _centroids(matrix, self.section_of_row, n_sections)
+
+    @property
+    def nbytes(self):
+        return (self.doc_centroids.nbytes + self.section_centroids.nbytes
+                + self.section_of_row.nbytes + self.section_rows.nbytes)
+
+    def candidate_rows(self, query_vector, doc_fanout, section_fanout, mask=None):
+        """Row positions inside the best sections of the best documents"""
+        doc_scores = self.doc_centroids @ query_vector
+        section_allowed = None
+        if mask is not None:
+            doc_scores[np.bincount(self.doc_labels[mask], minlength=self.n_docs) == 0] = -np.inf
+            section_allowed = np.bincount(self.section_of_row[mask], minlength=len(self.section_doc)) > 0
+        docs = _top(doc_scores, doc_fanout)
+
+        sections = np.flatnonzero(np.isin(self.section_doc, docs))
+        if section_allowed is not None:
+            sections = sections[section_allowed[sections]]
+        section_scores = self.section_centroids[sections] @ query_vector
+        sections = sections[_top(section_scores, section_fanout)]
+
+        rows = np.concatenate([
+            self.section_rows[self.section_offsets[s]:self.section_offsets[s + 1]] for s in sections
+        ]) if len(sections) else np.empty(0, dtype=np.int64)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows
+
+
+def _top(scores, k):
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        return np.argpartition(scores, -k)[-k:]
+    return np.flatnonzero(np.isfinite(scores))
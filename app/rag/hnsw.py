@@ -0,0 +1,341 @@
+"""Pure NumPy HNSW approximate nearest-neighbour index
+
+Hierarchical Navigable Small World graph (Malkov & Yashunin) over the rows of
+a TenantIndex matrix. Vectors are expected to be L2-normalized, so similarity
+is a dot product. The graph stores row positions only; vectors stay in the
+TenantIndex and are never copied.
+
+Indexes are persisted under VECTOR_INDEX_DIR as .npz files and loaded on
+first use. The build is pure Python and takes minutes for large tenants, so
+a missing or stale index is built in a spawned process (never in a request
+worker, where it would hold the GIL) while queries fall back to exact
+search. An flock on <index>.lock makes sure only one process on the host
+builds a given index; the other workers load the saved file once it exists.
+scripts/build_hnsw_index.py builds indexes offline.
+"""
+import os
+import heapq
+import math
+import fcntl
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+
+
+class HNSWIndex:
+    """HNSW graph over row positions of a normalized float32 matrix"""
+
+    def __init__(self, matrix, M=16, ef_construction=100, seed=42):
+        self.matrix = matrix
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.level_mult = 1 / math.log(M)
+        self.rng = np.random.default_rng(seed)
+
+        self.levels = np.zeros(len(matrix), dtype=np.int8)
+        self.entry_point = -1
+        self.max_level = -1
+
+        # Build-time adjacency: one dict {node: [neighbours]} per layer
+        self._graph = []
+        # Frozen adjacency: per layer an (n, width) int32 array and per-row counts
+        self._layers = None
+        self._counts = None
+
+    def __len__(self):
+        return len(self.levels)
+
+    @property
+    def nbytes(self):
+        """Graph bytes (the vectors belong to the tenant matrix)"""
+        return self.levels.nbytes + sum(a.nbytes for a in (self._layers or []) + (self._counts or []))
+
+    # ------------------------------------------------------------------
+    # Graph access
+    # ------------------------------------------------------------------
+
+    def _neighbors(self, layer, node):
+        if self._layers is not None:
+            return self._layers[layer][node, :self._counts[layer][node]].tolist()
+        return self._graph[layer].get(node, ())
+
+    def _search_layer(self, query, entry_points, ef, layer):
+        """Best-first search on one layer, returns up to ef (similarity, node) pairs"""
+        visited = set(entry_points)
+        sims = self.matrix[list(entry_points)] @ query
+        candidates = [(-s, n) for s, n in zip(sims.tolist(), entry_points)]
+        results = [(s, n) for s, n in zip(sims.tolist(), entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            fresh = [n for n in self._neighbors(layer, node) if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            fresh_sims = (self.matrix[fresh] @ query).tolist()
+            for n, s in zip(fresh, fresh_sims):
+                if len(results) < ef or s > results[0][0]:
+                    heapq.heappush(candidates, (-s, n))
+                    heapq.heappush(results, (s, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select_neighbors(self, candidates, m):
+        """HNSW heuristic: prefer candidates that are not closer to an already picked neighbour"""
+        candidates = sorted(candidates, reverse=True)
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+
+        nodes = [node for _, node in candidates]
+        vectors = self.matrix[nodes]
+        pairwise = vectors @ vectors.T
+
+        picked = []
+        pruned = []
+        for i, (sim, _) in enumerate(candidates):
+            if len(picked) >= m:
+                break
+            if picked and pairwise[i, picked].max() > sim:
+                pruned.append(i)
+                continue
+            picked.append(i)
+        # Keep pruned connections to fill up the degree budget
+        picked.extend(pruned[:m - len(picked)])
+        return [nodes[i] for i in picked]
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    def build(self):
+        """Insert every row of the matrix"""
+        for node in range(len(self.matrix)):
+            self._insert(node)
+        self._freeze()
+        return self
+
+    def _insert(self, node):
+        level = int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+        self.levels[node] = min(level, 127)
+        while len(self._graph) <= level:
+            self._graph.append({})
+
+        if self.entry_point < 0:
+            for l in range(level + 1):
+                self._graph[l][node] = []
+            self.entry_point, self.max_level = node, level
+            return
+
+        query = self.matrix[node]
+        entry = [self.entry_point]
+        for l in range(self.max_level, level, -1):
+            entry = [max(self._search_layer(query, entry, 1, l))[1]]
+
+        for l in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(query, entry, self.ef_construction, l)
+            width = self.M0 if l == 0 else self.M
+            neighbors = self._select_neighbors(found, self.M)
+            self._graph[l][node] = list(neighbors)
+            for n in neighbors:
+                links = self._graph[l][n]
+                links.append(node)
+                if len(links) > width:
+                    sims = (self.matrix[links] @ self.matrix[n]).tolist()
+                    self._graph[l][n] = self._select_neighbors(list(zip(sims, links)), width)
+            entry = [n for _, n in found]
+
+        for l in range(self.max_level + 1, level + 1):
+            self._graph[l][node] = []
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def _freeze(self):
+        """Convert build-time dicts into padded int32 arrays"""
+        n = len(self.matrix)
+        layers, counts = [], []
+        for l, graph in enumerate(self._graph):
+            width = self.M0 if l == 0 else self.M
+            adj = np.full((n, width), -1, dtype=np.int32)
+            cnt = np.zeros(n, dtype=np.int32)
+            for node, links in graph.items():
+                adj[node, :len(links)] = links
+                cnt[node] = len(links)
+            layers.append(adj)
+            counts.append(cnt)
+        self._layers, self._counts = layers, counts
+        self._graph = []
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def search(self, query, k, ef_search=64):
+        """Approximate top-k: returns (positions, similarities), best first"""
+        if self.entry_point < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        entry = [self.entry_point]
+        for l in range(self.max_level, 0, -1):
+            entry = [max(self._search_layer(query, entry, 1, l))[1]]
+
+        found = sorted(self._search_layer(query, entry, max(ef_search, k), 0), reverse=True)[:k]
+        positions = np.array([n for _, n in found], dtype=np.int64)
+        sims = np.array([s for s, _ in found], dtype=np.float32)
+        return positions, sims
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path, ids, signature):
+        """Write the graph (not the vectors) to an .npz file, atomically"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            'ids': ids,
+            'signature': np.asarray(signature, dtype=np.int64),
+            'levels': self.levels,
+            'meta': np.array([self.entry_point, self.max_level, self.M, self.ef_construction], dtype=np.int64),
+        }
+        for l, (adj, cnt) in enumerate(zip(self._layers, self._counts)):
+            arrays[f'layer_{l}'] = adj
+            arrays[f'count_{l}'] = cnt
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, matrix, ids, signature):
+        """Load a saved graph if it was built for exactly these ids, else None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if tuple(data['signature'].tolist()) != tuple(signature):
+                return None
+            if not np.array_equal(data['ids'], ids):
+                return None
+            entry_point, max_level, M, ef_construction = data['meta'].tolist()
+            index = cls(matrix, M=M, ef_construction=ef_construction)
+            index.levels = data['levels']
+            index.entry_point, index.max_level = entry_point, max_level
+            n_layers = max_level + 1
+            index._layers = [data[f'layer_{l}'] for l in range(n_layers)]
+            index._counts = [data[f'count_{l}'] for l in range(n_layers)]
+        return index
+
+
+def index_path(index_dir, producer_id, model_id):
+    return os.path.join(index_dir, f"producer_{producer_id}_model_{model_id or 'all'}.npz")
+
+
+_builds_lock = threading.Lock()
+_builds_in_progress = set()
+
+
+def _try_lock(path):
+    """Exclusive non-blocking flock on path.lock: the open fd, or None if another process holds it"""
+    fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _build_locked(path):
+    """True while some process on this host builds the index at path"""
+    fd = _try_lock(path)
+    if fd is None:
+        return True
+    os.close(fd)
+    return False
+
+
+def build_index_file(path, matrix, ids, signature, M=16, ef_construction=100):
+    """Build and save the graph under the cross-process lock; False if another process is building it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = _try_lock(path)
+    if fd is None:
+        return False
+    try:
+        # A concurrent builder may have finished between our check and the lock
+        if HNSWIndex.load(path, matrix, ids, signature) is None:
+            HNSWIndex(matrix, M=M, ef_construction=ef_construction).build().save(path, ids, signature)
+        return True
+    finally:
+        os.close(fd)
+
+
+def _build_process(matrix_path, ids, path, signature, M, ef_construction):
+    """Spawned process: build from the matrix the worker saved (memory-mapped, not copied)"""
+    try:
+        build_index_file(path, np.load(matrix_path, mmap_mode='r'), ids, signature, M, ef_construction)
+    finally:
+        os.remove(matrix_path)
+
+
+def get_ann_index(tenant_index, index_dir, M=16, ef_construction=100):
+    """Return the tenant's HNSW index, loading it from disk or building it in a separate process
+
+    Returns None while a build is in progress; callers use exact search meanwhile.
+    """
+    ann = getattr(tenant_index, 'ann', None)
+    if ann is not None:
+        return ann
+
+    path = index_path(index_dir, tenant_index.producer_id, tenant_index.model_id)
+    key = (path, tenant_index.signature)
+    with _builds_lock:
+        if key in _builds_in_progress:
+            return None
+        ann = HNSWIndex.load(path, tenant_index.matrix, tenant_index.ids, tenant_index.signature)
+        if ann is not None:
+            tenant_index.ann = ann
+            return ann
+        os.makedirs(index_dir, exist_ok=True)
+        if _build_locked(path):
+            # Another worker is building it; load the file once it is saved
+            return None
+        _builds_in_progress.add(key)
+
+    def build():
+        failed = False
+        try:
+            print(f"🕸️  Building HNSW index: producer={tenant_index.producer_id}, "
+                  f"model={tenant_index.model_id}, {len(tenant_index)} vectors")
+            fd, matrix_path = tempfile.mkstemp(suffix='.npy', dir=index_dir)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, tenant_index.matrix)
+            process = multiprocessing.get_context('spawn').Process(
+                target=_build_process, daemon=True,
+                args=(matrix_path, tenant_index.ids, path, tuple(tenant_index.signature), M, ef_construction)
+            )
+            process.start()
+            process.join()
+            failed = process.exitcode != 0
+            ann = HNSWIndex.load(path, tenant_index.matrix, tenant_index.ids, tenant_index.signature)
+            if ann is not None:
+                tenant_index.ann = ann
+                print(f"✅ HNSW index saved: {path}")
+            elif failed:
+                print(f"HNSW build error: builder exited with {process.exitcode}")
+        except Exception as e:
+            failed = True
+            print(f"HNSW build error: {e}")
+        finally:
+            # A failed build is not retried for this corpus version
+            if not failed:
+                with _builds_lock:
+                    _builds_in_progress.discard(key)
+
+    threading.Thread(target=build, daemon=True).start()
+    return None
@@ -0,0 +1,526 @@
+"""Per-tenant in-memory embedding index
+
+Keeps one contiguous, L2-normalized float32 matrix per (producer_id, model_id)
+plus a parallel array of DocumentChunk ids, so a query is scored with a single
+matrix-vector product instead of parsing every stored embedding.
+
+The index is rebuilt lazily when its corpus signature (chunk count + max
+chunk id) no longer matches. The signature query scans the tenant's chunks,
+so a cached index is only revalidated when this worker has seen a corpus
+change for the producer (index generations, app.rag.generations) or when
+it was last validated more than VECTOR_CACHE_REVALIDATE_SECONDS ago
+(GENERATION_POLL_INTERVAL while no listener is running).
+
+Document attributes (model_id, doc_type, language, is_latest, document_id)
+are kept as per-row codes next to the matrix, so any filter combination is a
+boolean mask applied before scoring. Attribute edits (e.g. a manual marked
+superseded) only refresh the masks, never the matrix.
+"""
+import time
+import threading
+import numpy as np
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import aliased
+from app import db
+from app.models.document import DocumentChunk, Document
+from flask import current_app
+from app.rag.codec import EMBEDDING_DTYPE, decode_embedding, decode_embeddings, parse_json_embedding
+from app.rag.quantization import quantize
+from app.rag.hierarchy import Hierarchy, SECTION_CHUNKS
+from app.rag.segment_store import get_segment_store
+from app.rag.memory_budget import memory_budget
+from app.rag.generations import generation, listening
+
+
+def normalize_query(query_embedding):
+    """Return the query as a unit-length float32 vector"""
+    vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector
+
+
+# Legacy JSON embedding, only for rows without the binary column: backfilled
+# rows still hold both and would otherwise ship ~5x their vector bytes
+LEGACY_EMBEDDING = case(
+    (DocumentChunk.embedding_vec.is_(None), DocumentChunk.embedding)
+).label('embedding')
+
+
+def _tenant_filter(query, producer_id, model_id):
+    """Restrict a DocumentChunk query to one tenant (denormalized columns, no join)"""
+    query = query.filter(DocumentChunk.producer_id == producer_id)
+    if model_id:
+        query = query.filter(DocumentChunk.model_id == model_id)
+    return query
+
+
+def _join_documents(query):
+    return query.join(Document, DocumentChunk.document_id == Document.id)
+
+
+# Filterable chunk / Document attributes, as search filter keys
+FILTER_FIELDS = {
+    'model_id': DocumentChunk.model_id,
+    'doc_type': Document.doc_type,
+    'language': Document.language,
+    'is_latest': Document.is_latest,
+    'document_id': DocumentChunk.document_id,
+}
+
+# Superseded document versions are excluded unless a caller asks for them
+DEFAULT_FILTERS = {'is_latest': True}
+
+
+def resolve_filters(filters=None):
+    """Merge caller filters over the defaults; a None value drops that filter"""
+    merged = dict(DEFAULT_FILTERS)
+    merged.update(filters or {})
+    unknown = set(merged) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown search filter: {', '.join(sorted(unknown))}")
+    return {field: value for field, value in merged.items() if value is not None}
+
+
+def filter_documents(query, filters, columns=None):
+    """Apply resolved filters to a DocumentChunk query, joining Document only if one needs it
+
+    Queries over another table that already joins Document (code lookups)
+    pass their own columns for the chunk-level fields.
+    """
+    if columns is None:
+        columns = FILTER_FIELDS
+        if any(FILTER_FIELDS[field].class_ is Document for field in filters):
+            query = _join_documents(query)
+    for field, value in filters.items():
+        column = columns[field]
+        accepted = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if field == 'is_latest' and True in accepted:
+            # Documents created before versioning have is_latest NULL
+            query = query.filter(or_(column.in_(accepted), column.is_(None)))
+        else:
+            query = query.filter(column.in_(accepted))
+    return query
+
+
+def corpus_signature(producer_id, model_id=None, embedded_only=True):
+    """Cheap fingerprint of a tenant corpus, changes when (embedded) chunks are added or removed"""
+    query = _tenant_filter(
+        db.session.query(func.count(DocumentChunk.id), func.max(DocumentChunk.id)),
+        producer_id, model_id
+    )
+    if embedded_only:
+        query = query.filter(or_(DocumentChunk.embedding_vec.isnot(None), DocumentChunk.embedding.isnot(None)))
+    count, max_id = query.one()
+    return (count or 0, max_id or 0)
+
+
+def tenant_signatures(producer_id, model_id=None):
+    """(corpus signature, document stamp) in a single round trip
+
+    The stamp changes whenever the producer's documents are added, removed or
+    edited, which may change attribute masks without touching any embedding.
+    """
+    docs = aliased(Document)
+    doc_count = select(func.count(docs.id)).where(docs.producer_id == producer_id).scalar_subquery()
+    doc_updated = select(func.max(docs.updated_at)).where(docs.producer_id == producer_id).scalar_subquery()
+    query = _tenant_filter(
+        db.session.query(func.count(DocumentChunk.id), func.max(DocumentChunk.id), doc_count, doc_updated),
+        producer_id, model_id
+    ).filter(or_(DocumentChunk.embedding_vec.isnot(None), DocumentChunk.embedding.isnot(None)))
+    count, max_id, n_docs, updated = query.one()
+    return (count or 0, max_id or 0), (n_docs or 0, str(updated))
+
+
+def still_valid(validated, producer_id):
+    """True when a cached index checked at (generation, monotonic time) needs no new signature query"""
+    if validated is None:
+        return False
+    seen, checked_at = validated
+    config = current_app.config
+    max_age = (config.get('VECTOR_CACHE_REVALIDATE_SECONDS', 60) if listening()
+               else config.get('GENERATION_POLL_INTERVAL', 2.0))
+    return seen == generation(producer_id) and time.monotonic() - checked_at < max_age
+
+
+def _attribute_value(field, value):
+    # Documents created before versioning have is_latest NULL: treat as current
+    if field == 'is_latest':
+        return value is None or bool(value)
+    return value
+
+
+class AttributeMasks:
+    """Document attributes of every index row, encoded as small integer codes
+
+    A filter value becomes a boolean mask with one vectorized comparison;
+    combined masks are memoized per filter combination.
+    """
+    MAX_CACHED = 64
+
+    def __init__(self, ids, rows, stamp):
+        self.stamp = stamp
+        self.codes = {}
+        self.values = {}
+        self._cache = {}
+
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        rows = list(rows)
+        chunk_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        found = np.searchsorted(sorted_ids, chunk_ids)
+        found = np.minimum(found, max(len(ids) - 1, 0))
+        present = sorted_ids[found] == chunk_ids if len(ids) else np.zeros(len(rows), dtype=bool)
+        positions = order[found[present]]
+
+        for column, field in enumerate(FILTER_FIELDS, start=1):
+            lookup = {}
+            raw = [_attribute_value(field, row[column]) for row, keep in zip(rows, present) if keep]
+            codes = np.full(len(ids), -1, dtype=np.int32)
+            codes[positions] = [lookup.setdefault(value, len(lookup)) for value in raw]
+            self.codes[field] = codes
+            self.values[field] = lookup
+
+    @property
+    def nbytes(self):
+        return (sum(codes.nbytes for codes in self.codes.values())
+                + sum(mask.nbytes for mask in self._cache.values() if mask is not None))
+
+    def mask(self, filters):
+        """Boolean row mask for resolved filters, None when nothing is filtered
+
+        Values may be a scalar or a list/tuple/set of accepted values.
+        """
+        if not filters:
+            return None
+        key = tuple(sorted(
+            (field, tuple(sorted(map(str, value))) if isinstance(value, (list, tuple, set)) else str(value))
+            for field, value in filters.items()
+        ))
+        mask = self._cache.get(key)
+        if mask is not None:
+            return mask
+
+        mask = None
+        for field, value in filters.items():
+            accepted = value if isinstance(value, (list, tuple, set)) else [value]
+            codes = [self.values[field][v] for v in accepted if v in self.values[field]]
+            field_mask = np.isin(self.codes[field], codes)
+            mask = field_mask if mask is None else mask & field_mask
+
+        if len(self._cache) >= self.MAX_CACHED:
+            self._cache.clear()
+        self._cache[key] = mask
+        return mask
+
+
+def build_masks(producer_id, model_id, ids, stamp):
+    """Attribute masks aligned with a tenant's index rows, one query over the tenant's chunks"""
+    rows = _tenant_filter(
+        _join_documents(db.session.query(DocumentChunk.id, *FILTER_FIELDS.values())),
+        producer_id, model_id
+    )
+    return AttributeMasks(ids, rows, stamp)
+
+
+class TenantIndex:
+    """Normalized embedding matrix for one (producer_id, model_id)"""
+
+    def __init__(self, producer_id, model_id, ids, matrix, signature):
+        self.producer_id = producer_id
+        self.model_id = model_id
+        self.ids = ids
+        self.matrix = matrix
+        self.signature = signature
+        # Approximate index (app.rag.hnsw), attached once loaded or built
+        self.ann = None
+        # Quantized codes (app.rag.quantization); matrix may then be dropped
+        self.codes = None
+        self._vector_loader = None
+        # Document attribute masks (AttributeMasks), refreshed independently of the matrix
+        self.masks = None
+        # Shared memory copy for sharded scoring (app.rag.sharding), created on demand
+        self.shared = None
+        self._id_order = None
+        # Document/section centroids (app.rag.hierarchy), built on first use
+        self._hierarchy = None
+        # Fork-shared ids/matrix block (app.rag.preload) backing this index
+        self.block = None
+        # (generation, monotonic time) of the last signature check
+        self.validated = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def memory_usage(self):
+        """(heap bytes, mapped bytes); memory-mapped matrices live in the page cache"""
+        heap, mapped = 0, 0
+        for array in (self.ids, self.matrix):
+            if array is None:
+                continue
+            if isinstance(array, np.memmap) or self.block is not None:
+                mapped += array.nbytes
+            else:
+                heap += array.nbytes
+        for part in (self.codes, self.ann, self.masks, self._hierarchy, self.shared):
+            if part is not None:
+                heap += part.nbytes
+        if self._id_order is not None:
+            heap += self._id_order.nbytes
+        return heap, mapped
+
+    def hierarchy(self, section_chunks=SECTION_CHUNKS):
+        """Coarse-to-fine centroids, None when the index has no full-precision matrix"""
+        if self._hierarchy is None and self.matrix is not None and self.masks is not None and len(self):
+            doc_labels = self.masks.codes['document_id'].astype(np.int64)
+            doc_labels[doc_labels < 0] = doc_labels.max() + 1
+            self._hierarchy = Hierarchy(self.matrix, doc_labels, section_chunks)
+        return self._hierarchy
+
+    def positions_of(self, chunk_ids):
+        """Row positions of chunk ids, -1 where a chunk is not in the index"""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        sorted_ids = self.ids[self._id_order]
+        found = np.minimum(np.searchsorted(sorted_ids, chunk_ids), max(len(sorted_ids) - 1, 0))
+        if not len(sorted_ids):
+            return np.full(len(chunk_ids), -1, dtype=np.int64)
+        return np.where(sorted_ids[found] == chunk_ids, self._id_order[found], -1)
+
+    def score(self, query_vector):
+        """Similarity of a normalized query against every row (approximate when quantized)"""
+        if self.codes is not None:
+            return self.codes.score(query_vector)
+        return self.matrix @ query_vector
+
+    def full_vectors(self, positions):
+        """Full-precision rows for rescoring"""
+        if self.matrix is not None:
+            return np.asarray(self.matrix[positions], dtype=np.float32)
+        return self._vector_loader(self.ids[positions])
+
+    def quantize(self, mode):
+        """Replace the in-memory matrix by compact codes
+
+        A memory-mapped matrix is kept for rescoring (it lives in the page
+        cache, not in the worker heap); otherwise rescoring reads the few
+        candidate vectors back from the DB.
+        """
+        self.codes = quantize(self.matrix, mode)
+        if self.codes is not None and not isinstance(self.matrix, np.memmap):
+            self.matrix = None
+            self._vector_loader = load_vectors_by_id
+
+
+def _load_vectors(producer_id, model_id):
+    """Fetch (ids, matrix) for a tenant, decoding binary embeddings with np.frombuffer"""
+    base = _tenant_filter(
+        db.session.query(DocumentChunk.id, DocumentChunk.embedding_vec),
+        producer_id, model_id
+    ).filter(DocumentChunk.embedding_vec.isnot(None)).order_by(DocumentChunk.id)
+
+    ids = []
+    blobs = []
+    for chunk_id, blob in base:
+        if blobs and len(blob) != len(blobs[0]):
+            print(f"⚠️  Chunk {chunk_id} has a different embedding dimension, skipping")
+            continue
+        ids.append(chunk_id)
+        blobs.append(blob)
+    dim = len(blobs[0]) // EMBEDDING_DTYPE.itemsize if blobs else 0
+    matrix = decode_embeddings(blobs, dim)
+
+    # Rows not yet backfilled into the binary column still carry JSON
+    legacy = _tenant_filter(
+        db.session.query(DocumentChunk.id, DocumentChunk.embedding),
+        producer_id, model_id
+    ).filter(
+        DocumentChunk.embedding_vec.is_(None),
+        DocumentChunk.embedding.isnot(None)
+    ).order_by(DocumentChunk.id)
+
+    legacy_ids = []
+    legacy_vectors = []
+    for chunk_id, embedding in legacy:
+        vector = parse_json_embedding(embedding)
+        if not vector or (dim and len(vector) != dim):
+            continue
+        dim = dim or len(vector)
+        legacy_ids.append(chunk_id)
+        legacy_vectors.append(vector)
+
+    if legacy_vectors:
+        legacy_matrix = np.asarray(legacy_vectors, dtype=np.float32)
+        matrix = np.vstack([matrix.reshape(-1, dim), legacy_matrix]) if len(ids) else legacy_matrix
+        ids.extend(legacy_ids)
+
+    return np.asarray(ids, dtype=np.int64), matrix
+
+
+def _normalized(matrix):
+    matrix = np.array(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def _load_from_segments(store, producer_id, model_id, signature):
+    """Memory-mapped vectors from the segment store, reseeded from the DB if out of sync"""
+    loaded = store.load(producer_id, model_id)
+    if loaded is not None and signature is not None:
+        ids, matrix = loaded
+        count, max_id = signature
+        if len(ids) == count and (not count or int(ids.max()) == max_id):
+            return ids, matrix
+
+    print(f"💾 Seeding segment store from DB: producer={producer_id}, model={model_id}")
+    ids, matrix = _load_vectors(producer_id, model_id)
+    if not len(ids):
+        return None
+    store.replace(producer_id, model_id, ids, matrix)
+    return store.load(producer_id, model_id)
+
+
+def load_vectors_by_id(chunk_ids):
+    """Normalized float32 vectors for the given chunk ids, in the same order"""
+    chunk_ids = [int(i) for i in chunk_ids]
+    rows = db.session.query(
+        DocumentChunk.id, DocumentChunk.embedding_vec, LEGACY_EMBEDDING
+    ).filter(DocumentChunk.id.in_(chunk_ids)).all()
+    by_id = {}
+    for chunk_id, blob, embedding in rows:
+        if blob is not None:
+            by_id[chunk_id] = decode_embedding(blob)
+        else:
+            by_id[chunk_id] = np.asarray(parse_json_embedding(embedding), dtype=np.float32)
+    return _normalized([by_id[i] for i in chunk_ids])
+
+
+def quantization_mode(producer_id):
+    config = current_app.config
+    return config['VECTOR_QUANTIZATION_TENANTS'].get(producer_id, config['VECTOR_QUANTIZATION'])
+
+
+def build_index(producer_id, model_id, signature, stamp=None):
+    """Load all embeddings for a tenant into a contiguous, normalized float32 matrix"""
+    index = _build_matrix(producer_id, model_id, signature)
+    index.masks = build_masks(producer_id, model_id, index.ids, stamp)
+    return index
+
+
+def _build_matrix(producer_id, model_id, signature):
+    store = get_segment_store()
+    if store is not None:
+        loaded = _load_from_segments(store, producer_id, model_id, signature)
+        if loaded is not None:
+            # Segment vectors are stored normalized; keep the memory map as-is
+            ids, matrix = loaded
+            index = TenantIndex(producer_id, model_id, np.asarray(ids), matrix, signature)
+            index.quantize(quantization_mode(producer_id))
+            return index
+
+    ids, matrix = _load_vectors(producer_id, model_id)
+
+    if not len(ids):
+        return TenantIndex(producer_id, model_id, np.empty(0, dtype=np.int64),
+                           np.empty((0, 0), dtype=np.float32), signature)
+
+    index = TenantIndex(producer_id, model_id, ids, _normalized(matrix), signature)
+    index.quantize(quantization_mode(producer_id))
+    return index
+
+
+class IndexCache:
+    """Process-wide cache of TenantIndex objects"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        # Tenants whose matrices live in fork-shared blocks (app.rag.preload)
+        self._shared = set()
+
+    def _build_lock(self, key):
+        with self._lock:
+            lock = self._build_locks.get(key)
+            if lock is None:
+                lock = self._build_locks[key] = threading.Lock()
+            return lock
+
+    def share(self, producer_id, model_id=None):
+        """Build this tenant into shared memory from now on"""
+        self._shared.add((producer_id, model_id or None))
+
+    def get(self, producer_id, model_id=None):
+        """Return a fresh index for the tenant, building it on first use or after changes"""
+        key = (producer_id, model_id or None)
+        index = self._indexes.get(key)
+        if index is not None and still_valid(index.validated, producer_id):
+            memory_budget.record(producer_id, 'vectors', key, *index.memory_usage(), hit=True)
+            return index
+
+        # Read before the signature: a change committed meanwhile triggers another check
+        seen = generation(producer_id)
+        signature, stamp = tenant_signatures(producer_id, model_id)
+        index = self._indexes.get(key)
+        if index is not None and index.signature == signature and index.masks.stamp == stamp:
+            index.validated = (seen, time.monotonic())
+            memory_budget.record(producer_id, 'vectors', key, *index.memory_usage(), hit=True)
+            return index
+
+        # Only one request builds a given tenant; the others wait and reuse it
+        with self._build_lock(key):
+            index = self._indexes.get(key)
+            if index is not None and index.signature == signature:
+                if index.masks.stamp != stamp:
+                    print(f"🏷️  Refreshing attribute masks: producer={producer_id}, model={model_id}")
+                    index.masks = build_masks(producer_id, model_id, index.ids, stamp)
+                    index._hierarchy = None
+                index.validated = (seen, time.monotonic())
+                memory_budget.record(producer_id, 'vectors', key, *index.memory_usage(), hit=True)
+                return index
+            print(f"🧱 Building embedding index: producer={producer_id}, model={model_id}")
+            if key in self._shared:
+                from app.rag.preload import build_shared_index
+                index = build_shared_index(producer_id, model_id, signature, stamp)
+            else:
+                index = build_index(producer_id, model_id, signature, stamp)
+            index.validated = (seen, time.monotonic())
+            # Swapped in one assignment; in-flight queries keep the old index
+            self._indexes[key] = index
+            print(f"✅ Index ready: {len(index)} vectors")
+            memory_budget.record(producer_id, 'vectors', key, *index.memory_usage(), hit=False)
+            return index
+
+    def peek(self, producer_id, model_id=None):
+        """The cached index if one is loaded (possibly stale), without building"""
+        return self._indexes.get((producer_id, model_id or None))
+
+    def invalidate(self, producer_id, model_id=None):
+        """Drop cached indexes for a producer (optionally one model and the all-models view)"""
+        dropped = []
+        with self._lock:
+            for key in list(self._indexes):
+                if key[0] != producer_id:
+                    continue
+                if model_id is None or key[1] in (model_id, None):
+                    del self._indexes[key]
+                    dropped.append(key)
+                    if key in self._shared:
+                        from app.rag.preload import remove_blocks
+                        remove_blocks(*key)
+        memory_budget.forget(producer_id, 'vectors', dropped)
+
+    def evict(self, producer_id):
+        """Free a tenant's indexes for the memory budget (rebuilt on next use)"""
+        with self._lock:
+            for key in [k for k in self._indexes if k[0] == producer_id]:
+                del self._indexes[key]
+
+
+index_cache = IndexCache()
+memory_budget.register('vectors', index_cache.evict)
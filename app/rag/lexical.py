@@ -0,0 +1,350 @@
+"""Per-tenant BM25 lexical index over DocumentChunk.chunk_text
+
+Embeddings are poor at exact tokens ("E42", "AMK-X500-12"), so retrieval
+fuses vector results with BM25 using reciprocal rank fusion.
+
+Storage is compact: the bulk of the postings is a CSR layout (term offsets
+plus flat uint32 row / tf arrays); chunks added at ingest go into small
+per-term array('I') deltas that are merged back into the CSR arrays once
+they grow past a fraction of the base.
+"""
+import re
+import math
+import time
+import threading
+from array import array
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models.document import DocumentChunk
+from app.rag.index_cache import _tenant_filter, corpus_signature, still_valid, build_masks
+from app.rag.generations import generation
+from app.rag.memory_budget import memory_budget
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with',
+    'is', 'are', 'was', 'were', 'what', 'does', 'do', 'how', 'why', 'when', 'which',
+    'mean', 'means', 'this', 'that', 'it', 'be', 'can', 'i', 'my', 'me',
+}
+
+# Merge deltas into the CSR arrays once they hold this share of the postings
+DELTA_MERGE_RATIO = 0.1
+
+
+def tokenize(text):
+    """Lowercase word tokens; compound codes also yield their joined form and parts
+
+    'E-1' -> ['e-1', 'e1', 'e', '1'] so 'E1', 'e-1' and 'E 1' all meet.
+    """
+    tokens = []
+    for match in TOKEN_RE.findall(text.lower()):
+        tokens.append(match)
+        parts = re.split(r"[-_./]", match)
+        if len(parts) > 1:
+            tokens.append(''.join(parts))
+            tokens.extend(parts)
+    return tokens
+
+
+def query_terms(text):
+    return [t for t in tokenize(text) if t not in STOP_WORDS]
+
+
+def is_code_token(token):
+    """Error codes and part numbers mix letters and digits"""
+    return any(c.isdigit() for c in token) and any(c.isalpha() for c in token)
+
+
+def code_terms(text):
+    """(content words, codes) of a question, codes in their joined form ('E-1' -> 'e1')"""
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOP_WORDS]
+    codes = [re.sub(r"[-_./]", '', w) for w in words if is_code_token(w)]
+    return words, codes
+
+
+class LexicalIndex:
+    """BM25 index for one (producer_id, model_id)"""
+
+    def __init__(self, producer_id, model_id, signature, k1=1.2, b=0.75):
+        self.producer_id = producer_id
+        self.model_id = model_id
+        self.signature = signature
+        self.k1 = k1
+        self.b = b
+        # (generation, monotonic time) of the last signature check
+        self.validated = None
+
+        self.vocab = {}
+        self.chunk_ids = array('q')
+        self.doc_lengths = array('I')
+        self.total_length = 0
+
+        # CSR base: postings of term t are rows[offsets[t]:offsets[t + 1]]
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint32)
+        # Deltas: term_id -> (array('I') rows, array('I') tfs)
+        self.delta = {}
+        self.delta_size = 0
+        # Document attribute masks over the rows, stamped (rows, generation)
+        self._masks = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def nbytes(self):
+        return (self.offsets.nbytes + self.rows.nbytes + self.tfs.nbytes
+                + self.chunk_ids.itemsize * len(self.chunk_ids)
+                + self.doc_lengths.itemsize * len(self.doc_lengths)
+                + 8 * self.delta_size
+                + (self._masks.nbytes if self._masks is not None else 0))
+
+    def add(self, chunk_ids, texts):
+        """Index new chunks (incremental, used at ingest)"""
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                row = len(self.chunk_ids)
+                counts = {}
+                for token in tokenize(text or ''):
+                    counts[token] = counts.get(token, 0) + 1
+                self.chunk_ids.append(int(chunk_id))
+                length = sum(counts.values())
+                self.doc_lengths.append(length)
+                self.total_length += length
+                for token, tf in counts.items():
+                    term_id = self.vocab.setdefault(token, len(self.vocab))
+                    rows, tfs = self.delta.setdefault(term_id, (array('I'), array('I')))
+                    rows.append(row)
+                    tfs.append(tf)
+                    self.delta_size += 1
+            if self.delta_size > DELTA_MERGE_RATIO * max(len(self.rows), 1):
+                self._merge()
+
+    def _merge(self):
+        """Fold deltas into the CSR arrays"""
+        n_terms = len(self.vocab)
+        base_counts = np.diff(self.offsets)
+        counts = np.zeros(n_terms, dtype=np.int64)
+        counts[:len(base_counts)] = base_counts
+        for term_id, (rows, _) in self.delta.items():
+            counts[term_id] += len(rows)
+
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        new_rows = np.empty(offsets[-1], dtype=np.uint32)
+        new_tfs = np.empty(offsets[-1], dtype=np.uint32)
+        for term_id in range(n_terms):
+            start = offsets[term_id]
+            if term_id < len(base_counts):
+                base_start, base_end = self.offsets[term_id], self.offsets[term_id + 1]
+                size = base_end - base_start
+                new_rows[start:start + size] = self.rows[base_start:base_end]
+                new_tfs[start:start + size] = self.tfs[base_start:base_end]
+                start += size
+            if term_id in self.delta:
+                rows, tfs = self.delta[term_id]
+                new_rows[start:start + len(rows)] = np.frombuffer(rows, dtype=np.uint32)
+                new_tfs[start:start + len(tfs)] = np.frombuffer(tfs, dtype=np.uint32)
+
+        self.offsets, self.rows, self.tfs = offsets, new_rows, new_tfs
+        self.delta = {}
+        self.delta_size = 0
+
+    def _postings(self, term_id):
+        rows = [self.rows[self.offsets[term_id]:self.offsets[term_id + 1]]] if term_id + 1 < len(self.offsets) else []
+        tfs = [self.tfs[self.offsets[term_id]:self.offsets[term_id + 1]]] if rows else []
+        if term_id in self.delta:
+            delta_rows, delta_tfs = self.delta[term_id]
+            rows.append(np.frombuffer(delta_rows, dtype=np.uint32))
+            tfs.append(np.frombuffer(delta_tfs, dtype=np.uint32))
+        if not rows:
+            return None, None
+        if len(rows) == 1:
+            return rows[0], tfs[0]
+        return np.concatenate(rows), np.concatenate(tfs)
+
+    def filter_mask(self, filters):
+        """Row mask for resolved search filters, None when nothing is filtered
+
+        Built like the vector index masks (one query over the tenant's chunks)
+        and reused until rows are added or the corpus generation changes.
+        """
+        if not filters:
+            return None
+        with self._lock:
+            stamp = (len(self.chunk_ids), generation(self.producer_id))
+            masks = self._masks
+            ids = None
+            if masks is None or masks.stamp != stamp:
+                ids = np.frombuffer(self.chunk_ids, dtype=np.int64).copy()
+        if ids is not None:
+            # Queried outside the lock; searches meanwhile use the old masks
+            masks = self._masks = build_masks(self.producer_id, self.model_id, ids, stamp)
+        return masks.mask(filters)
+
+    def search(self, text, top_k=20, mask=None):
+        """BM25 top-k as (chunk_ids, scores), best first; mask restricts the rows that can match"""
+        with self._lock:
+            n = len(self.chunk_ids)
+            if not n:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            avgdl = self.total_length / n
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            scores = None
+
+            for token in set(query_terms(text)):
+                term_id = self.vocab.get(token)
+                if term_id is None:
+                    continue
+                rows, tfs = self._postings(term_id)
+                if rows is None or not len(rows):
+                    continue
+                df = len(rows)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                tf = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * doc_lengths[rows] / avgdl)
+                if scores is None:
+                    scores = np.zeros(n, dtype=np.float32)
+                scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if scores is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if mask is not None:
+                # Rows added after the mask was built are left out
+                allowed = np.zeros(n, dtype=bool)
+                allowed[:min(len(mask), n)] = mask[:n]
+                scores[~allowed] = 0
+            hits = np.flatnonzero(scores)
+            k = min(top_k, len(hits))
+            top = hits[np.argpartition(scores[hits], -k)[-k:]] if k < len(hits) else hits
+            top = top[np.argsort(-scores[top], kind='stable')]
+            chunk_ids = np.frombuffer(self.chunk_ids, dtype=np.int64)[top]
+            return chunk_ids.copy(), scores[top]
+
+
+def build_lexical_index(producer_id, model_id, signature, k1=1.2, b=0.75):
+    """Tokenize every chunk of a tenant into a fresh index
+
+    Chunks without an embedding are searchable too, so the signature is
+    corpus_signature(..., embedded_only=False) over the same rows.
+    """
+    query = _tenant_filter(
+        db.session.query(DocumentChunk.id, DocumentChunk.chunk_text),
+        producer_id, model_id
+    ).order_by(DocumentChunk.id)
+    index = LexicalIndex(producer_id, model_id, signature, k1=k1, b=b)
+    ids, texts = [], []
+    for chunk_id, text in query.yield_per(2000):
+        ids.append(chunk_id)
+        texts.append(text)
+    index.add(ids, texts)
+    with index._lock:
+        index._merge()
+    return index
+
+
+class LexicalIndexCache:
+    """Process-wide cache of LexicalIndex objects, keyed like the vector index cache"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def _build_lock(self, key):
+        with self._lock:
+            lock = self._build_locks.get(key)
+            if lock is None:
+                lock = self._build_locks[key] = threading.Lock()
+            return lock
+
+    def get(self, producer_id, model_id=None, k1=1.2, b=0.75):
+        key = (producer_id, model_id or None)
+        index = self._indexes.get(key)
+        if index is not None and still_valid(index.validated, producer_id):
+            memory_budget.record(producer_id, 'lexical', key, index.nbytes, hit=True)
+            return index
+
+        # Same revalidation as the vector index cache (app.rag.index_cache)
+        seen = generation(producer_id)
+        signature = corpus_signature(producer_id, model_id, embedded_only=False)
+        index = self._indexes.get(key)
+        if index is not None and index.signature == signature:
+            index.validated = (seen, time.monotonic())
+            memory_budget.record(producer_id, 'lexical', key, index.nbytes, hit=True)
+            return index
+
+        with self._build_lock(key):
+            index = self._indexes.get(key)
+            if index is not None and index.signature == signature:
+                index.validated = (seen, time.monotonic())
+                memory_budget.record(producer_id, 'lexical', key, index.nbytes, hit=True)
+                return index
+            index = build_lexical_index(producer_id, model_id, signature, k1=k1, b=b)
+            index.validated = (seen, time.monotonic())
+            self._indexes[key] = index
+            print(f"🔤 Lexical index ready: producer={producer_id}, model={model_id}, "
+                  f"{len(index)} chunks, {len(index.vocab)} terms")
+            memory_budget.record(producer_id, 'lexical', key, index.nbytes, hit=False)
+            return index
+
+    def add_chunks(self, producer_id, model_id, chunk_ids, texts):
+        """Incrementally index committed chunks in already-loaded tenant indexes"""
+        if not chunk_ids:
+            return
+        for key in ((producer_id, model_id), (producer_id, None)):
+            index = self._indexes.get(key)
+            if index is None:
+                continue
+            index.add(chunk_ids, texts)
+            count, max_id = index.signature
+            index.signature = (count + len(chunk_ids), max(max_id, max(chunk_ids)))
+
+    def invalidate(self, producer_id, model_id=None):
+        dropped = []
+        with self._lock:
+            for key in list(self._indexes):
+                if key[0] == producer_id and (model_id is None or key[1] in (model_id, None)):
+                    del self._indexes[key]
+                    dropped.append(key)
+        memory_budget.forget(producer_id, 'lexical', dropped)
+
+
+lexical_cache = LexicalIndexCache()
+memory_budget.register('lexical', lexical_cache.invalidate)
+
+
+def queue_index(session, producer_id, model_id, chunk_ids, texts):
+    """Add chunks to loaded lexical indexes once the session commits"""
+    session.info.setdefault('lexical_pending', []).append((producer_id, model_id, list(chunk_ids), list(texts)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for producer_id, model_id, chunk_ids, texts in session.info.pop('lexical_pending', []):
+        try:
+            lexical_cache.add_chunks(producer_id, model_id, chunk_ids, texts)
+        except Exception as e:
+            print(f"Lexical index update error: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('lexical_pending', None)
+
+
+def reciprocal_rank_fusion(result_lists, k=60, key='chunk_id'):
+    """Merge ranked result lists: score = sum(1 / (k + rank)) over the lists"""
+    fused = {}
+    items = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, start=1):
+            item_key = item[key]
+            fused[item_key] = fused.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    order = sorted(fused, key=lambda item_key: fused[item_key], reverse=True)
+    return [dict(items[item_key], rrf_score=fused[item_key]) for item_key in order]
@@ -0,0 +1,147 @@
+"""Per-worker memory budget for tenant indexes
+
+Caches report each tenant's resident bytes per component ('vectors': the
+TenantIndex matrix, codes, ANN graph, masks and centroids; 'lexical': BM25
+postings) on every lookup. When the total heap bytes exceed
+INDEX_MEMORY_BUDGET_MB, the least recently used tenants are evicted from
+every cache that registered an evictor. Memory-mapped or fork-shared
+matrices live in the page cache: they are reported as 'mapped' but do not
+count against the budget.
+"""
+import time
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+
+
+class TenantUsage:
+    def __init__(self):
+        self.parts = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_used = time.time()
+
+    @property
+    def heap_bytes(self):
+        return sum(heap for heap, _ in self.parts.values())
+
+    @property
+    def mapped_bytes(self):
+        return sum(mapped for _, mapped in self.parts.values())
+
+
+class MemoryBudget:
+    """LRU accounting of tenant index memory across caches"""
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._tenants = OrderedDict()
+        self._evictors = {}
+        self._lock = threading.Lock()
+
+    def register(self, component, evict):
+        """evict(producer_id) drops a tenant's entries from one cache"""
+        self._evictors[component] = evict
+
+    def _configured_max(self):
+        if has_app_context():
+            self.max_bytes = int(current_app.config.get('INDEX_MEMORY_BUDGET_MB', 0) * 1024 * 1024)
+        return self.max_bytes
+
+    def record(self, producer_id, component, key, heap_bytes, mapped_bytes=0, hit=None):
+        """A cache served (hit) or (re)built (miss) one of a tenant's entries"""
+        with self._lock:
+            usage = self._tenants.get(producer_id)
+            if usage is None:
+                usage = self._tenants[producer_id] = TenantUsage()
+            usage.parts[(component, key)] = (int(heap_bytes), int(mapped_bytes))
+            if hit is True:
+                usage.hits += 1
+            elif hit is False:
+                usage.misses += 1
+            usage.last_used = time.time()
+            self._tenants.move_to_end(producer_id)
+        self._enforce(keep=producer_id)
+
+    def forget(self, producer_id, component, keys=None):
+        """A cache dropped a tenant's entries (all of the component, or the given keys)"""
+        with self._lock:
+            usage = self._tenants.get(producer_id)
+            if usage is not None:
+                usage.parts = {
+                    (c, key): v for (c, key), v in usage.parts.items()
+                    if c != component or (keys is not None and key not in keys)
+                }
+
+    def total_bytes(self):
+        return sum(usage.heap_bytes for usage in self._tenants.values())
+
+    def _enforce(self, keep=None):
+        max_bytes = self._configured_max()
+        if not max_bytes:
+            return
+        while True:
+            with self._lock:
+                if self.total_bytes() <= max_bytes:
+                    return
+                victim = next((p for p, u in self._tenants.items() if p != keep and u.parts), None)
+                if victim is None:
+                    return
+                usage = self._tenants[victim]
+                components = {component for component, _ in usage.parts}
+                freed = usage.heap_bytes
+                usage.parts = {}
+                usage.evictions += 1
+                self.evictions += 1
+            for component in components:
+                evict = self._evictors.get(component)
+                if evict is not None:
+                    try:
+                        evict(victim)
+                    except Exception as e:
+                        print(f"Index eviction error (producer={victim}, {component}): {e}")
+            print(f"♻️  Evicted producer={victim} from memory ({freed / 1e6:.1f} MB, LRU)")
+
+    def report(self, producer_ids=None):
+        """Budget totals, plus per-tenant rows (all, or only the given producers)"""
+        with self._lock:
+            tenants = list(self._tenants.items())
+            max_bytes = self.max_bytes
+            evictions = self.evictions
+        rows = []
+        for producer_id, usage in reversed(tenants):
+            if producer_ids is not None and producer_id not in producer_ids:
+                continue
+            components = {}
+            for (component, _), (heap, mapped) in usage.parts.items():
+                totals = components.setdefault(component, {'heap_bytes': 0, 'mapped_bytes': 0})
+                totals['heap_bytes'] += heap
+                totals['mapped_bytes'] += mapped
+            lookups = usage.hits + usage.misses
+            rows.append({
+                'producer_id': producer_id,
+                'loaded': bool(usage.parts),
+                'heap_bytes': usage.heap_bytes,
+                'mapped_bytes': usage.mapped_bytes,
+                'components': components,
+                'hits': usage.hits,
+                'misses': usage.misses,
+                'hit_rate': round(usage.hits / lookups, 4) if lookups else 0.0,
+                'evictions': usage.evictions,
+                'idle_seconds': round(time.time() - usage.last_used, 1),
+            })
+        used = sum(usage.heap_bytes for _, usage in tenants)
+        return {
+            'budget_bytes': max_bytes,
+            'used_bytes': used,
+            'loaded_tenants': sum(1 for _, usage in tenants if usage.parts),
+            'evictions': evictions,
+            # Sizes without tenant ids, largest first, for capacity planning
+            'tenant_heap_bytes': sorted((usage.heap_bytes for _, usage in tenants if usage.parts), reverse=True),
+            'tenants': rows,
+        }
+
+
+memory_budget = MemoryBudget()
@@ -0,0 +1,159 @@
+"""Fork-shared tenant indexes (gunicorn --preload)
+
+With N workers, every worker normally builds its own copy of each tenant
+matrix. With INDEX_PRELOAD_ENABLED and gunicorn's preload_app, create_app
+loads the hottest tenants (most queries over INDEX_PRELOAD_DAYS) into
+read-only memory maps of files in INDEX_PRELOAD_DIR (tmpfs, /dev/shm by
+default) before the fork, so all workers read the same physical pages.
+
+Preloaded tenants stay shared after changes: the worker that first notices
+a new corpus signature writes a block named after that signature (to a temp
+file, then an atomic rename) and the others map it instead of loading from
+the DB. The cache entry is then swapped for the new index in one
+assignment; queries in flight keep using the old mapping, which stays valid
+after its file is removed.
+"""
+import os
+import glob
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+from flask import current_app
+from app import db
+
+MAGIC = 0x3158444950544D47  # 'GMTPIDX1'
+HEADER = 24
+
+
+def block_name(producer_id, model_id, signature):
+    count, max_id = signature
+    return f"mgpt_idx_{producer_id}_{model_id or 0}_{count}_{max_id}"
+
+
+class SharedBlock:
+    """ids + normalized float32 matrix of one tenant, memory-mapped read-only
+
+    Layout: magic, row count, dim (int64 each), int64 ids, float32 matrix.
+    """
+
+    def __init__(self, path):
+        magic, n, dim = (int(v) for v in np.fromfile(path, dtype=np.int64, count=3))
+        if magic != MAGIC:
+            raise ValueError(f"Not an index block: {path}")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.ids = np.memmap(path, dtype=np.int64, mode='r', offset=HEADER, shape=(n,))
+        self.matrix = np.memmap(path, dtype=np.float32, mode='r', offset=HEADER + 8 * n, shape=(n, dim))
+
+    @property
+    def nbytes(self):
+        return HEADER + self.ids.nbytes + self.matrix.nbytes
+
+    @classmethod
+    def create(cls, directory, name, ids, matrix):
+        """Write a block and publish it atomically; older blocks of the tenant are removed"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(ids), -1)
+        path = os.path.join(directory, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(np.array([MAGIC, *matrix.shape], dtype=np.int64).tobytes())
+            f.write(memoryview(ids))
+            f.write(memoryview(matrix))
+        os.replace(tmp, path)
+        _remove_blocks(directory, name.rsplit('_', 2)[0], keep=path)
+        return cls(path)
+
+    @classmethod
+    def attach(cls, directory, name):
+        """The published block, else None"""
+        path = os.path.join(directory, name)
+        try:
+            return cls(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+def _remove_blocks(directory, prefix, keep=None):
+    for path in glob.glob(os.path.join(directory, f"{prefix}_*")):
+        if path != keep and not path.endswith('.tmp'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def remove_blocks(producer_id, model_id=None):
+    """Unpublish a tenant's blocks (mapped copies stay valid until dropped)"""
+    _remove_blocks(current_app.config['INDEX_PRELOAD_DIR'], f"mgpt_idx_{producer_id}_{model_id or 0}")
+
+
+def build_shared_index(producer_id, model_id, signature, stamp=None):
+    """TenantIndex whose ids and matrix live in a shared block for this signature"""
+    from app.rag.index_cache import TenantIndex, build_masks, build_index, _load_vectors, _normalized
+
+    directory = current_app.config['INDEX_PRELOAD_DIR']
+    name = block_name(producer_id, model_id, signature)
+    block = SharedBlock.attach(directory, name)
+    if block is None:
+        ids, matrix = _load_vectors(producer_id, model_id)
+        if not len(ids):
+            return build_index(producer_id, model_id, signature, stamp)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            block = SharedBlock.create(directory, name, ids, _normalized(matrix))
+        except OSError as e:
+            print(f"⚠️  Shared block {name} unavailable ({e}), using a private copy")
+            return build_index(producer_id, model_id, signature, stamp)
+        print(f"🧷 Shared index block {name}: {block.nbytes / 1e6:.1f} MB")
+    else:
+        print(f"🧷 Attached shared index block {name}")
+
+    index = TenantIndex(producer_id, model_id, block.ids, block.matrix, signature)
+    index.block = block
+    index.masks = build_masks(producer_id, model_id, block.ids, stamp)
+    return index
+
+
+def hot_producers(limit, days):
+    """Producer ids with the most queries over the last days, else the largest corpora"""
+    from app.models.document import DocumentChunk
+    from app.models.query import Query
+
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.session.query(Query.producer_id).filter(Query.created_at >= since).group_by(
+        Query.producer_id
+    ).order_by(func.count(Query.id).desc()).limit(limit).all()
+    if not rows:
+        rows = db.session.query(DocumentChunk.producer_id).group_by(
+            DocumentChunk.producer_id
+        ).order_by(func.count(DocumentChunk.id).desc()).limit(limit).all()
+    return [producer_id for producer_id, in rows]
+
+
+def preload_hot_tenants(app):
+    """Load the hottest tenants into shared blocks (call in the master, before fork)"""
+    from app.rag.index_cache import index_cache
+
+    config = app.config
+    with app.app_context():
+        try:
+            producers = hot_producers(config['INDEX_PRELOAD_TENANTS'], config['INDEX_PRELOAD_DAYS'])
+        except Exception as e:
+            print(f"Index preload skipped: {e}")
+            return []
+        total = 0
+        for producer_id in producers:
+            # Blocks left by a previous run may predate re-embedding; start from the DB
+            remove_blocks(producer_id)
+            index_cache.share(producer_id)
+            try:
+                index = index_cache.get(producer_id)
+                total += index.block.nbytes if index.block is not None else 0
+            except Exception as e:
+                print(f"Index preload error (producer={producer_id}): {e}")
+        db.session.remove()
+        # Workers must not inherit the master's pooled DB connections
+        db.engine.dispose()
+        print(f"🧷 Preloaded {len(producers)} tenants into shared memory ({total / 1e6:.1f} MB)")
+        return producers
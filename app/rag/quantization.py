@@ -0,0 +1,122 @@
+"""Quantized embedding codes for the per-tenant index
+
+Modes (per tenant, see VECTOR_QUANTIZATION / VECTOR_QUANTIZATION_TENANTS):
+    float32  full precision, no codes (default)
+    float16  half precision, 2 bytes/dim
+    int8     per-dimension scalar quantization, 1 byte/dim
+    binary   1 bit/dim sign codes, scored by Hamming distance
+
+Codes only produce a first-pass ranking; the top candidates are rescored
+with full-precision vectors before anything is returned.
+"""
+import numpy as np
+
+MODES = ('float32', 'float16', 'int8', 'binary')
+
+# Rows converted to float32 at a time while scoring, bounds temporary memory
+BLOCK_ROWS = 1024
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class Float16Codes:
+    mode = 'float16'
+
+    def __init__(self, matrix):
+        self.codes = np.asarray(matrix, dtype=np.float16)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def score(self, query):
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ query
+        return scores
+
+
+class Int8Codes:
+    """x ~= offset + scale * code, with offset/scale per dimension"""
+    mode = 'int8'
+
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        low = matrix.min(axis=0)
+        high = matrix.max(axis=0)
+        self.scale = np.maximum(high - low, 1e-12) / 255.0
+        self.offset = low
+        self.codes = np.clip(np.rint((matrix - low) / self.scale), 0, 255).astype(np.uint8)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.nbytes + self.offset.nbytes
+
+    def score(self, query):
+        # q . x = q . offset + (q * scale) . code
+        base = float(query @ self.offset)
+        weights = (query * self.scale).astype(np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ weights
+        return scores + base
+
+
+class BinaryCodes:
+    """Sign bits of mean-centered vectors, packed 8 per byte
+
+    Embeddings share a common offset, so raw signs are mostly identical;
+    centering first makes each bit informative. Higher score = smaller
+    Hamming distance.
+    """
+    mode = 'binary'
+
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.dim = matrix.shape[1]
+        self.center = matrix.mean(axis=0)
+        self.codes = np.empty((len(matrix), (self.dim + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS]
+            self.codes[start:start + BLOCK_ROWS] = np.packbits(block > self.center, axis=1)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.center.nbytes
+
+    def score(self, query):
+        query_bits = np.packbits(np.asarray(query) > self.center)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            xor = np.bitwise_xor(self.codes[start:start + BLOCK_ROWS], query_bits)
+            scores[start:start + BLOCK_ROWS] = _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+        return self.dim - scores
+
+
+_CODECS = {
+    'float16': Float16Codes,
+    'int8': Int8Codes,
+    'binary': BinaryCodes,
+}
+
+
+def quantize(matrix, mode):
+    """Build codes for a normalized matrix, None for full precision"""
+    if mode not in MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode == 'float32' or not len(matrix):
+        return None
+    return _CODECS[mode](matrix)
+
+
+def parse_tenant_modes(value):
+    """Parse '12:int8,15:binary' into {12: 'int8', 15: 'binary'}"""
+    modes = {}
+    for item in (value or '').split(','):
+        if ':' not in item:
+            continue
+        producer_id, mode = item.split(':', 1)
+        modes[int(producer_id.strip())] = mode.strip()
+    return modes
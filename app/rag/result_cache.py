@@ -0,0 +1,102 @@
+"""LRU + TTL cache of retrieval results
+
+After an alarm fires, many operators on the same line ask the same question.
+search_similar results (top-k chunk ids and scores) are cached under
+(producer_id, model_id, hash of the quantized query vector, search options,
+generation). The generation combines the producer's change counter
+(app.rag.generations, bumped by Document / DocumentChunk commits in any
+worker) with the index signature and document stamp, so an entry is never
+served after the corpus it was computed from has changed.
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.rag.generations import on_change
+
+
+def query_key(query_vector):
+    """Hash of a normalized query quantized to int8 (float noise maps to one key)"""
+    quantized = np.round(np.asarray(query_vector, dtype=np.float32) * 127).astype(np.int8)
+    return hashlib.blake2b(quantized.tobytes(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU of (chunk_ids, scores) with per-entry expiry"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # producer_id -> [hits, misses]; keys start with the producer_id
+        self._counts = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            counts = self._counts.setdefault(key[0], [0, 0])
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                counts[1] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            counts[0] += 1
+            return entry[1], entry[2]
+
+    def put(self, key, chunk_ids, scores):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, chunk_ids, scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def configure(self, max_entries, ttl):
+        if (max_entries, ttl) == (self.max_entries, self.ttl):
+            return
+        with self._lock:
+            self.max_entries, self.ttl = max_entries, ttl
+
+    def invalidate(self, producer_id=None):
+        """Drop all entries, or those of one producer"""
+        with self._lock:
+            if producer_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == producer_id]:
+                del self._entries[key]
+
+    def stats(self, producer_id=None):
+        """Counters for the whole cache, or only one producer's entries and lookups"""
+        with self._lock:
+            if producer_id is None:
+                entries, (hits, misses) = len(self._entries), (self.hits, self.misses)
+            else:
+                entries = sum(1 for key in self._entries if key[0] == producer_id)
+                hits, misses = self._counts.get(producer_id, (0, 0))
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+result_cache = ResultCache()
+
+
+@on_change
+def _invalidate_producer(producer_id, model_id):
+    result_cache.invalidate(producer_id)
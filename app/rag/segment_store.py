@@ -0,0 +1,342 @@
+"""Append-only, memory-mapped embedding segment store
+
+Each tenant (producer_id, model_id or 'all') gets a directory under
+SEGMENT_STORE_DIR holding immutable segment files:
+
+    seg_000001.vectors.npy     L2-normalized float32 (rows, dim)
+    seg_000001.ids.npy         int64 DocumentChunk ids
+    seg_000001.tombstones.npy  bool (rows,), only once something was deleted
+    manifest.json              live segments, max chunk id, version
+
+Segments are opened with np.load(mmap_mode='r'), so every gunicorn worker
+shares the same page-cache copy and a cold start does no JSON parsing.
+Uploads are written as small delta segments after the DB commit, deletions
+flip tombstone bits, and a background compaction merges everything back
+into a single segment once there are too many deltas or tombstones.
+"""
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+MANIFEST = 'manifest.json'
+
+
+def _normalize_rows(vectors):
+    matrix = np.array(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class SegmentStore:
+    """File-backed vector segments for every tenant under one root directory"""
+
+    def __init__(self, root, max_segments=8, max_tombstone_ratio=0.2):
+        self.root = root
+        self.max_segments = max_segments
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self._compacting = set()
+        self._compacting_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Layout helpers
+    # ------------------------------------------------------------------
+
+    def tenant_dir(self, producer_id, model_id=None):
+        return os.path.join(self.root, f"producer_{producer_id}", f"model_{model_id or 'all'}")
+
+    def _path(self, tenant_dir, segment, kind):
+        return os.path.join(tenant_dir, f"{segment}.{kind}.npy")
+
+    @contextmanager
+    def _locked(self, tenant_dir):
+        """Exclusive cross-process lock for writers of one tenant"""
+        os.makedirs(tenant_dir, exist_ok=True)
+        with open(os.path.join(tenant_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self, tenant_dir):
+        try:
+            with open(os.path.join(tenant_dir, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'segments': [], 'next_seq': 1, 'max_id': 0, 'version': 0}
+
+    def _write_manifest(self, tenant_dir, manifest):
+        manifest['version'] += 1
+        tmp_path = os.path.join(tenant_dir, f"{MANIFEST}.tmp.{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(tenant_dir, MANIFEST))
+
+    def _save_array(self, path, array):
+        tmp_path = f"{path}.tmp.{os.getpid()}.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    def _write_segment(self, tenant_dir, manifest, ids, matrix):
+        name = f"seg_{manifest['next_seq']:06d}"
+        manifest['next_seq'] += 1
+        self._save_array(self._path(tenant_dir, name, 'vectors'), matrix)
+        self._save_array(self._path(tenant_dir, name, 'ids'), ids)
+        return {'name': name, 'rows': int(len(ids)), 'deleted': 0}
+
+    def _remove_segment_files(self, tenant_dir, name):
+        for kind in ('vectors', 'ids', 'tombstones'):
+            try:
+                os.remove(self._path(tenant_dir, name, kind))
+            except FileNotFoundError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def append(self, producer_id, model_id, ids, vectors):
+        """Write new vectors as a delta segment; ids already in the store are skipped
+
+        Tenants that were never seeded are left alone: the first index build
+        seeds them from the DB, new rows included.
+        """
+        tenant_dir = self.tenant_dir(producer_id, model_id)
+        if not os.path.exists(os.path.join(tenant_dir, MANIFEST)):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._locked(tenant_dir):
+            manifest = self._read_manifest(tenant_dir)
+            fresh = ids > manifest['max_id']
+            if not fresh.any():
+                return
+            matrix = _normalize_rows(np.asarray(vectors)[fresh])
+            manifest['segments'].append(self._write_segment(tenant_dir, manifest, ids[fresh], matrix))
+            manifest['max_id'] = int(ids[fresh].max())
+            self._write_manifest(tenant_dir, manifest)
+        self.maybe_compact(producer_id, model_id)
+
+    def replace(self, producer_id, model_id, ids, vectors):
+        """Rewrite a tenant as one base segment (used to seed or heal from the DB)"""
+        tenant_dir = self.tenant_dir(producer_id, model_id)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._locked(tenant_dir):
+            manifest = self._read_manifest(tenant_dir)
+            old = [s['name'] for s in manifest['segments']]
+            segment = self._write_segment(tenant_dir, manifest, ids, _normalize_rows(vectors))
+            manifest['segments'] = [segment]
+            manifest['max_id'] = int(ids.max()) if len(ids) else 0
+            self._write_manifest(tenant_dir, manifest)
+            # Readers that still map old files keep them alive until they unmap
+            for name in old:
+                self._remove_segment_files(tenant_dir, name)
+
+    def delete(self, producer_id, model_id, chunk_ids):
+        """Tombstone chunk ids in whichever segments hold them"""
+        tenant_dir = self.tenant_dir(producer_id, model_id)
+        if not os.path.exists(os.path.join(tenant_dir, MANIFEST)):
+            return
+        chunk_ids = np.asarray(list(chunk_ids), dtype=np.int64)
+        with self._locked(tenant_dir):
+            manifest = self._read_manifest(tenant_dir)
+            changed = False
+            for segment in manifest['segments']:
+                seg_ids = np.load(self._path(tenant_dir, segment['name'], 'ids'), mmap_mode='r')
+                hits = np.isin(seg_ids, chunk_ids)
+                if not hits.any():
+                    continue
+                tombstones = self._load_tombstones(tenant_dir, segment)
+                tombstones = tombstones.copy() if tombstones is not None else np.zeros(len(seg_ids), dtype=bool)
+                tombstones |= hits
+                self._save_array(self._path(tenant_dir, segment['name'], 'tombstones'), tombstones)
+                segment['deleted'] = int(tombstones.sum())
+                changed = True
+            if changed:
+                self._write_manifest(tenant_dir, manifest)
+        if changed:
+            self.maybe_compact(producer_id, model_id)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _load_tombstones(self, tenant_dir, segment):
+        if not segment.get('deleted'):
+            return None
+        return np.load(self._path(tenant_dir, segment['name'], 'tombstones'))
+
+    def load(self, producer_id, model_id=None):
+        """Return (ids, matrix) for a tenant, None if it has no segments yet
+
+        A single segment without tombstones is returned as the memory map
+        itself (no copy); otherwise live rows are gathered into one matrix.
+        """
+        tenant_dir = self.tenant_dir(producer_id, model_id)
+        manifest = self._read_manifest(tenant_dir)
+        if not manifest['segments']:
+            return None
+
+        parts = []
+        for segment in manifest['segments']:
+            ids = np.load(self._path(tenant_dir, segment['name'], 'ids'), mmap_mode='r')
+            vectors = np.load(self._path(tenant_dir, segment['name'], 'vectors'), mmap_mode='r')
+            tombstones = self._load_tombstones(tenant_dir, segment)
+            parts.append((ids, vectors, tombstones))
+
+        if len(parts) == 1 and parts[0][2] is None:
+            return parts[0][0], parts[0][1]
+
+        live_ids, live_vectors = [], []
+        for ids, vectors, tombstones in parts:
+            if tombstones is None:
+                live_ids.append(ids)
+                live_vectors.append(vectors)
+            else:
+                keep = ~tombstones
+                live_ids.append(ids[keep])
+                live_vectors.append(vectors[keep])
+        return np.concatenate(live_ids), np.ascontiguousarray(np.concatenate(live_vectors))
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def needs_compaction(self, manifest):
+        segments = manifest['segments']
+        if len(segments) > self.max_segments:
+            return True
+        rows = sum(s['rows'] for s in segments)
+        deleted = sum(s.get('deleted', 0) for s in segments)
+        return rows > 0 and deleted / rows > self.max_tombstone_ratio
+
+    def compact(self, producer_id, model_id=None):
+        """Merge all live rows into a single segment"""
+        tenant_dir = self.tenant_dir(producer_id, model_id)
+        with self._locked(tenant_dir):
+            manifest = self._read_manifest(tenant_dir)
+            if len(manifest['segments']) <= 1 and not any(s.get('deleted') for s in manifest['segments']):
+                return
+            loaded = self.load(producer_id, model_id)
+            if loaded is None:
+                return
+            ids, matrix = loaded
+            old = [s['name'] for s in manifest['segments']]
+            segment = self._write_segment(tenant_dir, manifest, np.asarray(ids), np.asarray(matrix))
+            manifest['segments'] = [segment]
+            self._write_manifest(tenant_dir, manifest)
+            for name in old:
+                self._remove_segment_files(tenant_dir, name)
+        print(f"🗜️  Compacted segments: producer={producer_id}, model={model_id}, {len(ids)} rows")
+
+    def maybe_compact(self, producer_id, model_id=None):
+        """Start a background compaction if the tenant has too many deltas or tombstones"""
+        manifest = self._read_manifest(self.tenant_dir(producer_id, model_id))
+        if not self.needs_compaction(manifest):
+            return
+        key = (producer_id, model_id)
+        with self._compacting_lock:
+            if key in self._compacting:
+                return
+            self._compacting.add(key)
+
+        def run():
+            try:
+                self.compact(producer_id, model_id)
+            except Exception as e:
+                print(f"Segment compaction error: {e}")
+            finally:
+                with self._compacting_lock:
+                    self._compacting.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+_stores = {}
+
+
+def get_segment_store():
+    """Segment store for the current app, or None when disabled"""
+    if not has_app_context():
+        return None
+    config = current_app.config
+    if not config.get('SEGMENT_STORE_ENABLED'):
+        return None
+    root = config['SEGMENT_STORE_DIR']
+    store = _stores.get(root)
+    if store is None:
+        store = _stores[root] = SegmentStore(
+            root,
+            max_segments=config['SEGMENT_STORE_MAX_SEGMENTS'],
+            max_tombstone_ratio=config['SEGMENT_STORE_MAX_TOMBSTONE_RATIO']
+        )
+    return store
+
+
+# ----------------------------------------------------------------------
+# Session hooks: write segments only for data that actually committed
+# ----------------------------------------------------------------------
+
+def queue_append(session, producer_id, model_id, ids, vectors):
+    """Append vectors to the tenant's store once the session commits"""
+    store = get_segment_store()
+    if store is None:
+        return
+    pending = session.info.setdefault('segment_appends', [])
+    pending.append((store, producer_id, model_id, ids, vectors))
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deletes(session, flush_context, instances):
+    from app.models.document import Document, DocumentChunk
+    if not session.deleted:
+        return
+    store = get_segment_store()
+    if store is None:
+        return
+    pending = session.info.setdefault('segment_deletes', {})
+    for obj in session.deleted:
+        if isinstance(obj, Document):
+            with session.no_autoflush:
+                rows = session.query(DocumentChunk.id).filter(DocumentChunk.document_id == obj.id).all()
+            pending.setdefault((obj.producer_id, obj.model_id), set()).update(row.id for row in rows)
+        elif isinstance(obj, DocumentChunk):
+            pending.setdefault((obj.producer_id, obj.model_id), set()).add(obj.id)
+    session.info['segment_store'] = store
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for store, producer_id, model_id, ids, vectors in session.info.pop('segment_appends', []):
+        try:
+            # Both the model view and the all-models view of the producer
+            store.append(producer_id, model_id, ids, vectors)
+            store.append(producer_id, None, ids, vectors)
+        except Exception as e:
+            print(f"Segment append error: {e}")
+
+    store = session.info.pop('segment_store', None)
+    for (producer_id, model_id), chunk_ids in session.info.pop('segment_deletes', {}).items():
+        if store is None:
+            continue
+        try:
+            store.delete(producer_id, model_id, chunk_ids)
+            store.delete(producer_id, None, chunk_ids)
+        except Exception as e:
+            print(f"Segment tombstone error: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('segment_appends', None)
+    session.info.pop('segment_deletes', None)
+    session.info.pop('segment_store', None)
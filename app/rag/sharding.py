@@ -0,0 +1,142 @@
+"""Sharded exact scoring in worker processes
+
+For very large tenants, scoring the whole matrix in the request thread keeps
+one gunicorn thread busy (and holding the GIL between NumPy calls) for the
+full scan. With SHARDED_SEARCH_ENABLED, tenants of at least
+SHARDED_SEARCH_MIN_VECTORS rows are copied once into POSIX shared memory and
+scored by a pool of long-lived worker processes: each worker scans one row
+range, returns its local top-k, and the request thread merges the winners.
+
+Workers are started with 'spawn' (forking a threaded server is unsafe) and
+attach to shared segments by name, so the matrix is never pickled per query.
+"""
+import os
+import atexit
+import weakref
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# Shared segments a worker keeps attached (one per recently used tenant)
+MAX_ATTACHED = 8
+
+_attached = OrderedDict()
+
+
+def _attach(name, shape):
+    """Worker side: map a shared matrix, keeping a small LRU of attachments"""
+    entry = _attached.get(name)
+    if entry is None:
+        # Spawned workers share the parent's resource tracker; only the parent unlinks
+        shm = shared_memory.SharedMemory(name=name)
+        entry = (shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf))
+        _attached[name] = entry
+        while len(_attached) > MAX_ATTACHED:
+            _, (old, _) = _attached.popitem(last=False)
+            old.close()
+    _attached.move_to_end(name)
+    return entry[1]
+
+
+def _score_shard(name, shape, start, stop, query, k, mask):
+    """Worker side: local top-k of rows [start, stop) as (positions, scores)"""
+    matrix = _attach(name, shape)
+    scores = matrix[start:stop] @ query
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    k = min(k, len(scores))
+    top = np.argpartition(scores, -k)[-k:] if k < len(scores) else np.arange(len(scores))
+    return top + start, scores[top]
+
+
+class SharedMatrix:
+    """A tenant matrix copied into a shared memory segment, unlinked when collected"""
+
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.shape = matrix.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)[:] = matrix
+        self.name = self.shm.name
+        self._finalizer = weakref.finalize(self, _release, self.shm)
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+
+def _release(shm):
+    try:
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ShardedScorer:
+    """Pool of scoring processes shared by all tenants of this worker"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                print(f"🧮 Starting {self.workers} scoring processes")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def shared(self, index):
+        """SharedMatrix for a TenantIndex, created on first sharded query"""
+        with self._lock:
+            shared = getattr(index, 'shared', None)
+            if shared is None:
+                shared = index.shared = SharedMatrix(index.matrix)
+                print(f"🧮 Shared {shared.shape[0]} vectors ({shared.nbytes / 1e6:.0f} MB) "
+                      f"for producer={index.producer_id}")
+            return shared
+
+    def top_k(self, index, query_vector, k, mask=None):
+        """Exact top-k over the index rows, best first"""
+        shared = self.shared(index)
+        n = shared.shape[0]
+        bounds = np.linspace(0, n, self.workers + 1).astype(int)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        futures = [
+            self.pool.submit(_score_shard, shared.name, shared.shape, start, stop, query_vector, k,
+                             None if mask is None else mask[start:stop])
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        parts = [future.result() for future in futures]
+        positions = np.concatenate([p for p, _ in parts])
+        scores = np.concatenate([s for _, s in parts])
+        order = np.argsort(-scores, kind='stable')[:k]
+        return positions[order], scores[order]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_sharded_scorer(workers=None):
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = ShardedScorer(workers)
+            atexit.register(_scorer.shutdown)
+        return _scorer
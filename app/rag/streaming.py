@@ -0,0 +1,117 @@
+"""Bounded-memory exact search straight from the database
+
+Used when the index cache is disabled, or (STREAMING_SCAN_WHEN_COLD) while a
+tenant's index is still being built. Only (id, embedding) columns are read
+(the JSON copy only for rows never backfilled to binary), with yield_per so
+PostgreSQL uses a server-side cursor; each block of STREAMING_SCAN_BLOCK
+rows is decoded and scored with one matrix product and its winners are
+pushed into a running top-k heap per query. Memory stays at one block plus
+k entries per query whatever the tenant size.
+"""
+import heapq
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models.document import DocumentChunk
+from app.rag.codec import EMBEDDING_DTYPE, decode_embeddings, parse_json_embedding
+from app.rag.index_cache import LEGACY_EMBEDDING, _tenant_filter, filter_documents, index_cache
+
+
+def _push_block(heaps, queries, ids, vectors, k):
+    """Score one block against every query and keep the k best (score, id) per query"""
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    scores = (queries @ vectors.T) / norms
+    take = min(k, len(ids))
+    for heap, row in zip(heaps, scores):
+        best = np.argpartition(row, -take)[-take:] if take < len(row) else np.arange(len(row))
+        for position in best:
+            item = (float(row[position]), int(ids[position]))
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heappushpop(heap, item)
+
+
+def stream_top_k(producer_id, query_matrix, top_k, model_id=None, filters=None, block_size=2000):
+    """[(chunk_ids, scores)] best first for each normalized query row, in one scan"""
+    queries = np.atleast_2d(np.asarray(query_matrix, dtype=np.float32))
+    dim = queries.shape[1]
+    heaps = [[] for _ in range(len(queries))]
+
+    query = _tenant_filter(
+        db.session.query(DocumentChunk.id, DocumentChunk.embedding_vec, LEGACY_EMBEDDING),
+        producer_id, model_id
+    ).filter(or_(DocumentChunk.embedding_vec.isnot(None), DocumentChunk.embedding.isnot(None)))
+    query = filter_documents(query, filters or {})
+
+    ids, blobs, legacy_ids, legacy = [], [], [], []
+
+    def flush():
+        if blobs:
+            _push_block(heaps, queries, ids, decode_embeddings(blobs, dim), top_k)
+        if legacy:
+            _push_block(heaps, queries, legacy_ids, np.asarray(legacy, dtype=np.float32), top_k)
+        for block in (ids, blobs, legacy_ids, legacy):
+            block.clear()
+
+    for chunk_id, blob, embedding in query.yield_per(block_size):
+        if blob is not None:
+            if len(blob) != dim * EMBEDDING_DTYPE.itemsize:
+                continue
+            ids.append(chunk_id)
+            blobs.append(blob)
+        else:
+            vector = parse_json_embedding(embedding)
+            if not vector or len(vector) != dim:
+                continue
+            legacy_ids.append(chunk_id)
+            legacy.append(vector)
+        if len(ids) + len(legacy_ids) >= block_size:
+            flush()
+    flush()
+
+    results = []
+    for heap in heaps:
+        best = sorted(heap, reverse=True)
+        results.append((np.array([chunk_id for _, chunk_id in best], dtype=np.int64),
+                        np.array([score for score, _ in best], dtype=np.float32)))
+    return results
+
+
+def use_streaming(producer_id):
+    """Scan the DB instead of the index: cache disabled, or cold and warming in the background"""
+    config = current_app.config
+    if not config.get('VECTOR_CACHE_ENABLED', True):
+        return True
+    if config.get('STREAMING_SCAN_WHEN_COLD') and index_cache.peek(producer_id) is None:
+        warm_in_background(producer_id)
+        return True
+    return False
+
+
+_warming = set()
+_warming_lock = threading.Lock()
+
+
+def warm_in_background(producer_id):
+    """Build a tenant index off the request thread (once per tenant at a time)"""
+    with _warming_lock:
+        if producer_id in _warming:
+            return
+        _warming.add(producer_id)
+    app = current_app._get_current_object()
+
+    def build():
+        try:
+            with app.app_context():
+                index_cache.get(producer_id)
+        except Exception as e:
+            print(f"Background index build error (producer={producer_id}): {e}")
+        finally:
+            with _warming_lock:
+                _warming.discard(producer_id)
+
+    threading.Thread(target=build, name=f'index-warm-{producer_id}', daemon=True).start()
@@ -1,58 +1,306 @@
 """PostgreSQL-based vector search with cached embeddings"""
+from flask import current_app
 from app import db
-from app.models.document import DocumentChunk, Document
+from sqlalchemy import or_
+from app.models.document import DocumentChunk
 from app.rag.embeddings import generate_query_embedding
+from app.rag.index_cache import (
+    index_cache, normalize_query, resolve_filters, load_vectors_by_id, filter_documents
+)
+from app.rag.hnsw import get_ann_index
+from app.rag.sharding import get_sharded_scorer
+from app.rag.result_cache import result_cache, query_key
+from app.rag.generations import generation
+from app.rag.streaming import stream_top_k, use_streaming
 import numpy as np
-import json
 
-def search_similar(query_embedding, producer_id, model_id=None, top_k=5):
-    print(f"🔍 Searching: producer={producer_id}, model={model_id}")
-    
-    # Get all chunks for producer/model
-    query = db.session.query(DocumentChunk, Document).join(
-        Document, DocumentChunk.document_id == Document.id
-    ).filter(Document.producer_id == producer_id)
-    
+# Below this share of allowed rows, filtered queries score only the allowed rows
+GATHER_MAX_SHARE = 0.25
+
+def _get_index(producer_id):
+    """Producer-wide index; model and other attributes are applied as row masks
+
+    Only reached with VECTOR_CACHE_ENABLED: without the cache use_streaming()
+    sends every search to the DB scan instead.
+    """
+    return index_cache.get(producer_id)
+
+def _filter_mask(index, model_id, filters):
+    filters = resolve_filters(filters)
     if model_id:
-        query = query.filter(Document.model_id == model_id)
+        filters['model_id'] = model_id
+    return index.masks.mask(filters) if index.masks is not None else None
+
+def search_similar(query_embedding, producer_id, model_id=None, top_k=5, filters=None,
+                   doc_fanout=None, section_fanout=None):
+    """Top-k chunks; doc_fanout/section_fanout force coarse-to-fine search with that fan-out"""
+    print(f"🔍 Searching: producer={producer_id}, model={model_id}, filters={filters}")
+    
+    if use_streaming(producer_id):
+        chunk_ids, scores = _stream(normalize_query(query_embedding)[None, :], producer_id, model_id,
+                                    top_k, filters)[0]
+        print(f"🌊 Streamed scan: top {len(chunk_ids)} results")
+        return hydrate_chunks(chunk_ids, scores)
     
-    all_chunks = query.all()
-    print(f"📦 Found {len(all_chunks)} chunks in DB")
+    index = _get_index(producer_id)
+    print(f"📦 Index has {len(index)} vectors")
     
-    if not all_chunks:
+    if not len(index):
         print("⚠️  No chunks found!")
         return []
     
-    # Use CACHED embeddings from DB
-    print(f"🔮 Using cached embeddings...")
-    
-    scores = []
-    for chunk, doc in all_chunks:
-        if not chunk.embedding:
-            print(f"⚠️  Chunk {chunk.id} missing embedding, skipping")
-            continue
-        
-        # Parse stored embedding
-        chunk_embedding = json.loads(chunk.embedding)
-        
-        # Calculate cosine similarity
-        similarity = cosine_similarity(query_embedding, chunk_embedding)
-        scores.append({
-            'text': chunk.chunk_text,
-            'doc_id': doc.id,
-            'page': chunk.chunk_metadata.get('page') if chunk.chunk_metadata else None,
-            'source_reference': chunk.source_reference,
-            'score': similarity
-        })
-    
-    # Sort by similarity
-    scores.sort(key=lambda x: x['score'], reverse=True)
-    
-    print(f"🎯 Returning top {min(top_k, len(scores))} results")
-    for i, s in enumerate(scores[:top_k]):
+    query_vector = normalize_query(query_embedding)
+    config = current_app.config
+    key = None
+    if config.get('RESULT_CACHE_ENABLED', True):
+        result_cache.configure(config['RESULT_CACHE_SIZE'], config['RESULT_CACHE_TTL'])
+        key = (producer_id, model_id or None, query_key(query_vector), top_k,
+               repr(sorted(resolve_filters(filters).items())), doc_fanout, section_fanout,
+               generation(producer_id), index.signature, index.masks.stamp if index.masks else None)
+        cached = result_cache.get(key)
+        if cached is not None:
+            print("⚡ Result cache hit")
+            return hydrate_chunks(*cached)
+    
+    # Score on ids only; text is loaded for the winners afterwards
+    mask = _filter_mask(index, model_id, filters)
+    fanout = _fanout(index, doc_fanout, section_fanout)
+    positions, scores = _rank(index, query_vector, top_k, mask, fanout)
+    chunk_ids = index.ids[positions]
+    if key is not None:
+        result_cache.put(key, chunk_ids, scores)
+    results = hydrate_chunks(chunk_ids, scores)
+    
+    print(f"🎯 Returning top {len(results)} results")
+    for i, s in enumerate(results):
         print(f"  {i+1}. Score: {s['score']:.3f}, Page: {s['page']}")
     
-    return scores[:top_k]
+    return results
+
+def search_similar_batch(query_matrix, producer_id, model_id=None, top_k=5, filters=None,
+                         doc_fanout=None, section_fanout=None):
+    """Top-k chunks for several queries at once, one result list per query row"""
+    query_matrix = np.asarray(query_matrix, dtype=np.float32)
+    print(f"🔍 Batch search: {len(query_matrix)} queries, producer={producer_id}, model={model_id}")
+    if not len(query_matrix):
+        return []
+    
+    norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    queries = query_matrix / norms
+    
+    if use_streaming(producer_id):
+        streamed = _stream(queries, producer_id, model_id, top_k, filters)
+        rows = _fetch_chunk_rows({int(i) for chunk_ids, _ in streamed for i in chunk_ids})
+        return [
+            [_format_chunk(rows[int(chunk_id)], score) for chunk_id, score in zip(chunk_ids, scores)
+             if int(chunk_id) in rows]
+            for chunk_ids, scores in streamed
+        ]
+    
+    index = _get_index(producer_id)
+    if not len(index):
+        return [[] for _ in range(len(query_matrix))]
+    mask = _filter_mask(index, model_id, filters)
+    allowed = len(index) if mask is None else int(mask.sum())
+    if not allowed:
+        return [[] for _ in range(len(query_matrix))]
+    fanout = _fanout(index, doc_fanout, section_fanout)
+    
+    if fanout is not None or index.codes is not None or _ann_for(index) is not None or _use_sharding(index):
+        # Approximate, hierarchical and sharded paths run per query
+        ranked = [_rank(index, q, top_k, mask, fanout) for q in queries]
+    else:
+        # One matrix-matrix product scores every query against every chunk
+        scores = queries @ index.matrix.T
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        k = min(top_k, allowed)
+        if k < scores.shape[1]:
+            candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        ranked = [
+            (candidates[row, order[row]], candidate_scores[row, order[row]])
+            for row in range(len(scores))
+        ]
+    
+    # Hydrate the union of all winners in a single query
+    all_ids = {int(i) for positions, _ in ranked for i in index.ids[positions]}
+    rows = _fetch_chunk_rows(all_ids)
+    return [
+        [_format_chunk(rows[int(chunk_id)], score)
+         for chunk_id, score in zip(index.ids[positions], scores)
+         if int(chunk_id) in rows]
+        for positions, scores in ranked
+    ]
+
+def _stream(queries, producer_id, model_id, top_k, filters):
+    """Bounded-memory DB scan (app.rag.streaming) with the same filter semantics as the index"""
+    filters = resolve_filters(filters)
+    if model_id:
+        filters['model_id'] = model_id
+    return stream_top_k(producer_id, queries, top_k, filters=filters,
+                        block_size=current_app.config['STREAMING_SCAN_BLOCK'])
+
+def _rank(index, query_vector, top_k, mask=None, fanout=None):
+    """(positions, scores) of the best allowed rows for one normalized query"""
+    allowed = len(index) if mask is None else int(mask.sum())
+    top_k = min(top_k, allowed)
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    share = allowed / len(index)
+    
+    if fanout is not None:
+        # Best documents -> their best sections -> chunks inside them
+        hierarchy = index.hierarchy(current_app.config['HIERARCHICAL_SECTION_CHUNKS'])
+        if hierarchy is not None:
+            rows = hierarchy.candidate_rows(query_vector, *fanout, mask=mask)
+            if len(rows) >= top_k:
+                scores = index.full_vectors(rows) @ query_vector
+                order = top_k_indices(scores, top_k)
+                return rows[order], scores[order]
+    
+    ann = _ann_for(index)
+    if ann is not None and share > GATHER_MAX_SHARE:
+        # Oversample so that enough neighbours survive the mask
+        fetch = top_k if mask is None else int(np.ceil(2 * top_k / share))
+        positions, sims = ann.search(query_vector, fetch, max(current_app.config['HNSW_EF_SEARCH'], fetch))
+        if mask is not None:
+            keep = mask[positions]
+            positions, sims = positions[keep][:top_k], sims[keep][:top_k]
+        if len(positions) >= top_k:
+            return positions, sims
+    
+    if mask is not None and share <= GATHER_MAX_SHARE and index.matrix is not None:
+        # Selective filter: score only the allowed rows
+        subset = np.flatnonzero(mask)
+        scores = index.full_vectors(subset) @ query_vector
+        order = top_k_indices(scores, top_k)
+        return subset[order], scores[order]
+    
+    if _use_sharding(index):
+        scorer = get_sharded_scorer(current_app.config['SHARDED_SEARCH_WORKERS'] or None)
+        return scorer.top_k(index, query_vector, top_k, mask)
+    
+    if index.codes is not None:
+        # First pass on compact codes, then rescore candidates at full precision
+        approx = index.score(query_vector)
+        if mask is not None:
+            approx = np.where(mask, approx, -np.inf)
+        candidates = top_k_indices(approx, min(top_k * current_app.config['QUANTIZATION_RESCORE_FACTOR'], allowed))
+        exact = index.full_vectors(candidates) @ query_vector
+        order = top_k_indices(exact, top_k)
+        return candidates[order], exact[order]
+    
+    scores = index.score(query_vector)
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    order = top_k_indices(scores, top_k)
+    return order, scores[order]
+
+def _fanout(index, doc_fanout, section_fanout):
+    """(doc_fanout, section_fanout) when coarse-to-fine search applies, else None"""
+    config = current_app.config
+    if doc_fanout is None and section_fanout is None:
+        if not config.get('HIERARCHICAL_SEARCH_ENABLED'):
+            return None
+        hierarchy = index.hierarchy(config['HIERARCHICAL_SECTION_CHUNKS'])
+        if hierarchy is None or hierarchy.n_docs < config['HIERARCHICAL_MIN_DOCUMENTS']:
+            return None
+    return (doc_fanout or config['HIERARCHICAL_DOC_FANOUT'],
+            section_fanout or config['HIERARCHICAL_SECTION_FANOUT'])
+
+def _use_sharding(index):
+    """Very large full-precision tenants are scored across worker processes"""
+    config = current_app.config
+    return (config.get('SHARDED_SEARCH_ENABLED') and index.codes is None and index.matrix is not None
+            and len(index) >= config['SHARDED_SEARCH_MIN_VECTORS'])
+
+def _ann_for(index):
+    """HNSW index for large cached tenants, None means use exact search"""
+    config = current_app.config
+    if not config.get('HNSW_ENABLED') or index.signature is None or index.matrix is None:
+        return None
+    if len(index) < config['HNSW_MIN_VECTORS']:
+        return None
+    return get_ann_index(
+        index, config['VECTOR_INDEX_DIR'],
+        M=config['HNSW_M'], ef_construction=config['HNSW_EF_CONSTRUCTION']
+    )
+
+def top_k_indices(scores, k):
+    """Positions of the k highest scores, best first (O(n) selection + O(k log k) sort)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def chunk_vectors(producer_id, chunk_ids):
+    """{chunk_id: normalized vector}, from the loaded index when possible, else one DB query"""
+    chunk_ids = [int(i) for i in chunk_ids]
+    vectors = {}
+    index = index_cache.peek(producer_id)
+    if index is not None and len(index):
+        positions = index.positions_of(chunk_ids)
+        found = positions >= 0
+        if found.any():
+            rows = index.full_vectors(positions[found])
+            vectors.update(zip(np.asarray(chunk_ids)[found].tolist(), rows))
+    missing = [i for i in chunk_ids if i not in vectors]
+    if missing:
+        rows = db.session.query(DocumentChunk.id).filter(
+            DocumentChunk.id.in_(missing),
+            or_(DocumentChunk.embedding_vec.isnot(None), DocumentChunk.embedding.isnot(None))
+        ).all()
+        embedded = [row.id for row in rows]
+        if embedded:
+            vectors.update(zip(embedded, load_vectors_by_id(embedded)))
+    return vectors
+
+def hydrate_chunks(chunk_ids, scores, filters=None):
+    """Load text and source info for the selected chunks in one IN (...) query"""
+    chunk_ids = [int(i) for i in chunk_ids]
+    rows = _fetch_chunk_rows(chunk_ids, filters)
+    return [
+        _format_chunk(rows[chunk_id], score)
+        for chunk_id, score in zip(chunk_ids, scores)
+        if chunk_id in rows
+    ]
+
+def _fetch_chunk_rows(chunk_ids, filters=None):
+    """Rows by id; with filters, chunks of non-matching documents are left out"""
+    chunk_ids = [int(i) for i in chunk_ids]
+    if not chunk_ids:
+        return {}
+    query = db.session.query(
+        DocumentChunk.id,
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_text,
+        DocumentChunk.chunk_metadata,
+        DocumentChunk.source_reference
+    ).filter(DocumentChunk.id.in_(chunk_ids))
+    if filters:
+        query = filter_documents(query, filters)
+    return {row.id: row for row in query.all()}
+
+def _format_chunk(row, score):
+    metadata = row.chunk_metadata or {}
+    return {
+        'chunk_id': row.id,
+        'text': row.chunk_text,
+        'doc_id': row.document_id,
+        'page': metadata.get('page'),
+        'images': metadata.get('images') or [],
+        'source_reference': row.source_reference,
+        'score': float(score)
+    }
 
 def cosine_similarity(a, b):
     """Calculate cosine similarity"""
@@ -60,6 +308,7 @@ def cosine_similarity(a, b):
     b = np.array(b)
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def upsert_chunks(*args, **kwargs):
-    """Dummy for compatibility"""
-    pass
+def upsert_chunks(producer_id, model_id, chunks):
+    """Upsert chunk vectors into the configured vector store backend"""
+    from app.rag.vector_store import get_vector_store
+    get_vector_store().upsert(producer_id, model_id, chunks)
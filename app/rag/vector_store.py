@@ -0,0 +1,568 @@
+"""Pluggable vector store backends
+
+One interface for every retrieval path:
+
+    upsert(producer_id, model_id, chunks)    chunks: dicts with id, document_id,
+                                             vector and display fields
+    delete_document(producer_id, document_id)
+    query(query_embedding, producer_id, model_id=None, top_k=5, filters=None)
+    query_models(query_embedding, producer_id, model_ids, top_k=5, filters=None)
+    query_batch(query_embeddings, producer_id, model_id=None, top_k=5, filters=None)
+    stats(producer_id=None)
+
+query() returns the same result dicts as search_similar (chunk_id, text,
+doc_id, page, source_reference, score); query_models() returns them per
+model, for multi-machine searches, and query_batch() per query, for
+batched questions. Every backend applies the same filters (resolve_filters:
+latest document versions only unless is_latest is given). Backends:
+
+    postgres  document_chunks + in-process index cache (app.rag.vector_db)
+    pgvector  document_chunks.embedding_pgv, HNSW top-k inside PostgreSQL
+    pinecone  Pinecone namespace per producer
+    local     in-process NumPy store, for offline runs and load tests
+
+The backend is chosen per deployment with VECTOR_BACKEND.
+"""
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select, text, literal_column, cast, Float
+from sqlalchemy.types import UserDefinedType
+from sqlalchemy.orm import Session, aliased
+from app import db
+from app.models.document import Document, DocumentChunk
+from app.rag.index_cache import (
+    index_cache, corpus_signature, normalize_query, resolve_filters, filter_documents, build_masks, _tenant_filter
+)
+from app.rag.generations import generation
+
+
+class VectorStore:
+    """Base class for vector store backends"""
+    name = None
+    # True when the store is separate from document_chunks and has to be
+    # fed by ingestion
+    external = True
+
+    def upsert(self, producer_id, model_id, chunks):
+        raise NotImplementedError
+
+    def delete_document(self, producer_id, document_id):
+        raise NotImplementedError
+
+    def query(self, query_embedding, producer_id, model_id=None, top_k=5, filters=None):
+        raise NotImplementedError
+
+    def query_models(self, query_embedding, producer_id, model_ids, top_k=5, filters=None):
+        """{model_id: results}, one search per model (in-process backends run them in turn)"""
+        return {
+            model_id: self.query(query_embedding, producer_id, model_id=model_id, top_k=top_k, filters=filters)
+            for model_id in model_ids
+        }
+
+    def query_batch(self, query_embeddings, producer_id, model_id=None, top_k=5, filters=None):
+        """One result list per query (backends without a batched search run them in turn)"""
+        return [
+            self.query(query_embedding, producer_id, model_id=model_id, top_k=top_k, filters=filters)
+            for query_embedding in query_embeddings
+        ]
+
+    def stats(self, producer_id=None):
+        raise NotImplementedError
+
+
+class PostgresVectorStore(VectorStore):
+    """Embeddings stored on document_chunks, scored by the in-process index cache"""
+    name = 'postgres'
+    external = False
+
+    def upsert(self, producer_id, model_id, chunks):
+        """Write (re-)computed embeddings onto existing chunk rows"""
+        vectors = {int(c['id']): c['vector'] for c in chunks}
+        for chunk in DocumentChunk.query.filter(DocumentChunk.id.in_(list(vectors))).all():
+            chunk.set_embedding(vectors[chunk.id])
+        index_cache.invalidate(producer_id, model_id)
+
+    def delete_document(self, producer_id, document_id):
+        """Remove a document's vectors from search; chunk text stays in place"""
+        chunk_ids = db.session.query(DocumentChunk.id).filter(
+            DocumentChunk.document_id == document_id, DocumentChunk.producer_id == producer_id
+        )
+        DocumentChunk.query.filter(DocumentChunk.id.in_(chunk_ids.scalar_subquery())).update(
+            {'embedding_vec': None, 'embedding_dim': None, 'embedding': None},
+            synchronize_session=False
+        )
+        index_cache.invalidate(producer_id)
+
+    def query(self, query_embedding, producer_id, model_id=None, top_k=5, filters=None):
+        from app.rag.vector_db import search_similar
+        return search_similar(query_embedding, producer_id, model_id=model_id, top_k=top_k, filters=filters)
+
+    def query_batch(self, query_embeddings, producer_id, model_id=None, top_k=5, filters=None):
+        """One matrix-matrix product over the cached tenant index"""
+        from app.rag.vector_db import search_similar_batch
+        return search_similar_batch(query_embeddings, producer_id, model_id=model_id, top_k=top_k, filters=filters)
+
+    def stats(self, producer_id=None):
+        if producer_id is None:
+            return {'backend': self.name, 'chunks': DocumentChunk.query.filter(
+                DocumentChunk.embedding_vec.isnot(None)).count()}
+        count, max_id = corpus_signature(producer_id)
+        return {'backend': self.name, 'producer_id': producer_id, 'chunks': count, 'max_chunk_id': max_id}
+
+
+class _PgVector(UserDefinedType):
+    """pgvector's vector type, for casts only"""
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return 'vector'
+
+
+class PgVectorStore(PostgresVectorStore):
+    """pgvector column on document_chunks, top-k computed inside PostgreSQL
+
+    The HNSW index (migration e2c4a7b91f36) answers
+    ORDER BY embedding_pgv <=> :q LIMIT k with the producer, model and
+    document filters in the same statement, so only k rows leave the
+    database. The index is global, so filters are applied to the graph's
+    candidates: pgvector >= 0.8 scans iteratively until k rows pass, and a
+    short result falls back to an exact scan of the tenant's rows. embedding_pgv is not mapped on the model (no pgvector Python
+    dependency): values travel as '[x,y,...]' literals cast to vector.
+    """
+    name = 'pgvector'
+    # embedding_pgv is fed from committed uploads like an external store
+    external = True
+    # pgvector extension version, read once per process
+    _version = None
+    # One indexed top-k statement per query, not the in-process batch scan
+    query_batch = VectorStore.query_batch
+
+    @staticmethod
+    def _literal(vector):
+        return '[' + ','.join(f"{x:.7g}" for x in np.asarray(vector, dtype=np.float32)) + ']'
+
+    def upsert(self, producer_id, model_id, chunks):
+        """Write vectors on their own connection (runs after the upload's commit)"""
+        if not chunks:
+            return
+        with db.engine.begin() as conn:
+            # Row level security on document_chunks checks the tenant of this transaction
+            conn.execute(text("SELECT set_config('app.current_producer_id', :id, true)"),
+                         {'id': str(producer_id)})
+            conn.execute(
+                text("UPDATE document_chunks SET embedding_pgv = CAST(:vector AS vector) WHERE id = :id"),
+                [{'id': int(c['id']), 'vector': self._literal(c['vector'])} for c in chunks]
+            )
+
+    def delete_document(self, producer_id, document_id):
+        db.session.execute(text(
+            "UPDATE document_chunks SET embedding_pgv = NULL "
+            "WHERE document_id = :document_id AND producer_id = :producer_id"
+        ), {'document_id': document_id, 'producer_id': producer_id})
+        super().delete_document(producer_id, document_id)
+
+    def query(self, query_embedding, producer_id, model_id=None, top_k=5, filters=None):
+        from app.rag.vector_db import _format_chunk
+        query_vector = cast(self._literal(normalize_query(query_embedding)), _PgVector())
+        distance = literal_column('document_chunks.embedding_pgv').op('<=>', return_type=Float)(query_vector)
+        query = _tenant_filter(
+            db.session.query(
+                DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_text,
+                DocumentChunk.chunk_metadata, DocumentChunk.source_reference, distance.label('distance')
+            ),
+            producer_id, model_id
+        ).filter(literal_column('document_chunks.embedding_pgv').isnot(None))
+        query = filter_documents(query, resolve_filters(filters))
+        # Filtered HNSW scans stop after ef_search candidates; keep it above k
+        ef_search = max(current_app.config['PGVECTOR_EF_SEARCH'], top_k)
+        db.session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+        if self._iterative_scan():
+            # Keep walking the graph until the filters let top_k rows through
+            db.session.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+        rows = query.order_by(distance).limit(top_k).all()
+        if len(rows) < top_k:
+            # The global graph ran out of candidates of this tenant (small tenant
+            # in a large table): exact scan, '+ 0' keeps the planner off the HNSW index
+            rows = query.order_by(distance + 0).limit(top_k).all()
+        return [_format_chunk(row, 1.0 - float(row.distance)) for row in rows]
+
+    def _iterative_scan(self):
+        """True when the installed pgvector (>= 0.8) supports hnsw.iterative_scan"""
+        if self._version is None:
+            version = db.session.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar() or '0'
+            self._version = tuple(int(part) for part in re.findall(r'\d+', version)[:2])
+        return self._version >= (0, 8)
+
+    def stats(self, producer_id=None):
+        query = db.session.query(func.count(DocumentChunk.id)).filter(
+            literal_column('document_chunks.embedding_pgv').isnot(None))
+        if producer_id is None:
+            return {'backend': self.name, 'chunks': query.scalar()}
+        count = _tenant_filter(query, producer_id, None).scalar()
+        return {'backend': self.name, 'producer_id': producer_id, 'chunks': count}
+
+
+class PineconeVectorStore(VectorStore):
+    """One Pinecone namespace per producer
+
+    Vectors carry only ids and the filter fields that never change
+    (producer_id, model_id, doc_id, chunk_id). Queries return ids and scores;
+    text, page, images and document title are hydrated from document_chunks
+    in one IN (...) query by vector id, which also applies the document
+    filters (is_latest, doc_type, language) Pinecone does not know about.
+    """
+    name = 'pinecone'
+    # Candidates per result: hydration filters drop superseded versions etc.
+    overfetch = 2
+
+    def __init__(self, index=None):
+        self._index = index
+
+    @property
+    def index(self):
+        if self._index is None:
+            from app.utils.rag import get_pinecone_index
+            self._index = get_pinecone_index()
+        return self._index
+
+    def _namespace(self, producer_id):
+        return f"producer_{producer_id}"
+
+    @staticmethod
+    def _metadata(producer_id, model_id, chunk):
+        metadata = {
+            'producer_id': producer_id,
+            'doc_id': int(chunk['document_id']),
+            'chunk_id': int(chunk['id']),
+        }
+        # Pinecone rejects null metadata values
+        if model_id:
+            metadata['model_id'] = model_id
+        return metadata
+
+    def upsert(self, producer_id, model_id, chunks):
+        vectors = [{
+            'id': chunk.get('vector_id') or str(chunk['id']),
+            'values': [float(x) for x in chunk['vector']],
+            'metadata': self._metadata(producer_id, model_id, chunk),
+        } for chunk in chunks]
+        for start in range(0, len(vectors), 100):
+            self.index.upsert(vectors=vectors[start:start + 100], namespace=self._namespace(producer_id))
+
+    def delete_document(self, producer_id, document_id):
+        self.index.delete(filter={'doc_id': document_id}, namespace=self._namespace(producer_id))
+
+    @staticmethod
+    def _filter(producer_id, model_id, filters):
+        filter_dict = {'producer_id': producer_id}
+        if model_id:
+            filter_dict['model_id'] = model_id
+        # Id filters are pushed down; document attributes are checked when hydrating
+        for field, key in (('model_id', 'model_id'), ('document_id', 'doc_id')):
+            value = filters.get(field)
+            if value is not None:
+                filter_dict[key] = {'$in': list(value)} if isinstance(value, (list, tuple, set)) else value
+        return filter_dict
+
+    def _matches(self, vector, producer_id, filter_dict, top_k):
+        return self.index.query(
+            vector=vector,
+            namespace=self._namespace(producer_id),
+            filter=filter_dict,
+            top_k=top_k,
+            include_metadata=False
+        ).matches
+
+    def query(self, query_embedding, producer_id, model_id=None, top_k=5, filters=None):
+        resolved = resolve_filters(filters)
+        filter_dict = self._filter(producer_id, model_id, resolved)
+        vector = [float(x) for x in query_embedding]
+        fetch_k = top_k * self.overfetch
+        while True:
+            matches = self._matches(vector, producer_id, filter_dict, fetch_k)
+            chunks = self.hydrate(producer_id, matches, resolved)
+            # Hydration filters dropped too many: ask for more, unless Pinecone ran out
+            if len(chunks) >= top_k or len(matches) < fetch_k or fetch_k >= top_k * 32:
+                return chunks[:top_k]
+            fetch_k *= 4
+
+    def query_models(self, query_embedding, producer_id, model_ids, top_k=5, filters=None):
+        """Concurrent Pinecone queries (network bound), hydrated together in one lookup"""
+        if len(model_ids) < 2:
+            return super().query_models(query_embedding, producer_id, model_ids, top_k, filters)
+        resolved = resolve_filters(filters)
+        vector = [float(x) for x in query_embedding]
+        fetch_k = top_k * self.overfetch
+        # Connect once, before the threads
+        self.index
+        with ThreadPoolExecutor(max_workers=min(len(model_ids), 8)) as pool:
+            responses = dict(zip(model_ids, pool.map(
+                lambda model_id: self._matches(vector, producer_id, self._filter(producer_id, model_id, resolved), fetch_k),
+                model_ids
+            )))
+        hydrated = self.hydrate(producer_id, [match for matches in responses.values() for match in matches], resolved)
+        by_vector_id = {chunk['vector_id']: chunk for chunk in hydrated}
+        results = {}
+        for model_id, matches in responses.items():
+            chunks = [by_vector_id[match.id] for match in matches if match.id in by_vector_id]
+            if len(chunks) < top_k and len(matches) == fetch_k:
+                # Hydration filters dropped too many of this model's candidates
+                chunks = self.query(query_embedding, producer_id, model_id=model_id, top_k=top_k, filters=filters)
+            results[model_id] = chunks[:top_k]
+        return results
+
+    @staticmethod
+    def hydrate(producer_id, matches, filters=None):
+        """Result dicts for (id, score) matches, best first, from one chunk lookup"""
+        from app.rag.vector_db import _format_chunk
+        vector_ids = [match.id for match in matches]
+        if not vector_ids:
+            return []
+        docs = aliased(Document)
+        title = select(docs.title).where(docs.id == DocumentChunk.document_id).scalar_subquery()
+        query = _tenant_filter(
+            db.session.query(
+                DocumentChunk.id, DocumentChunk.vector_id, DocumentChunk.document_id,
+                DocumentChunk.chunk_text, DocumentChunk.chunk_metadata,
+                DocumentChunk.source_reference, title.label('doc_name')
+            ),
+            producer_id, None
+        ).filter(DocumentChunk.vector_id.in_(vector_ids))
+        rows = {row.vector_id: row for row in filter_documents(query, filters or {}).all()}
+        results = []
+        for match in matches:
+            row = rows.get(match.id)
+            if row is None:
+                continue
+            result = _format_chunk(row, match.score)
+            result.update(vector_id=match.id, doc_name=row.doc_name or 'Unknown')
+            results.append(result)
+        return results
+
+    def stats(self, producer_id=None):
+        stats = self.index.describe_index_stats().to_dict()
+        if producer_id is not None:
+            namespace = stats.get('namespaces', {}).get(self._namespace(producer_id), {})
+            return {'backend': self.name, 'producer_id': producer_id,
+                    'chunks': namespace.get('vector_count', 0)}
+        return {'backend': self.name, 'chunks': stats.get('total_vector_count', 0)}
+
+
+class _LocalTenant:
+    """Growable column arrays for one producer"""
+
+    def __init__(self, dim):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int64)
+        self.model_ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self.payloads = {}
+        # (ids array, AttributeMasks) for the document attribute filters
+        self.masks = None
+
+    def upsert(self, model_id, chunks):
+        ids = np.array([int(c['id']) for c in chunks], dtype=np.int64)
+        keep = ~np.isin(self.ids, ids)
+        vectors = np.array([c['vector'] for c in chunks], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        self.ids = np.concatenate([self.ids[keep], ids])
+        self.doc_ids = np.concatenate([self.doc_ids[keep], [int(c['document_id']) for c in chunks]])
+        self.model_ids = np.concatenate([self.model_ids[keep], np.full(len(ids), model_id or 0)])
+        self.matrix = np.concatenate([self.matrix[keep], vectors / norms])
+        for chunk in chunks:
+            self.payloads[int(chunk['id'])] = {
+                'text': chunk.get('text', ''),
+                'doc_id': int(chunk['document_id']),
+                'page': chunk.get('page'),
+                'source_reference': chunk.get('source_reference'),
+            }
+
+    def delete_rows(self, mask):
+        for chunk_id in self.ids[mask].tolist():
+            self.payloads.pop(chunk_id, None)
+        keep = ~mask
+        self.ids, self.doc_ids, self.model_ids = self.ids[keep], self.doc_ids[keep], self.model_ids[keep]
+        self.matrix = self.matrix[keep]
+
+
+class LocalVectorStore(VectorStore):
+    """In-process NumPy store: no network, no DB round trip at query time
+
+    Producers are seeded from document_chunks on first use when a database is
+    reachable, and fed by ingestion afterwards. Filters use the same
+    AttributeMasks as the postgres backend, built over the store's rows once
+    per corpus generation; without an app context (offline runs) only the
+    model_id and document_id filters apply.
+    """
+    name = 'local'
+
+    def __init__(self, seed_from_db=True):
+        self.seed_from_db = seed_from_db
+        self._tenants = {}
+        self._seeded = set()
+        self._lock = threading.Lock()
+
+    def _tenant(self, producer_id, dim=None):
+        tenant = self._tenants.get(producer_id)
+        if tenant is None and self.seed_from_db and producer_id not in self._seeded:
+            self._seeded.add(producer_id)
+            tenant = self._seed(producer_id)
+        if tenant is None and dim is not None:
+            tenant = self._tenants[producer_id] = _LocalTenant(dim)
+        return tenant
+
+    def _seed(self, producer_id):
+        if not has_app_context():
+            return None
+        rows = db.session.query(
+            DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.model_id,
+            DocumentChunk.embedding_vec, DocumentChunk.chunk_text,
+            DocumentChunk.chunk_metadata, DocumentChunk.source_reference
+        ).filter(
+            DocumentChunk.producer_id == producer_id,
+            DocumentChunk.embedding_vec.isnot(None)
+        ).all()
+        if not rows:
+            return None
+        tenant = _LocalTenant(len(rows[0].embedding_vec) // 4)
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row.model_id, []).append({
+                'id': row.id,
+                'document_id': row.document_id,
+                'vector': np.frombuffer(row.embedding_vec, dtype='<f4'),
+                'text': row.chunk_text,
+                'page': row.chunk_metadata.get('page') if row.chunk_metadata else None,
+                'source_reference': row.source_reference,
+            })
+        for model_id, chunks in by_model.items():
+            tenant.upsert(model_id, chunks)
+        self._tenants[producer_id] = tenant
+        return tenant
+
+    def upsert(self, producer_id, model_id, chunks):
+        if not chunks:
+            return
+        with self._lock:
+            tenant = self._tenant(producer_id, dim=len(chunks[0]['vector']))
+            tenant.upsert(model_id, chunks)
+
+    def delete_document(self, producer_id, document_id):
+        with self._lock:
+            tenant = self._tenants.get(producer_id)
+            if tenant is not None:
+                tenant.delete_rows(tenant.doc_ids == document_id)
+
+    def query(self, query_embedding, producer_id, model_id=None, top_k=5, filters=None):
+        with self._lock:
+            tenant = self._tenant(producer_id)
+        if tenant is None or not len(tenant.ids):
+            return []
+
+        # Snapshot the arrays; upserts replace them rather than mutate in place
+        ids, doc_ids, model_ids, matrix = tenant.ids, tenant.doc_ids, tenant.model_ids, tenant.matrix
+        scores = matrix @ normalize_query(query_embedding)
+
+        resolved = resolve_filters(filters)
+        if model_id:
+            resolved['model_id'] = model_id
+        mask = self._mask(producer_id, tenant, ids, {'model_id': model_ids, 'document_id': doc_ids}, resolved)
+        scores = np.where(mask, scores, -np.inf)
+
+        from app.rag.vector_db import top_k_indices
+        order = top_k_indices(scores, min(top_k, int(mask.sum())))
+        results = []
+        for position in order:
+            chunk_id = int(ids[position])
+            payload = tenant.payloads.get(chunk_id, {})
+            results.append({
+                'chunk_id': chunk_id,
+                'text': payload.get('text', ''),
+                'doc_id': payload.get('doc_id'),
+                'page': payload.get('page'),
+                'source_reference': payload.get('source_reference'),
+                'score': float(scores[position])
+            })
+        return results
+
+    @staticmethod
+    def _mask(producer_id, tenant, ids, columns, filters):
+        """Boolean row mask of ids for resolved filters"""
+        if has_app_context():
+            cached = tenant.masks
+            stamp = generation(producer_id)
+            if cached is None or cached[0] is not ids or cached[1].stamp != stamp:
+                cached = tenant.masks = (ids, build_masks(producer_id, None, ids, stamp))
+            mask = cached[1].mask(filters)
+            return np.ones(len(ids), dtype=bool) if mask is None else mask
+        # Offline: only the columns the store keeps itself
+        mask = np.ones(len(ids), dtype=bool)
+        for field, column in columns.items():
+            value = filters.get(field)
+            if value is not None:
+                accepted = list(value) if isinstance(value, (list, tuple, set)) else [value]
+                mask &= np.isin(column, accepted)
+        return mask
+
+    def stats(self, producer_id=None):
+        tenants = self._tenants if producer_id is None else {
+            producer_id: self._tenants[producer_id]} if producer_id in self._tenants else {}
+        return {
+            'backend': self.name,
+            'chunks': sum(len(t.ids) for t in tenants.values()),
+            'bytes': sum(t.matrix.nbytes + t.ids.nbytes * 3 for t in tenants.values()),
+            'producers': len(tenants),
+        }
+
+
+BACKENDS = {
+    'postgres': PostgresVectorStore,
+    'pgvector': PgVectorStore,
+    'pinecone': PineconeVectorStore,
+    'local': LocalVectorStore,
+}
+
+_stores = {}
+
+
+def get_vector_store(backend=None):
+    """Vector store for the configured (or given) backend"""
+    backend = backend or current_app.config.get('VECTOR_BACKEND', 'postgres')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend}")
+    store = _stores.get(backend)
+    if store is None:
+        store = _stores[backend] = BACKENDS[backend]()
+    return store
+
+
+# ----------------------------------------------------------------------
+# Ingestion: mirror committed chunks into external backends
+# ----------------------------------------------------------------------
+
+def queue_upsert(session, producer_id, model_id, chunks):
+    """Upsert chunks into the configured backend once the session commits"""
+    store = get_vector_store()
+    if not store.external:
+        return
+    session.info.setdefault('vector_store_upserts', []).append((store, producer_id, model_id, chunks))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_upserts(session):
+    for store, producer_id, model_id, chunks in session.info.pop('vector_store_upserts', []):
+        try:
+            store.upsert(producer_id, model_id, chunks)
+        except Exception as e:
+            print(f"Vector store upsert error ({store.name}): {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_upserts(session):
+    session.info.pop('vector_store_upserts', None)
@@ -71,3 +71,19 @@ def list_documents():
             'status': doc.processing_status
         } for doc in docs]
     }), 200
+
+
+@bp.route('/search/cache', methods=['GET'])
+@token_required
+def search_cache_stats():
+    """Retrieval result cache counters of the caller's producer (this worker)"""
+    from app.rag.result_cache import result_cache
+    return jsonify({'producer_id': g.producer_id, **result_cache.stats(g.producer_id)}), 200
+
+
+@bp.route('/search/memory', methods=['GET'])
+@token_required
+def search_memory_report():
+    """Index memory of this worker: totals for all tenants, detail for the caller's producer"""
+    from app.rag.memory_budget import memory_budget
+    return jsonify(memory_budget.report(producer_ids={g.producer_id})), 200
@@ -1,6 +1,7 @@
 """Cleanup endpoint for removing old data"""
 from flask import Blueprint, jsonify
 from app.utils.rag import get_pinecone_index
+from app.rag.vector_store import PineconeVectorStore
 
 bp = Blueprint('cleanup', __name__)
 
@@ -36,17 +37,18 @@ def inspect_vectors():
             vector=query_emb,
             namespace="producer_1",
             top_k=3,
-            include_metadata=True
+            include_metadata=False
         )
         
+        # Vectors carry ids only; text and page come from document_chunks
         chunks_data = []
-        for match in results.matches:
+        for chunk in PineconeVectorStore.hydrate(1, results.matches, {}):
             chunks_data.append({
-                'id': match.id,
-                'score': match.score,
-                'text_preview': match.metadata.get('text', '')[:200],
-                'doc_id': match.metadata.get('doc_id'),
-                'page': match.metadata.get('page')
+                'id': chunk['vector_id'],
+                'score': chunk['score'],
+                'text_preview': chunk['text'][:200],
+                'doc_id': chunk['doc_id'],
+                'page': chunk['page']
             })
         
         return jsonify({
@@ -19,17 +19,33 @@ def query_ai():
         
         question = data['question']
         machine_id = data.get('machine_id')
+        # Fan-out over several machines: a list of ids, or 'all' authorized ones
+        machine_ids = data.get('machine_ids')
+        if machine_ids == 'all':
+            machine_ids = list(getattr(g, 'machine_ids', []))
+        
+        # Optional document filters; the model always comes from the machine
+        filters = {k: v for k, v in (data.get('filters') or {}).items()
+                   if k in ('doc_type', 'language', 'is_latest')}
         
         # SECURITY CHECK
         if machine_id:
             if not hasattr(g, 'machine_ids') or machine_id not in g.machine_ids:
                 return jsonify({'error': 'Access denied to this machine'}), 403
+        if machine_ids:
+            if not isinstance(machine_ids, list) or not all(
+                    isinstance(mid, int) and not isinstance(mid, bool) for mid in machine_ids):
+                return jsonify({'error': 'machine_ids must be a list of machine ids or "all"'}), 400
+            if not set(machine_ids) <= set(getattr(g, 'machine_ids', [])):
+                return jsonify({'error': 'Access denied to this machine'}), 403
         
         rag = RAGEngine()
         result = rag.query(
             question=question,
             producer_id=g.producer_id,
-            machine_id=machine_id
+            machine_id=machine_id,
+            filters=filters,
+            machine_ids=machine_ids
         )
         
         query_record = Query(
@@ -2,10 +2,18 @@
 import os
 import hashlib
 from datetime import datetime
+from flask import current_app
 from PyPDF2 import PdfReader
 from app import db
 from app.models.document import Document, DocumentChunk
 from app.utils.embeddings import generate_embeddings
+from app.rag.segment_store import queue_append
+from app.rag.vector_store import queue_upsert
+from app.rag.lexical import queue_index, tokenize, is_code_token
+from app.rag.dedup import simhash, SimHashIndex
+from app.rag.codes import index_chunk_codes
+
+EMBED_BATCH_SIZE = 128
 
 def process_pdf_document(file_path, producer_id, model_id, doc_type='manual', language='en', title=None):
     """Process PDF"""
@@ -57,16 +65,58 @@ def process_pdf_document(file_path, producer_id, model_id, doc_type='manual', la
     
     print(f"✂️  {len(all_chunks)} chunks")
     
+    # Collapse repeated boilerplate before paying for embeddings
+    all_chunks, reused = deduplicate_chunks(all_chunks, producer_id)
+    for idx, chunk in enumerate(all_chunks):
+        chunk['chunk_index'] = idx
+    
+    # Embed in batches (Voyage accepts up to 128 texts per call); near-duplicates
+    # of chunks the producer already has reuse the stored vector
+    to_embed = [c for c in all_chunks if c['chunk_index'] not in reused]
+    fresh = []
+    for start in range(0, len(to_embed), EMBED_BATCH_SIZE):
+        batch = to_embed[start:start + EMBED_BATCH_SIZE]
+        fresh.extend(generate_embeddings([c['text'] for c in batch]))
+    fresh = iter(fresh)
+    embeddings = [reused[c['chunk_index']] if c['chunk_index'] in reused else next(fresh)
+                  for c in all_chunks]
+    
     # Save chunks to DB (no Pinecone!)
-    for chunk in all_chunks:
+    db_chunks = []
+    for chunk, embedding in zip(all_chunks, embeddings):
         db_chunk = DocumentChunk(
             document_id=doc.id,
+            producer_id=doc.producer_id,
+            model_id=doc.model_id,
             chunk_index=chunk['chunk_index'],
             chunk_text=chunk['text'],
             source_reference=f"Page {chunk['page']}",
-            chunk_metadata={'page': chunk['page']}
+            chunk_metadata=chunk_metadata(chunk),
+            vector_id=f"doc_{doc.id}_chunk_{chunk['chunk_index']}",
+            simhash=chunk['simhash']
         )
+        db_chunk.set_embedding(embedding)
         db.session.add(db_chunk)
+        db_chunks.append(db_chunk)
+    
+    # New vectors go to a delta segment once the upload commits
+    if db_chunks:
+        db.session.flush()
+        queue_append(db.session, producer_id, model_id,
+                     [c.id for c in db_chunks], embeddings[:len(db_chunks)])
+        queue_index(db.session, producer_id, model_id,
+                    [c.id for c in db_chunks], [c.chunk_text for c in db_chunks])
+        index_chunk_codes(doc, db_chunks)
+        queue_upsert(db.session, producer_id, model_id, [{
+            'id': c.id,
+            'vector_id': c.vector_id,
+            'document_id': doc.id,
+            'doc_name': doc_title,
+            'vector': embedding,
+            'text': c.chunk_text,
+            'page': c.chunk_metadata.get('page'),
+            'source_reference': c.source_reference,
+        } for c, embedding in zip(db_chunks, embeddings)])
     
     doc.total_chunks = len(all_chunks)
     doc.processing_status = 'completed'
@@ -74,6 +124,98 @@ def process_pdf_document(file_path, producer_id, model_id, doc_type='manual', la
     print(f"✅ Complete!")
     return doc
 
+def chunk_metadata(chunk):
+    metadata = {'page': chunk['page']}
+    if chunk.get('alias_pages'):
+        metadata['alias_pages'] = chunk['alias_pages']
+    return metadata
+
+def deduplicate_chunks(chunks, producer_id):
+    """Drop near-duplicate chunks within a document and find reusable vectors in the producer
+    
+    Repeats inside the document are stored once; the canonical chunk records
+    the other pages in alias_pages. Near-duplicates of the producer's existing
+    chunks are kept (they belong to another model or document version, so
+    filters must still see them) but reuse the existing embedding.
+    
+    Returns (kept chunks, {position in kept chunks: embedding}).
+    """
+    config = current_app.config
+    for chunk in chunks:
+        chunk['simhash'] = simhash(chunk['text'])
+    if not config.get('DEDUP_ENABLED', True):
+        return chunks, {}
+    
+    max_distance = config.get('DEDUP_MAX_DISTANCE', 4)
+    seen = SimHashIndex(max_distance)
+    kept = []
+    for chunk in chunks:
+        canonical = seen.find(chunk['simhash'])
+        if canonical is None or not same_codes(chunk['text'], kept[canonical]['text']):
+            seen.add(chunk['simhash'], len(kept))
+            kept.append(chunk)
+            continue
+        # Duplicates join the index too, so slowly drifting repeats still match
+        seen.add(chunk['simhash'], canonical)
+        if chunk['page'] != kept[canonical]['page']:
+            aliases = kept[canonical].setdefault('alias_pages', [])
+            if chunk['page'] not in aliases:
+                aliases.append(chunk['page'])
+    
+    existing = producer_fingerprints(producer_id, max_distance)
+    matches = {}
+    for position, chunk in enumerate(kept):
+        chunk_id = existing.find(chunk['simhash'])
+        if chunk_id is not None:
+            matches[position] = chunk_id
+    
+    reused = {}
+    if matches:
+        rows = DocumentChunk.query.options(
+            db.undefer_group('text'), db.undefer_group('vectors')
+        ).filter(DocumentChunk.id.in_(set(matches.values()))).all()
+        by_id = {row.id: row for row in rows}
+        for position, chunk_id in matches.items():
+            row = by_id.get(chunk_id)
+            if row is None or not same_codes(kept[position]['text'], row.chunk_text):
+                continue
+            vector = row.get_embedding()
+            if vector is not None:
+                reused[position] = vector.tolist()
+    
+    print(f"♻️  {len(chunks) - len(kept)} duplicate chunks aliased, {len(reused)} embeddings reused")
+    return kept, reused
+
+def same_codes(text, other):
+    """Near-duplicates must still agree on every error code / part number they mention"""
+    codes = {t for t in tokenize(text) if is_code_token(t)}
+    return codes == {t for t in tokenize(other) if is_code_token(t)}
+
+def producer_fingerprints(producer_id, max_distance=4):
+    """SimHashIndex of the producer's embedded chunks, fingerprinting any not done yet"""
+    rows = db.session.query(DocumentChunk.id, DocumentChunk.simhash).filter(
+        DocumentChunk.producer_id == producer_id,
+        DocumentChunk.embedding_vec.isnot(None)
+    ).all()
+    
+    missing = [chunk_id for chunk_id, fingerprint in rows if fingerprint is None]
+    computed = {}
+    for start in range(0, len(missing), 1000):
+        batch = db.session.query(DocumentChunk.id, DocumentChunk.chunk_text).filter(
+            DocumentChunk.id.in_(missing[start:start + 1000])).all()
+        updates = [{'id': chunk_id, 'simhash': simhash(text)} for chunk_id, text in batch]
+        db.session.bulk_update_mappings(DocumentChunk, updates)
+        computed.update((u['id'], u['simhash']) for u in updates)
+    if missing:
+        print(f"🔏 Fingerprinted {len(missing)} existing chunks")
+    
+    index = SimHashIndex(max_distance)
+    for chunk_id, fingerprint in rows:
+        fingerprint = computed.get(chunk_id, fingerprint)
+        if fingerprint is not None:
+            index.add(fingerprint, chunk_id)
+    return index
+
 def chunk_content(text, chunk_size=800, overlap=150, page_number=None):
     """Split text"""
     chunks = []
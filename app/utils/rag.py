@@ -1,10 +1,10 @@
 """RAG Engine - Retrieval Augmented Generation with Multimodal Support"""
 import os
 import time
-import ast
 from anthropic import Anthropic
 from pinecone import Pinecone
 from app.utils.embeddings import generate_query_embedding
+from app.rag.vector_store import get_vector_store
 
 def get_anthropic_client():
     """Get Anthropic client"""
@@ -57,46 +57,27 @@ class RAGEngine:
             
             retrieval_start = time.time()
             
-            index = get_pinecone_index()
-            namespace = f"producer_{producer_id}"
-            filter_dict = {"producer_id": producer_id}
-            if machine_id:
-                filter_dict["model_id"] = machine_id
-            
-            results = index.query(
-                vector=query_embedding,
-                namespace=namespace,
-                filter=filter_dict,
-                top_k=5,
-                include_metadata=True
-            )
+            store = get_vector_store()
+            results = store.query(query_embedding, producer_id, model_id=machine_id, top_k=5)
             
             retrieval_time_ms = int((time.time() - retrieval_start) * 1000)
             
             context_chunks = []
             all_images = []
             
-            for match in results.matches:
-                if match.score > 0.5:
+            for match in results:
+                if match['score'] > 0.5:
                     chunk_data = {
-                        'text': match.metadata.get('text', ''),
-                        'doc_name': match.metadata.get('doc_name', 'Unknown'),
-                        'page': match.metadata.get('page', 0),
-                        'doc_id': match.metadata.get('doc_id', 0),
-                        'score': match.score
+                        'text': match.get('text', ''),
+                        'doc_name': match.get('doc_name', 'Unknown'),
+                        'page': match.get('page') or 0,
+                        'doc_id': match.get('doc_id') or 0,
+                        'score': match['score']
                     }
                     context_chunks.append(chunk_data)
                     
-                    # Extract images if present
-                    if match.metadata.get('has_images'):
-                        images_str = match.metadata.get('images', '[]')
-                        try:
-                            # Parse images metadata (stored as string)
-                            images_list = ast.literal_eval(images_str)
-                            if isinstance(images_list, list):
-                                all_images.extend(images_list)
-                        except:
-                            pass
+                    # Images come hydrated from the chunk's metadata
+                    all_images.extend(match.get('images') or [])
             
             if not context_chunks:
                 return {
@@ -25,6 +25,7 @@ ALTER TABLE documents ENABLE ROW LEVEL SECURITY;
 ALTER TABLE document_chunks ENABLE ROW LEVEL SECURITY;
 ALTER TABLE document_versions ENABLE ROW LEVEL SECURITY;
 ALTER TABLE queries ENABLE ROW LEVEL SECURITY;
+ALTER TABLE code_references ENABLE ROW LEVEL SECURITY;
 
 -- User tables (filtered by end_customer → producer)
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -33,6 +34,9 @@ ALTER TABLE user_machine_access ENABLE ROW LEVEL SECURITY;
 -- Admin tables
 ALTER TABLE producer_admins ENABLE ROW LEVEL SECURITY;
 
+-- index_generations has no RLS: it holds only change counters, is written
+-- after commit on a separate connection and read by every worker's listener
+
 -- ============================================================================
 -- HELPER FUNCTION: Get current producer_id from session
 -- ============================================================================
@@ -107,14 +111,18 @@ CREATE POLICY document_isolation ON documents
 -- POLICIES: DOCUMENT_CHUNKS
 -- ============================================================================
 
--- Chunks inherit isolation from parent document
+-- Chunks carry their document's producer_id (copied at ingest), so reads
+-- compare a column instead of probing documents for every row. Writes still
+-- check that the parent document belongs to the same producer.
 CREATE POLICY document_chunk_isolation ON document_chunks
     FOR ALL
-    USING (
-        EXISTS (
+    USING (producer_id = get_current_producer_id())
+    WITH CHECK (
+        producer_id = get_current_producer_id()
+        AND EXISTS (
             SELECT 1 FROM documents
             WHERE documents.id = document_chunks.document_id
-            AND documents.producer_id = get_current_producer_id()
+            AND documents.producer_id = document_chunks.producer_id
         )
     );
 
@@ -132,6 +140,14 @@ CREATE POLICY document_version_isolation ON document_versions
         )
     );
 
+-- ============================================================================
+-- POLICIES: CODE_REFERENCES
+-- ============================================================================
+
+CREATE POLICY code_reference_isolation ON code_references
+    FOR ALL
+    USING (producer_id = get_current_producer_id());
+
 -- ============================================================================
 -- POLICIES: QUERIES
 -- ============================================================================
@@ -0,0 +1,31 @@
+"""Chunk SimHash fingerprints
+
+Revision ID: 3f6a2c9d81b4
+Revises: 8d1e0b5442b2
+Create Date: 2026-10-17 14:02:11.508214
+
+Adds DocumentChunk.simhash for near-duplicate detection at ingest. Existing
+chunks are fingerprinted lazily, the first time their producer ingests a
+new document.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2c9d81b4'
+down_revision = '8d1e0b5442b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('document_chunks')}
+    if 'simhash' not in columns:
+        with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('simhash', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.drop_column('simhash')
@@ -0,0 +1,33 @@
+"""Index generations
+
+Revision ID: 5b7e3d1a9c20
+Revises: a41d7e05c2f9
+Create Date: 2026-10-17 17:05:43.582190
+
+Per-(producer, machine model) change counters used to invalidate in-process
+caches on every worker.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e3d1a9c20'
+down_revision = 'a41d7e05c2f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('index_generations',
+    sa.Column('producer_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('generation', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['producer_id'], ['producers.id'], ),
+    sa.PrimaryKeyConstraint('producer_id', 'model_id')
+    )
+
+
+def downgrade():
+    op.drop_table('index_generations')
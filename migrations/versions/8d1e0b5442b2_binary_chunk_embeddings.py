@@ -0,0 +1,98 @@
+"""Binary chunk embeddings
+
+Revision ID: 8d1e0b5442b2
+Revises: c79ef1bb98fe
+Create Date: 2026-10-17 09:12:40.215331
+
+Adds a raw little-endian float32 copy of DocumentChunk.embedding and
+backfills it from the JSON column in small, individually committed
+batches. Column creation is idempotent and the backfill only touches rows
+where embedding_vec is still NULL, so an interrupted upgrade can simply
+be re-run.
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1e0b5442b2'
+down_revision = 'c79ef1bb98fe'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+EMBEDDING_MODEL = 'voyage-2'
+
+
+def _chunk_columns():
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns('document_chunks')}
+
+
+def upgrade():
+    # Columns are only added when missing, so an interrupted upgrade can be re-run
+    # (the JSON embedding column was added by hand in production and never migrated)
+    columns = _chunk_columns()
+    new_columns = [
+        sa.Column('embedding', sa.JSON(), nullable=True),
+        sa.Column('embedding_vec', sa.LargeBinary(), nullable=True),
+        sa.Column('embedding_dim', sa.Integer(), nullable=True),
+        sa.Column('embedding_model', sa.String(length=50), nullable=True),
+    ]
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        for column in new_columns:
+            if column.name not in columns:
+                batch_op.add_column(column)
+
+    backfill()
+
+
+def backfill():
+    """Copy JSON embeddings into embedding_vec, one committed batch at a time"""
+    select_batch = sa.text(
+        "SELECT id, embedding FROM document_chunks "
+        "WHERE embedding_vec IS NULL AND embedding IS NOT NULL AND id > :last_id "
+        "ORDER BY id LIMIT :limit"
+    )
+    update_row = sa.text(
+        "UPDATE document_chunks SET embedding_vec = :vec, embedding_dim = :dim, "
+        "embedding_model = :model WHERE id = :id"
+    )
+
+    last_id = 0
+    total = 0
+    # Commit per batch so no lock is held for the whole table
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            rows = bind.execute(select_batch, {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+
+            params = []
+            for chunk_id, embedding in rows:
+                # Values were stored as JSON text inside the JSON column
+                while isinstance(embedding, str):
+                    embedding = json.loads(embedding)
+                if not embedding:
+                    continue
+                params.append({
+                    'id': chunk_id,
+                    'vec': np.asarray(embedding, dtype='<f4').tobytes(),
+                    'dim': len(embedding),
+                    'model': EMBEDDING_MODEL,
+                })
+
+            if params:
+                bind.execute(update_row, params)
+            last_id = rows[-1][0]
+            total += len(params)
+            print(f"  backfilled {total} chunk embeddings (last id {last_id})")
+
+
+def downgrade():
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.drop_column('embedding_model')
+        batch_op.drop_column('embedding_dim')
+        batch_op.drop_column('embedding_vec')
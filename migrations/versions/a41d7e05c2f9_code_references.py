@@ -0,0 +1,56 @@
+"""Code references
+
+Revision ID: a41d7e05c2f9
+Revises: 3f6a2c9d81b4
+Create Date: 2026-10-17 15:40:27.119842
+
+Exact lookup table of error codes and part numbers extracted at ingest,
+plus per-producer extraction regexes. Documents ingested earlier are indexed
+with scripts/backfill_code_references.py.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d7e05c2f9'
+down_revision = '3f6a2c9d81b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('code_references',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('producer_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=True),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('chunk_id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=100), nullable=False),
+    sa.Column('display_code', sa.String(length=100), nullable=False),
+    sa.Column('code_type', sa.String(length=20), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('page', sa.Integer(), nullable=True),
+    sa.Column('source_reference', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['chunk_id'], ['document_chunks.id'], ),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ),
+    sa.ForeignKeyConstraint(['model_id'], ['machine_models.id'], ),
+    sa.ForeignKeyConstraint(['producer_id'], ['producers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('code_references', schema=None) as batch_op:
+        batch_op.create_index('idx_code_lookup', ['producer_id', 'model_id', 'code'], unique=False)
+
+    with op.batch_alter_table('producers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('code_patterns', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('producers', schema=None) as batch_op:
+        batch_op.drop_column('code_patterns')
+
+    with op.batch_alter_table('code_references', schema=None) as batch_op:
+        batch_op.drop_index('idx_code_lookup')
+
+    op.drop_table('code_references')
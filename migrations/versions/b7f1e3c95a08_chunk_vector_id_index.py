@@ -0,0 +1,28 @@
+"""Chunk vector id index
+
+Revision ID: b7f1e3c95a08
+Revises: c3d8f5a2e714
+Create Date: 2026-10-17 20:11:36.580214
+
+Pinecone vectors now carry ids only; query results are hydrated from
+document_chunks by (producer_id, vector_id).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f1e3c95a08'
+down_revision = 'c3d8f5a2e714'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.create_index('idx_chunks_vector', ['producer_id', 'vector_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.drop_index('idx_chunks_vector')
@@ -0,0 +1,115 @@
+"""Chunk tenant columns
+
+Revision ID: c3d8f5a2e714
+Revises: e2c4a7b91f36
+Create Date: 2026-10-17 19:05:48.301762
+
+Copies producer_id and model_id from documents onto document_chunks so
+searches and the document_chunk_isolation RLS policy filter chunks without
+joining documents. The backfill walks id ranges in individually committed
+batches and only touches rows still missing producer_id, so an interrupted
+upgrade can simply be re-run. On PostgreSQL the RLS policy, if installed,
+is replaced by a direct column comparison (see migrations/rls_policies.sql).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8f5a2e714'
+down_revision = 'e2c4a7b91f36'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+POLICY_EXISTS = (
+    "SELECT 1 FROM pg_policies WHERE tablename = 'document_chunks' "
+    "AND policyname = 'document_chunk_isolation'"
+)
+
+DIRECT_POLICY = """
+CREATE POLICY document_chunk_isolation ON document_chunks
+    FOR ALL
+    USING (producer_id = get_current_producer_id())
+    WITH CHECK (
+        producer_id = get_current_producer_id()
+        AND EXISTS (
+            SELECT 1 FROM documents
+            WHERE documents.id = document_chunks.document_id
+            AND documents.producer_id = document_chunks.producer_id
+        )
+    )
+"""
+
+PARENT_POLICY = """
+CREATE POLICY document_chunk_isolation ON document_chunks
+    FOR ALL
+    USING (
+        EXISTS (
+            SELECT 1 FROM documents
+            WHERE documents.id = document_chunks.document_id
+            AND documents.producer_id = get_current_producer_id()
+        )
+    )
+"""
+
+
+def _chunk_columns():
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns('document_chunks')}
+
+
+def _replace_policy(policy):
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or bind.execute(sa.text(POLICY_EXISTS)).first() is None:
+        return
+    op.execute("DROP POLICY document_chunk_isolation ON document_chunks")
+    op.execute(policy)
+
+
+def upgrade():
+    columns = _chunk_columns()
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        if 'producer_id' not in columns:
+            batch_op.add_column(sa.Column('producer_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_chunks_producer', 'producers', ['producer_id'], ['id'])
+        if 'model_id' not in columns:
+            batch_op.add_column(sa.Column('model_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_chunks_model', 'machine_models', ['model_id'], ['id'])
+
+    backfill()
+
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.alter_column('producer_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index('idx_chunks_tenant', ['producer_id', 'model_id'], unique=False)
+
+    _replace_policy(DIRECT_POLICY)
+
+
+def backfill():
+    """Copy each chunk's document tenant, one committed id range at a time"""
+    update_range = sa.text(
+        "UPDATE document_chunks SET "
+        "producer_id = (SELECT producer_id FROM documents WHERE documents.id = document_chunks.document_id), "
+        "model_id = (SELECT model_id FROM documents WHERE documents.id = document_chunks.document_id) "
+        "WHERE producer_id IS NULL AND id > :low AND id <= :high"
+    )
+
+    total = 0
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        max_id = bind.execute(sa.text("SELECT MAX(id) FROM document_chunks")).scalar() or 0
+        for low in range(0, max_id, BATCH_SIZE):
+            total += bind.execute(update_range, {'low': low, 'high': low + BATCH_SIZE}).rowcount
+            print(f"  backfilled tenant of {total} chunks (up to id {min(low + BATCH_SIZE, max_id)})")
+
+
+def downgrade():
+    _replace_policy(PARENT_POLICY)
+
+    with op.batch_alter_table('document_chunks', schema=None) as batch_op:
+        batch_op.drop_index('idx_chunks_tenant')
+        batch_op.drop_constraint('fk_chunks_model', type_='foreignkey')
+        batch_op.drop_constraint('fk_chunks_producer', type_='foreignkey')
+        batch_op.drop_column('model_id')
+        batch_op.drop_column('producer_id')
@@ -0,0 +1,111 @@
+"""pgvector embeddings
+
+Revision ID: e2c4a7b91f36
+Revises: 5b7e3d1a9c20
+Create Date: 2026-10-17 18:22:09.734415
+
+For the pgvector backend only: enables the vector extension, adds
+document_chunks.embedding_pgv vector(1024), backfills it from embedding_vec
+in small committed batches and builds an HNSW cosine index. The upgrade is a
+no-op (and later revisions apply as usual) unless the database is PostgreSQL,
+VECTOR_BACKEND is pgvector and the vector extension is available. A
+deployment switching to pgvector later runs scripts/enable_pgvector.py,
+which applies the same steps. Every step is idempotent, so an interrupted
+upgrade can simply be re-run.
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c4a7b91f36'
+down_revision = '5b7e3d1a9c20'
+branch_labels = None
+depends_on = None
+
+DIM = 1024
+BATCH_SIZE = 500
+
+
+def _is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _extension_available():
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT 1 FROM pg_extension WHERE extname = 'vector'")).first():
+        return True
+    if not bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")).first():
+        return False
+    # Installed on the server, but creating it may need privileges we lack
+    try:
+        with bind.begin_nested():
+            bind.execute(sa.text("CREATE EXTENSION IF NOT EXISTS vector"))
+    except sa.exc.DBAPIError as e:
+        print(f"  pgvector: cannot create the vector extension ({e.orig}), skipping")
+        return False
+    return True
+
+
+def upgrade():
+    if not _is_postgres():
+        print("  pgvector: not PostgreSQL, skipping")
+        return
+    if os.environ.get('VECTOR_BACKEND', 'postgres') != 'pgvector':
+        print("  pgvector: VECTOR_BACKEND is not pgvector, skipping (see scripts/enable_pgvector.py)")
+        return
+    provision()
+
+
+def provision():
+    """Extension, column, backfill and HNSW index; skipped without the extension"""
+    if not _extension_available():
+        print("  pgvector: vector extension not available, skipping")
+        return
+    op.execute(f"ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_pgv vector({DIM})")
+    backfill()
+    # CONCURRENTLY keeps uploads and searches running while the graph is built
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunk_embedding_hnsw ON document_chunks "
+            "USING hnsw (embedding_pgv vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+        )
+
+
+def backfill():
+    """Copy embedding_vec into embedding_pgv, one committed batch at a time"""
+    select_batch = sa.text(
+        "SELECT id, embedding_vec FROM document_chunks "
+        "WHERE embedding_pgv IS NULL AND embedding_vec IS NOT NULL AND id > :last_id "
+        "ORDER BY id LIMIT :limit"
+    )
+    update_row = sa.text("UPDATE document_chunks SET embedding_pgv = CAST(:vec AS vector) WHERE id = :id")
+
+    last_id = 0
+    total = 0
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            rows = bind.execute(select_batch, {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+            params = []
+            for chunk_id, blob in rows:
+                vector = np.frombuffer(bytes(blob), dtype='<f4')
+                if len(vector) != DIM:
+                    continue
+                params.append({'id': chunk_id, 'vec': '[' + ','.join(f"{x:.7g}" for x in vector) + ']'})
+            if params:
+                bind.execute(update_row, params)
+            last_id = rows[-1][0]
+            total += len(params)
+            print(f"  backfilled {total} pgvector embeddings (last id {last_id})")
+
+
+def downgrade():
+    if not _is_postgres():
+        return
+    op.execute("DROP INDEX IF EXISTS idx_chunk_embedding_hnsw")
+    op.execute("ALTER TABLE document_chunks DROP COLUMN IF EXISTS embedding_pgv")
@@ -0,0 +1,62 @@
+"""Index error codes / part numbers of documents ingested before code_references
+
+Ingestion fills code_references for new uploads only. This walks existing
+documents (of the given producers, or all) that have no code rows yet and
+extracts codes from their chunks with the producer's patterns, committing
+one document at a time, so an interrupted run can simply be re-run.
+
+Usage: python scripts/backfill_code_references.py [producer_id ...] [--batch N] [--dry-run]
+"""
+import sys
+import os
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models.code import CodeReference
+from app.models.document import Document, DocumentChunk
+from app.rag.codes import index_chunk_codes
+
+
+def pending_documents(producer_ids):
+    """Ids of documents without any code reference, oldest first"""
+    indexed = db.session.query(CodeReference.document_id).filter(CodeReference.document_id == Document.id)
+    query = db.session.query(Document.id).filter(~indexed.exists())
+    if producer_ids:
+        query = query.filter(Document.producer_id.in_(producer_ids))
+    return [doc_id for doc_id, in query.order_by(Document.id)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_ids', nargs='*', type=int)
+    parser.add_argument('--batch', type=int, default=500, help='chunks loaded per query')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        doc_ids = pending_documents(args.producer_ids)
+        print(f"📊 {len(doc_ids)} documents without code references")
+        total = 0
+        for n, doc_id in enumerate(doc_ids, start=1):
+            doc = db.session.get(Document, doc_id)
+            last_id = 0
+            while True:
+                chunks = DocumentChunk.query.options(db.undefer_group('text')).filter(
+                    DocumentChunk.document_id == doc_id, DocumentChunk.id > last_id
+                ).order_by(DocumentChunk.id).limit(args.batch).all()
+                if not chunks:
+                    break
+                total += index_chunk_codes(doc, chunks)
+                last_id = chunks[-1].id
+            if args.dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            print(f"  {n}/{len(doc_ids)} documents, {total} codes")
+        print(f"✅ {total} code references {'found' if args.dry_run else 'added'}")
+
+
+if __name__ == '__main__':
+    main()
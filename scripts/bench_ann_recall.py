@@ -0,0 +1,59 @@
+"""Benchmark: HNSW recall@k vs latency on synthetic vectors
+
+Builds an HNSW graph over clustered random unit vectors (manual chunks are
+strongly clustered by topic, uniform noise would flatter nobody) and compares
+it with exact matrix-vector search for a range of ef_search values.
+
+Usage: python scripts/bench_ann_recall.py [n_vectors] [dim] [k]
+"""
+import sys
+import os
+import time
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.hnsw import HNSWIndex
+
+
+def synthetic_corpus(n, dim, n_clusters=200, seed=7):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def main(n=20000, dim=256, k=10, n_queries=200):
+    matrix = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(n_queries, dim, seed=11)
+
+    start = time.perf_counter()
+    index = HNSWIndex(matrix).build()
+    print(f"🕸️  Built HNSW over {n} x {dim} in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    truth = []
+    for q in queries:
+        scores = matrix @ q
+        top = np.argpartition(scores, -k)[-k:]
+        truth.append(set(top.tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+    print(f"  exact      : recall@{k} 1.000, {exact_ms:7.3f} ms/query")
+
+    for ef in (16, 32, 64, 128, 256):
+        hits = 0
+        latencies = []
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            positions, _ = index.search(q, k, ef_search=ef)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & set(positions.tolist()))
+        recall = hits / (k * n_queries)
+        print(f"  ef={ef:<4}   : recall@{k} {recall:.3f}, {np.median(latencies):7.3f} ms/query "
+              f"(p95 {np.percentile(latencies, 95):.3f})")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
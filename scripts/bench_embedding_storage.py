@@ -0,0 +1,50 @@
+"""Benchmark: JSON vs binary embedding storage per 10k chunks
+
+Compares payload size (what Postgres stores and sends over the wire) and
+client-side decode time for the legacy JSON column and the float32
+LargeBinary column.
+
+Usage: python scripts/bench_embedding_storage.py [n_chunks] [dim]
+"""
+import sys
+import os
+import json
+import time
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.codec import encode_embedding, decode_embeddings
+
+
+def main(n_chunks=10000, dim=1024):
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((n_chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Legacy: JSON text as stored by json.dumps(list_of_floats)
+    json_rows = [json.dumps([float(x) for x in v]) for v in vectors]
+    json_bytes = sum(len(r.encode()) for r in json_rows)
+
+    start = time.perf_counter()
+    decoded = np.asarray([json.loads(r) for r in json_rows], dtype=np.float32)
+    json_ms = (time.perf_counter() - start) * 1000
+
+    # Binary: raw little-endian float32
+    blob_rows = [encode_embedding(v) for v in vectors]
+    blob_bytes = sum(len(b) for b in blob_rows)
+
+    start = time.perf_counter()
+    matrix = decode_embeddings(blob_rows, dim)
+    blob_ms = (time.perf_counter() - start) * 1000
+
+    assert np.allclose(decoded, matrix)
+
+    print(f"📊 {n_chunks} chunks x {dim} dims")
+    print(f"  JSON   : {json_bytes / 1e6:8.1f} MB, decode {json_ms:8.1f} ms")
+    print(f"  binary : {blob_bytes / 1e6:8.1f} MB, decode {blob_ms:8.1f} ms")
+    print(f"  size x{json_bytes / blob_bytes:.1f} smaller, decode x{json_ms / max(blob_ms, 1e-6):.0f} faster")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,71 @@
+"""Benchmark: recall@k and latency of coarse-to-fine (document -> section -> chunk)
+search against flat exact search
+
+Builds a manual-shaped corpus: each document has a topic, each section a
+subtopic within it, each chunk noise around its section. Queries are noisy
+copies of random chunks. Flat search scores every row; hierarchical search
+(app.rag.hierarchy) scores document and section centroids first and only
+the chunks of the best sections.
+
+Usage: python scripts/bench_hierarchical.py [n_docs] [chunks_per_doc] [dim]
+"""
+import sys
+import os
+import time
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.hierarchy import Hierarchy, SECTION_CHUNKS
+from app.rag.vector_db import top_k_indices
+
+
+def manual_corpus(n_docs, chunks_per_doc, dim, seed=7):
+    """(matrix, doc_labels) with document topics and section subtopics"""
+    rng = np.random.default_rng(seed)
+    n = n_docs * chunks_per_doc
+    doc_labels = np.repeat(np.arange(n_docs), chunks_per_doc)
+    sections = doc_labels * chunks_per_doc + np.arange(n) % chunks_per_doc // SECTION_CHUNKS
+    doc_topics = rng.standard_normal((n_docs, dim)).astype(np.float32)
+    section_topics = rng.standard_normal((sections.max() + 1, dim)).astype(np.float32)
+    matrix = (doc_topics[doc_labels] + 0.8 * section_topics[sections]
+              + 2.0 * rng.standard_normal((n, dim)).astype(np.float32))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix, doc_labels
+
+
+def main(n_docs=500, chunks_per_doc=200, dim=384, k=5, n_queries=200):
+    matrix, doc_labels = manual_corpus(n_docs, chunks_per_doc, dim)
+    n = len(matrix)
+    print(f"📊 {n_docs} documents x {chunks_per_doc} chunks = {n} x {dim} ({n * dim * 4 / 1e6:.0f} MB)")
+
+    rng = np.random.default_rng(11)
+    queries = matrix[rng.integers(0, n, n_queries)] + 0.03 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    hierarchy = Hierarchy(matrix, doc_labels)
+    print(f"🌳 Built {hierarchy.n_docs} document / {len(hierarchy.section_doc)} section centroids "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms ({hierarchy.nbytes / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    truth = [set(top_k_indices(matrix @ q, k).tolist()) for q in queries]
+    flat_ms = (time.perf_counter() - start) * 1000 / n_queries
+    print(f"  flat               : recall@{k} 1.000, {flat_ms:7.3f} ms/query, {n} rows scored")
+
+    for doc_fanout, section_fanout in ((5, 10), (10, 20), (20, 40), (50, 100)):
+        hits, scored = 0, 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            rows = hierarchy.candidate_rows(q, doc_fanout, section_fanout)
+            scores = matrix[rows] @ q
+            found = rows[top_k_indices(scores, k)]
+            hits += len(expected & set(found.tolist()))
+            scored += len(rows)
+        ms = (time.perf_counter() - start) * 1000 / n_queries
+        print(f"  docs={doc_fanout:<3} sections={section_fanout:<4}: recall@{k} {hits / (k * n_queries):.3f}, "
+              f"{ms:7.3f} ms/query, {scored // n_queries} rows scored")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
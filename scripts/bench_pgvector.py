@@ -0,0 +1,128 @@
+"""Benchmark: pgvector HNSW top-k vs fetching every embedding into Python
+
+Loads synthetic clustered vectors into a scratch table (vector(dim) plus the
+same values as float32 bytea, like embedding_vec) of a PostgreSQL database
+with the vector extension, builds the HNSW index the migration creates and
+compares, per query:
+  - pgvector  : ORDER BY embedding <=> :q LIMIT k inside PostgreSQL
+  - fetch+scan: SELECT every blob, decode and score with numpy (cold path)
+  - cached    : numpy scan of an already decoded matrix (warm index cache)
+Recall@k is measured against the exact numpy answer.
+
+Usage: PGVECTOR_BENCH_URL=postgresql://user:pw@localhost/bench \\
+       python scripts/bench_pgvector.py [sizes ...] [--dim 1024] [--k 10]
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from bench_ann_recall import synthetic_corpus
+
+TABLE = 'bench_pgvector_chunks'
+
+
+def literal(vector):
+    return '[' + ','.join(f"{x:.7g}" for x in vector) + ']'
+
+
+def load(engine, matrix, batch=1000):
+    dim = matrix.shape[1]
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, embedding vector({dim}), blob bytea)"))
+    start = time.perf_counter()
+    for offset in range(0, len(matrix), batch):
+        rows = [
+            {'id': offset + i, 'vec': literal(v), 'blob': v.astype('<f4').tobytes()}
+            for i, v in enumerate(matrix[offset:offset + batch])
+        ]
+        with engine.begin() as conn:
+            conn.execute(text(f"INSERT INTO {TABLE} VALUES (:id, CAST(:vec AS vector), :blob)"), rows)
+    print(f"  loaded {len(matrix)} rows in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("SET maintenance_work_mem = '1GB'"))
+        conn.execute(text(
+            f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        ))
+        conn.execute(text(f"ANALYZE {TABLE}"))
+    print(f"  built HNSW in {time.perf_counter() - start:.1f}s")
+
+
+def report(label, latencies, hits, k, n_queries):
+    print(f"  {label:<11}: recall@{k} {hits / (k * n_queries):.3f}, {np.median(latencies):8.2f} ms/query "
+          f"(p95 {np.percentile(latencies, 95):.2f})")
+
+
+def run(engine, n, dim, k, n_queries, ef_search):
+    print(f"📊 {n} x {dim}, k={k}, ef_search={ef_search}")
+    matrix = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(n_queries, dim, seed=11)
+    load(engine, matrix)
+
+    truth = []
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        scores = matrix @ q
+        top = np.argpartition(scores, -k)[-k:]
+        latencies.append((time.perf_counter() - start) * 1000)
+        truth.append(set(top.tolist()))
+    report('cached', latencies, k * n_queries, k, n_queries)
+
+    latencies, hits = [], 0
+    with engine.connect() as conn:
+        conn.execute(text(f"SET hnsw.ef_search = {int(ef_search)}"))
+        search = text(f"SELECT id FROM {TABLE} ORDER BY embedding <=> CAST(:q AS vector) LIMIT :k")
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            ids = [row[0] for row in conn.execute(search, {'q': literal(q), 'k': k})]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & set(ids))
+    report('pgvector', latencies, hits, k, n_queries)
+
+    # Every query pays the full transfer; a handful is enough
+    latencies, hits = [], 0
+    with engine.connect() as conn:
+        for q, expected in list(zip(queries, truth))[:5]:
+            start = time.perf_counter()
+            rows = conn.execute(text(f"SELECT id, blob FROM {TABLE}")).all()
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            vectors = np.frombuffer(b''.join(bytes(row[1]) for row in rows), dtype='<f4').reshape(len(rows), dim)
+            scores = vectors @ q
+            top = ids[np.argpartition(scores, -k)[-k:]]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & set(top.tolist()))
+    report('fetch+scan', latencies, hits, k, 5)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--ef-search', type=int, default=100)
+    args = parser.parse_args()
+
+    url = os.environ.get('PGVECTOR_BENCH_URL')
+    if not url:
+        sys.exit("Set PGVECTOR_BENCH_URL to a PostgreSQL database with the vector extension available")
+    engine = create_engine(url)
+    try:
+        for n in args.sizes:
+            run(engine, n, args.dim, args.k, args.queries, args.ef_search)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark: full vs ids-only Pinecone metadata, against a local stand-in
+
+Loads one producer's embedded chunks into an in-process stand-in for a
+Pinecone index whose query responses go through JSON like the REST API, in
+two layouts:
+  - full : text, page, source reference, doc name and a stringified images
+           list in metadata, queried with include_metadata=True (old layout)
+  - slim : ids and filter fields only, include_metadata=False, then one
+           hydration query against document_chunks (PineconeVectorStore)
+and reports response bytes and latency per query.
+
+Usage: python scripts/bench_pinecone_metadata.py <producer_id> [--queries N] [--top-k K]
+"""
+import sys
+import os
+import json
+import time
+import argparse
+from types import SimpleNamespace
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models.document import Document, DocumentChunk
+from app.rag.vector_store import PineconeVectorStore
+
+
+class LocalPineconeIndex:
+    """Exact search over one namespace; responses are serialized to JSON and back"""
+
+    def __init__(self):
+        self.ids = []
+        self.metadata = []
+        self.vectors = []
+        self.response_bytes = []
+
+    def upsert(self, vectors, namespace=None):
+        for vector in vectors:
+            values = np.asarray(vector['values'], dtype=np.float32)
+            self.ids.append(vector['id'])
+            self.metadata.append(vector['metadata'])
+            self.vectors.append(values / (np.linalg.norm(values) or 1.0))
+
+    def query(self, vector, namespace=None, filter=None, top_k=5, include_metadata=False):
+        matrix = np.asarray(self.vectors)
+        scores = matrix @ (np.asarray(vector, dtype=np.float32) / np.linalg.norm(vector))
+        for key, value in (filter or {}).items():
+            accepted = set(value['$in']) if isinstance(value, dict) else {value}
+            scores[[m.get(key) not in accepted for m in self.metadata]] = -np.inf
+        top = np.argsort(-scores)[:top_k]
+        body = json.dumps({'namespace': namespace, 'matches': [
+            dict(id=self.ids[i], score=float(scores[i]),
+                 **({'metadata': self.metadata[i]} if include_metadata else {}))
+            for i in top if np.isfinite(scores[i])
+        ]}).encode()
+        self.response_bytes.append(len(body))
+        return SimpleNamespace(matches=[SimpleNamespace(**{'metadata': None, **m}) for m in json.loads(body)['matches']])
+
+
+def full_metadata(row, title):
+    """Metadata as the old ingestion wrote it"""
+    images = [{'url': f"/static/images/{row.document_id}/p{row.id}_{i}.png",
+               'caption': f"Figure {i} on page {row.id}", 'filename': f"p{row.id}_{i}.png"} for i in range(2)]
+    return {
+        'producer_id': row.producer_id,
+        'model_id': row.model_id or 0,
+        'doc_id': row.document_id,
+        'chunk_id': row.id,
+        'text': row.chunk_text,
+        'page': (row.chunk_metadata or {}).get('page') or 0,
+        'source_reference': row.source_reference or '',
+        'doc_name': title,
+        'has_images': True,
+        'images': str(images),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_id', type=int)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        rows = db.session.query(
+            DocumentChunk.id, DocumentChunk.vector_id, DocumentChunk.document_id, DocumentChunk.producer_id,
+            DocumentChunk.model_id, DocumentChunk.embedding_vec, DocumentChunk.chunk_text,
+            DocumentChunk.chunk_metadata, DocumentChunk.source_reference, Document.title
+        ).join(Document, DocumentChunk.document_id == Document.id).filter(
+            DocumentChunk.producer_id == args.producer_id, DocumentChunk.embedding_vec.isnot(None)
+        ).all()
+        if not rows:
+            sys.exit(f"No embedded chunks for producer {args.producer_id}")
+        dim = len(rows[0].embedding_vec) // 4
+
+        full, slim = LocalPineconeIndex(), LocalPineconeIndex()
+        full.upsert([{'id': row.vector_id, 'values': np.frombuffer(row.embedding_vec, dtype='<f4'),
+                      'metadata': full_metadata(row, row.title)} for row in rows])
+        store = PineconeVectorStore(index=slim)
+        store.upsert(args.producer_id, None, [{
+            'id': row.id, 'vector_id': row.vector_id, 'document_id': row.document_id,
+            'vector': np.frombuffer(row.embedding_vec, dtype='<f4'),
+        } for row in rows])
+        # The stand-in filters on model_id like Pinecone; chunks keep theirs
+        for metadata, row in zip(slim.metadata, rows):
+            if row.model_id:
+                metadata['model_id'] = row.model_id
+
+        rng = np.random.default_rng(0)
+        queries = rng.standard_normal((args.queries, dim)).astype(np.float32)
+        print(f"📊 producer={args.producer_id}: {len(rows)} vectors x {dim}, top_k={args.top_k}")
+
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            results = full.query(vector=q.tolist(), namespace='bench', filter={'producer_id': args.producer_id},
+                                 top_k=args.top_k, include_metadata=True)
+            for match in results.matches:
+                json.dumps(match.metadata)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"  full metadata : {np.mean(full.response_bytes) / 1e3:7.1f} KB/response, "
+              f"{np.median(latencies):6.2f} ms/query (p95 {np.percentile(latencies, 95):.2f})")
+
+        latencies, hydrate = [], []
+        for q in queries:
+            start = time.perf_counter()
+            results = slim.query(vector=q.tolist(), namespace='bench', filter={'producer_id': args.producer_id},
+                                 top_k=args.top_k * store.overfetch, include_metadata=False)
+            middle = time.perf_counter()
+            store.hydrate(args.producer_id, results.matches, {'is_latest': True})[:args.top_k]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hydrate.append((time.perf_counter() - middle) * 1000)
+        print(f"  ids + hydrate : {np.mean(slim.response_bytes) / 1e3:7.1f} KB/response, "
+              f"{np.median(latencies):6.2f} ms/query (p95 {np.percentile(latencies, 95):.2f}, "
+              f"hydration {np.median(hydrate):.2f})")
+        stored_full = sum(len(json.dumps(m)) for m in full.metadata)
+        stored_slim = sum(len(json.dumps(m)) for m in slim.metadata)
+        print(f"  stored metadata: {stored_full / 1e6:.2f} MB -> {stored_slim / 1e6:.2f} MB "
+              f"(largest {max(len(json.dumps(m)) for m in full.metadata)} bytes, Pinecone limit 40960)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark: memory per gunicorn-style worker, private index copies vs fork-shared blocks
+
+Forks N workers that each answer queries over one large tenant. In 'private'
+mode every worker builds its own normalized matrix (what a per-worker index
+cache does); in 'shared' mode the parent writes a block with app.rag.preload
+before forking and the workers map it. Reports RSS and PSS (proportional set
+size: shared pages are split between the processes mapping them) per worker.
+
+Usage: python scripts/bench_preload_rss.py [n_vectors] [dim] [workers]
+"""
+import sys
+import os
+import tempfile
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.preload import SharedBlock
+from bench_ann_recall import synthetic_corpus
+
+
+def memory_mb():
+    """(rss, pss) of this process in MB"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return values['Rss'], values['Pss']
+
+
+def worker(get_matrix, queries, write_fd):
+    matrix = get_matrix()
+    for q in queries:
+        np.argpartition(matrix @ q, -5)[-5:]
+    rss, pss = memory_mb()
+    os.write(write_fd, f"{rss} {pss}\n".encode())
+    os._exit(0)
+
+
+def run(mode, n, dim, queries, workers, directory):
+    block = None
+    if mode == 'shared':
+        # The parent loads once before forking and keeps only the block
+        block = SharedBlock.create(directory, 'mgpt_idx_bench_0_0_0', np.arange(n), synthetic_corpus(n, dim))
+        get_matrix = lambda: block.matrix
+    else:
+        # Each worker loads and normalizes its own copy, as after a cache miss
+        get_matrix = lambda: synthetic_corpus(n, dim)
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            worker(get_matrix, queries, write_fd)
+        pids.append(pid)
+    os.close(write_fd)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        stats = np.array([[float(v) for v in line.split()] for line in f])
+    if block is not None:
+        os.remove(block.path)
+    return stats
+
+
+def main(n=200000, dim=1024, workers=4):
+    print(f"📊 {n} x {dim} float32 ({n * dim * 4 / 1e6:.0f} MB), {workers} workers")
+    queries = synthetic_corpus(16, dim, seed=11)
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    for mode in ('private', 'shared'):
+        stats = run(mode, n, dim, queries, workers, directory)
+        print(f"  {mode:<8}: RSS {stats[:, 0].mean():7.0f} MB/worker, "
+              f"PSS {stats[:, 1].mean():7.0f} MB/worker, total PSS {stats[:, 1].sum():7.0f} MB")
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
@@ -0,0 +1,53 @@
+"""Benchmark: memory saved and recall lost by quantized embedding codes
+
+For each mode, scores a clustered synthetic corpus with the compact codes,
+then rescores the top k * rescore_factor candidates at full precision (what
+search_similar does) and compares with exact float32 search.
+
+Usage: python scripts/bench_quantization.py [n_vectors] [dim] [k] [rescore_factor]
+"""
+import sys
+import os
+import time
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.quantization import quantize
+from bench_ann_recall import synthetic_corpus
+
+
+def top_k(scores, k):
+    candidates = np.argpartition(scores, -k)[-k:]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def main(n=50000, dim=1024, k=10, rescore_factor=10, n_queries=100):
+    matrix = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(n_queries, dim, seed=11)
+    truth = [set(top_k(matrix @ q, k).tolist()) for q in queries]
+
+    print(f"📊 {n} vectors x {dim} dims, recall@{k}, rescoring top {k * rescore_factor}")
+    print(f"  float32 : {matrix.nbytes / 1e6:8.1f} MB")
+
+    for mode in ('float16', 'int8', 'binary'):
+        codes = quantize(matrix, mode)
+        raw_hits = rescored_hits = 0
+        latencies = []
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            approx = codes.score(q)
+            candidates = top_k(approx, k * rescore_factor)
+            exact = matrix[candidates] @ q
+            winners = candidates[top_k(exact, k)]
+            latencies.append((time.perf_counter() - start) * 1000)
+            raw_hits += len(expected & set(top_k(approx, k).tolist()))
+            rescored_hits += len(expected & set(winners.tolist()))
+        total = k * n_queries
+        print(f"  {mode:<8}: {codes.nbytes / 1e6:8.1f} MB (x{matrix.nbytes / codes.nbytes:4.1f} smaller), "
+              f"recall codes-only {raw_hits / total:.3f}, rescored {rescored_hits / total:.3f}, "
+              f"{np.median(latencies):.2f} ms/query")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:5]]
+    main(*args)
@@ -0,0 +1,78 @@
+"""Benchmark: p50/p95 query latency under concurrent load, in-thread vs sharded scoring
+
+Simulates a threaded gunicorn worker: N client threads fire queries at one
+large tenant. In-thread scoring runs matrix @ q in each request thread;
+sharded scoring hands row ranges to a pool of worker processes over shared
+memory (app.rag.sharding).
+
+Usage: python scripts/bench_sharded_search.py [n_vectors] [dim] [threads] [workers]
+"""
+import sys
+import os
+import time
+import threading
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rag.index_cache import TenantIndex
+from app.rag.sharding import ShardedScorer
+from app.rag.vector_db import top_k_indices
+from bench_ann_recall import synthetic_corpus
+
+
+def run_load(search, queries, threads, per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        local = []
+        for i in range(per_thread):
+            q = queries[(offset + i) % len(queries)]
+            start = time.perf_counter()
+            search(q)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(t * per_thread,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return np.array(latencies), len(latencies) / elapsed
+
+
+def main(n=200000, dim=1024, threads=8, workers=0, k=5, per_thread=20):
+    workers = workers or os.cpu_count() or 1
+    print(f"📊 {n} x {dim} float32 ({n * dim * 4 / 1e6:.0f} MB), {threads} client threads, {workers} scoring processes")
+    matrix = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(64, dim, seed=11)
+    index = TenantIndex(1, None, np.arange(n, dtype=np.int64), matrix, (n, n))
+
+    scorer = ShardedScorer(workers)
+    # Warm up: start processes, create the shared segment, attach in every worker
+    for q in queries[:workers * 2]:
+        scorer.top_k(index, q, k)
+
+    for q in queries[:8]:
+        expected = top_k_indices(matrix @ q, k)
+        positions, _ = scorer.top_k(index, q, k)
+        assert np.array_equal(positions, expected), "sharded results differ from exact search"
+
+    modes = {
+        'in-thread': lambda q: top_k_indices(matrix @ q, k),
+        'sharded': lambda q: scorer.top_k(index, q, k),
+    }
+    for name, search in modes.items():
+        latencies, qps = run_load(search, queries, threads, per_thread)
+        print(f"  {name:<10}: p50 {np.percentile(latencies, 50):8.2f} ms, "
+              f"p95 {np.percentile(latencies, 95):8.2f} ms, {qps:7.1f} queries/s")
+
+    scorer.shutdown()
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:5]]
+    main(*args)
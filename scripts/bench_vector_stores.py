@@ -0,0 +1,53 @@
+"""Benchmark: query latency of the vector store backends against each other
+
+Runs the same random queries through each VectorStore backend for one
+producer. The local backend seeds itself from document_chunks, so all
+backends see the same corpus (Pinecone must have been fed by ingestion).
+
+Usage: python scripts/bench_vector_stores.py <producer_id> [backend ...] [--queries N]
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.rag.vector_store import get_vector_store, BACKENDS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_id', type=int)
+    parser.add_argument('backends', nargs='*', default=['postgres', 'local'])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    app = create_app()
+    with app.app_context():
+        for backend in args.backends:
+            if backend not in BACKENDS:
+                print(f"⚠️  Unknown backend {backend}, skipping")
+                continue
+            store = get_vector_store(backend)
+            # Warm up: builds caches / seeds the local store
+            store.query(queries[0], args.producer_id, top_k=args.top_k)
+
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                store.query(q, args.producer_id, top_k=args.top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            print(f"📊 {backend:<9}: p50 {np.percentile(latencies, 50):7.2f} ms, "
+                  f"p95 {np.percentile(latencies, 95):7.2f} ms, {store.stats(args.producer_id)}")
+
+
+if __name__ == '__main__':
+    main()
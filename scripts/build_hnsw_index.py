@@ -0,0 +1,43 @@
+"""Build a tenant's HNSW graph offline
+
+Loads the producer-wide embedding index like a query would (models are
+applied as row masks on one graph, so there is no per-model build) and
+writes the graph to VECTOR_INDEX_DIR, where every worker picks it up on its next query (with
+HNSW_ENABLED). Takes the same cross-process lock as the in-app builder, so it
+never duplicates a build that is already running.
+
+Usage: python scripts/build_hnsw_index.py <producer_id>
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.rag.index_cache import index_cache
+from app.rag.hnsw import build_index_file, index_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_id', type=int)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        config = app.config
+        index = index_cache.get(args.producer_id)
+        if index.matrix is None or not len(index):
+            sys.exit(f"No full-precision vectors for producer {args.producer_id}")
+        path = index_path(config['VECTOR_INDEX_DIR'], args.producer_id, None)
+        print(f"🕸️  Building HNSW index: producer={args.producer_id}, {len(index)} vectors")
+        start = time.perf_counter()
+        if not build_index_file(path, index.matrix, index.ids, index.signature,
+                                M=config['HNSW_M'], ef_construction=config['HNSW_EF_CONSTRUCTION']):
+            sys.exit(f"Another process is building {path}")
+        print(f"✅ HNSW index saved: {path} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Check: search filters give the same results on every in-process backend
+
+Seeds a throwaway SQLite database with one producer, two machine models and
+documents that differ in doc_type, language, model and version (a superseded
+copy with is_latest=False), then runs the same queries through the postgres
+and local VectorStore backends - default filters, scalar and list values,
+query() and query_batch() - and compares the chunk ids. Exits non-zero on
+the first difference.
+
+Usage: python scripts/check_vector_store_filters.py
+"""
+import sys
+import os
+import tempfile
+import numpy as np
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'check_filters.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import Producer, MachineModel, Document, DocumentChunk
+from app.rag.vector_store import PostgresVectorStore, LocalVectorStore
+
+DIM = 32
+CHUNKS_PER_DOCUMENT = 40
+
+DOCUMENTS = [
+    # (model, doc_type, language, is_latest)
+    (0, 'manual', 'en', True),
+    (0, 'manual', 'en', False),
+    (0, 'bulletin', 'de', True),
+    (1, 'manual', 'en', True),
+    (1, 'manual', 'de', None),
+]
+
+
+def seed(rng):
+    producer = Producer(company_name='Filter check', slug='filter-check')
+    db.session.add(producer)
+    db.session.flush()
+    models = [MachineModel(producer_id=producer.id, model_name=name, model_code=name) for name in ('A', 'B')]
+    db.session.add_all(models)
+    db.session.flush()
+    documents = []
+    for i, (model, doc_type, language, is_latest) in enumerate(DOCUMENTS):
+        document = Document(
+            producer_id=producer.id, model_id=models[model].id, title=f"doc {i}", doc_type=doc_type,
+            language=language, is_latest=is_latest, file_type='pdf', file_hash=f"h{i}",
+            file_path=f"doc{i}.pdf", source_type='manual_upload'
+        )
+        db.session.add(document)
+        db.session.flush()
+        documents.append(document)
+        for c in range(CHUNKS_PER_DOCUMENT):
+            chunk = DocumentChunk(
+                document_id=document.id, producer_id=producer.id, model_id=document.model_id,
+                chunk_index=c, chunk_text=f"document {i} chunk {c}", vector_id=f"d{i}_{c}",
+                chunk_metadata={'page': c}, source_reference=f"Page {c}"
+            )
+            chunk.set_embedding(rng.standard_normal(DIM).astype(np.float32))
+            db.session.add(chunk)
+    db.session.commit()
+    return producer.id, [m.id for m in models], [d.id for d in documents]
+
+
+def main():
+    app = create_app()
+    app.config.update(RESULT_CACHE_ENABLED=False, GENERATION_LISTENER_ENABLED=False)
+    rng = np.random.default_rng(0)
+    with app.app_context():
+        db.create_all()
+        producer_id, model_ids, doc_ids = seed(rng)
+        stores = [PostgresVectorStore(), LocalVectorStore()]
+        queries = rng.standard_normal((4, DIM)).astype(np.float32)
+        cases = [
+            ('defaults', None, {}),
+            ('model', model_ids[0], {}),
+            ('all versions', None, {'is_latest': None}),
+            ('superseded only', None, {'is_latest': False}),
+            ('doc_type', None, {'doc_type': 'manual'}),
+            ('language list', None, {'language': ['de']}),
+            ('document list', None, {'document_id': [doc_ids[0], doc_ids[1], doc_ids[3]]}),
+            ('document + model', model_ids[1], {'document_id': doc_ids[3], 'is_latest': None}),
+        ]
+
+        failures = 0
+        for label, model_id, filters in cases:
+            results = {}
+            for store in stores:
+                single = [[c['chunk_id'] for c in store.query(q, producer_id, model_id=model_id, top_k=10,
+                                                              filters=filters)] for q in queries]
+                batch = [[c['chunk_id'] for c in chunks] for chunks in store.query_batch(
+                    queries, producer_id, model_id=model_id, top_k=10, filters=filters)]
+                if single != batch:
+                    print(f"  ❌ {label}: {store.name} query() and query_batch() differ")
+                    failures += 1
+                results[store.name] = single
+            if results['postgres'] != results['local']:
+                print(f"  ❌ {label}: postgres {results['postgres'][0]} != local {results['local'][0]}")
+                failures += 1
+            else:
+                print(f"  ✅ {label}: {sum(map(len, results['postgres']))} results")
+
+        superseded = {chunk_id for chunk_id, in db.session.query(DocumentChunk.id).filter(
+            DocumentChunk.document_id == doc_ids[1])}
+        for store in stores:
+            hits = {c['chunk_id'] for q in queries for c in store.query(q, producer_id, top_k=50)}
+            if hits & superseded:
+                print(f"  ❌ {store.name} returned chunks of a superseded document version")
+                failures += 1
+
+    os.remove(DB_PATH)
+    if failures:
+        sys.exit(f"{failures} filter check(s) failed")
+    print("📊 All backends agree")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Provision the pgvector backend on an already migrated database
+
+Migration e2c4a7b91f36 only creates document_chunks.embedding_pgv and its
+HNSW index when VECTOR_BACKEND is pgvector at upgrade time. A deployment
+switching to pgvector later runs this once (before changing VECTOR_BACKEND):
+it applies the same idempotent steps - extension, column, backfill from
+embedding_vec, HNSW index - without touching the migration history.
+
+Usage: python scripts/enable_pgvector.py
+"""
+import sys
+import os
+import importlib.util
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from app import create_app, db
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'versions',
+                         'e2c4a7b91f36_pgvector_embeddings.py')
+
+
+def main():
+    spec = importlib.util.spec_from_file_location('pgvector_migration', MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit("The pgvector backend needs PostgreSQL")
+        with db.engine.connect() as conn:
+            context = MigrationContext.configure(conn)
+            with Operations.context(context):
+                migration.provision()
+            conn.commit()
+        print("✅ pgvector provisioned; set VECTOR_BACKEND=pgvector to use it")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""EXPLAIN ANALYZE: tenant filter through documents vs denormalized chunk columns
+
+Runs the vector load query of one tenant (id + embedding_vec, as
+_load_vectors issues it) and a plain count in two forms against the app's
+PostgreSQL database:
+  - join    : JOIN documents, filter documents.producer_id / model_id (and the
+              old RLS policy's EXISTS probe per row)
+  - column  : filter document_chunks.producer_id / model_id (idx_chunks_tenant,
+              and the new RLS policy's direct comparison)
+The RLS predicates are inlined so the plans are comparable even when
+connected as the table owner (which bypasses RLS). With --role, the count is
+also run under SET ROLE with app.current_producer_id set, i.e. through the
+installed policy.
+
+Usage: python scripts/explain_chunk_tenant_filter.py <producer_id> [--model-id M] [--role app_user]
+"""
+import sys
+import os
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from app import create_app, db
+
+QUERIES = {
+    'load, join': """
+        SELECT c.id, c.embedding_vec FROM document_chunks c
+        JOIN documents d ON c.document_id = d.id
+        WHERE d.producer_id = :producer_id {doc_model} AND c.embedding_vec IS NOT NULL
+        ORDER BY c.id
+    """,
+    'load, column': """
+        SELECT c.id, c.embedding_vec FROM document_chunks c
+        WHERE c.producer_id = :producer_id {chunk_model} AND c.embedding_vec IS NOT NULL
+        ORDER BY c.id
+    """,
+    'rls, parent probe': """
+        SELECT count(*) FROM document_chunks c
+        WHERE EXISTS (SELECT 1 FROM documents d WHERE d.id = c.document_id AND d.producer_id = :producer_id)
+    """,
+    'rls, column': """
+        SELECT count(*) FROM document_chunks c WHERE c.producer_id = :producer_id
+    """,
+}
+
+
+def explain(sql, params):
+    rows = db.session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params).all()
+    return [row[0] for row in rows]
+
+
+def summary(plan):
+    timing = [line.strip() for line in plan if line.strip().startswith(('Planning Time', 'Execution Time'))]
+    return ', '.join(timing)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_id', type=int)
+    parser.add_argument('--model-id', type=int)
+    parser.add_argument('--role', help='non-owner role the RLS policy applies to')
+    parser.add_argument('--verbose', action='store_true', help='print full plans')
+    args = parser.parse_args()
+
+    params = {'producer_id': args.producer_id, 'model_id': args.model_id}
+    doc_model = 'AND d.model_id = :model_id' if args.model_id else ''
+    chunk_model = 'AND c.model_id = :model_id' if args.model_id else ''
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit("EXPLAIN ANALYZE comparison needs PostgreSQL")
+        chunks = db.session.execute(
+            text("SELECT count(*) FROM document_chunks WHERE producer_id = :producer_id"), params
+        ).scalar()
+        print(f"📊 producer={args.producer_id} model={args.model_id}: {chunks} chunks")
+
+        for label, sql in QUERIES.items():
+            # First run warms the buffer cache; report the second
+            explain(sql.format(doc_model=doc_model, chunk_model=chunk_model), params)
+            plan = explain(sql.format(doc_model=doc_model, chunk_model=chunk_model), params)
+            print(f"  {label:<18}: {summary(plan)}")
+            if args.verbose:
+                print('\n'.join(f"      {line}" for line in plan))
+
+        if args.role:
+            db.session.execute(text("SELECT set_config('app.current_producer_id', :id, true)"),
+                               {'id': str(args.producer_id)})
+            db.session.execute(text(f'SET LOCAL ROLE "{args.role}"'))
+            plan = explain("SELECT count(*) FROM document_chunks", {})
+            print(f"  {'installed policy':<18}: {summary(plan)}")
+            if args.verbose:
+                print('\n'.join(f"      {line}" for line in plan))
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
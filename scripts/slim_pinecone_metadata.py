@@ -0,0 +1,83 @@
+"""Rewrite a producer's Pinecone vectors with ids-only metadata
+
+Older vectors carry the chunk text, page and a stringified images list in
+their metadata. For every chunk of the producer this fetches its vector,
+moves any images into document_chunks.chunk_metadata (where queries now
+hydrate them from) and upserts the same values with only producer_id,
+model_id, doc_id and chunk_id as metadata.
+
+Usage: python scripts/slim_pinecone_metadata.py <producer_id> [--dry-run]
+"""
+import sys
+import os
+import ast
+import argparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models.document import DocumentChunk
+from app.rag.vector_store import get_vector_store
+
+BATCH_SIZE = 100
+
+
+def legacy_images(metadata):
+    images = metadata.get('images')
+    if isinstance(images, str):
+        try:
+            images = ast.literal_eval(images)
+        except (ValueError, SyntaxError):
+            return []
+    return images if isinstance(images, list) else []
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('producer_id', type=int)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        store = get_vector_store('pinecone')
+        namespace = store._namespace(args.producer_id)
+        chunks = DocumentChunk.query.options(db.undefer_group('text')).filter(
+            DocumentChunk.producer_id == args.producer_id
+        ).order_by(DocumentChunk.id).all()
+
+        before = after = rewritten = moved = 0
+        for start in range(0, len(chunks), BATCH_SIZE):
+            batch = {chunk.vector_id: chunk for chunk in chunks[start:start + BATCH_SIZE]}
+            fetched = store.index.fetch(ids=list(batch), namespace=namespace).vectors
+            vectors = []
+            for vector_id, vector in fetched.items():
+                chunk = batch[vector_id]
+                metadata = dict(vector.metadata or {})
+                images = legacy_images(metadata)
+                if images and not (chunk.chunk_metadata or {}).get('images'):
+                    chunk.chunk_metadata = {**(chunk.chunk_metadata or {}), 'images': images}
+                    moved += 1
+                slim = store._metadata(args.producer_id, chunk.model_id,
+                                       {'id': chunk.id, 'document_id': chunk.document_id})
+                before += len(repr(metadata))
+                after += len(repr(slim))
+                if metadata != slim:
+                    vectors.append({'id': vector_id, 'values': list(vector.values), 'metadata': slim})
+            if args.dry_run:
+                rewritten += len(vectors)
+                continue
+            # Images must be in Postgres before the vectors lose them
+            db.session.commit()
+            if vectors:
+                store.index.upsert(vectors=vectors, namespace=namespace)
+                rewritten += len(vectors)
+            print(f"  {min(start + BATCH_SIZE, len(chunks))}/{len(chunks)} chunks, {rewritten} vectors rewritten")
+
+        if args.dry_run:
+            db.session.rollback()
+        print(f"📊 producer={args.producer_id}: {rewritten} vectors {'to rewrite' if args.dry_run else 'rewritten'}, "
+              f"{moved} image lists moved to Postgres, metadata {before / 1e3:.1f} KB -> {after / 1e3:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()